@@ -0,0 +1,5 @@
+"""Offline load tests for the Ledgerly API.
+
+Run ``python -m benchmarks.run --help``; see benchmarks/run.py. Worker boot
+time is measured separately by ``python -m benchmarks.startup``.
+"""
@@ -0,0 +1,71 @@
+"""Compare two benchmark result files from benchmarks/run.py.
+
+    python -m benchmarks.compare baseline.json candidate.json --threshold 0.15
+
+Prints the change in throughput and latency per route and concurrency level
+and exits with status 1 when any p95 grew by more than the threshold (a
+fraction), so it can gate a deploy.
+"""
+import argparse
+import json
+import sys
+
+
+def _load(path):
+    with open(path) as f:
+        report = json.load(f)
+    return {(r['route'], r['concurrency']): r for r in report['results']}, report['meta']
+
+
+def _change(old, new):
+    if not old or new is None:
+        return None
+    return (new - old) / old
+
+
+def compare(baseline, candidate, threshold):
+    """Rows of per-metric changes plus the (route, concurrency) keys that regressed."""
+    rows, regressions = [], []
+    for key in sorted(baseline.keys() & candidate.keys()):
+        old, new = baseline[key], candidate[key]
+        row = {
+            'route': key[0],
+            'concurrency': key[1],
+            'throughput': _change(old['throughput_rps'], new['throughput_rps']),
+            'p50': _change(old['p50_ms'], new['p50_ms']),
+            'p95': _change(old['p95_ms'], new['p95_ms']),
+            'p99': _change(old['p99_ms'], new['p99_ms']),
+            'errors': new['errors'] - old['errors'],
+        }
+        rows.append(row)
+        if row['p95'] is not None and row['p95'] > threshold:
+            regressions.append(key)
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=0.15, help="Allowed p95 growth, as a fraction.")
+    args = parser.parse_args(argv)
+
+    baseline, baseline_meta = _load(args.baseline)
+    candidate, candidate_meta = _load(args.candidate)
+    rows, regressions = compare(baseline, candidate, args.threshold)
+
+    pct = lambda value: '     n/a' if value is None else f'{value * 100:+7.1f}%'
+    print(f"baseline  {baseline_meta.get('commit')} {baseline_meta.get('label') or ''}")
+    print(f"candidate {candidate_meta.get('commit')} {candidate_meta.get('label') or ''}")
+    print(f"{'route':34} {'c':>4} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'errors':>7}")
+    for row in rows:
+        flag = '  <-- regression' if (row['route'], row['concurrency']) in regressions else ''
+        print(
+            f"{row['route']:34} {row['concurrency']:>4} {pct(row['throughput'])} {pct(row['p50'])} "
+            f"{pct(row['p95'])} {pct(row['p99'])} {row['errors']:>+7}{flag}"
+        )
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
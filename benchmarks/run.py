@@ -0,0 +1,266 @@
+"""Offline load driver for every route in ledgerly_app/urls.py.
+
+Starts the Plaid and Supabase stand-ins from benchmarks/stubs.py, points the
+app at them, serves it on a local port (sync routes over WSGI, async routes
+over ASGI with uvicorn) and measures throughput and p50/p95/p99 latency per
+route at each concurrency level. Nothing leaves the machine.
+
+    python -m benchmarks.run --concurrency 1,8,32 --requests 200 --output bench.json
+    python -m benchmarks.compare baseline.json bench.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+import httpx
+import jwt
+
+from .stubs import BENCH_USER_ID, PlaidStub, SupabaseStub
+
+JWT_SECRET = 'benchmark-secret-with-at-least-32-bytes'
+
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def _configure_environment(plaid, supabase, db_path):
+    os.environ.pop('REDIS_URL', None)
+    os.environ.update({
+        'DJANGO_SETTINGS_MODULE': 'benchmarks.settings',
+        'BENCH_DB_PATH': db_path,
+        'PLAID_HOST': plaid.url,
+        'PLAID_CLIENT_ID': 'bench',
+        'PLAID_SECRET': 'bench',
+        'SUPABASE_URL': supabase.url,
+        'SUPABASE_KEY': 'bench-key',
+        'SUPABASE_JWT_SECRET': JWT_SECRET,
+        'SUPABASE_AUTH_MODE': 'local',
+        'WEBHOOK_WORKERS': '0',
+    })
+
+
+def _start_wsgi():
+    from django.core.wsgi import get_wsgi_application
+
+    server = make_server('127.0.0.1', 0, get_wsgi_application(), server_class=_ThreadingWSGIServer, handler_class=_QuietHandler)
+    threading.Thread(target=server.serve_forever, name='bench-wsgi', daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f'http://{host}:{port}'
+
+
+def _start_asgi():
+    """uvicorn serving ledgerly.asgi on a free port, or None if it isn't installed."""
+    try:
+        import uvicorn
+    except ImportError:
+        return None, None
+
+    from ledgerly.asgi import application
+
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(application, host='127.0.0.1', port=port, log_level='warning', lifespan='off'))
+    threading.Thread(target=server.run, name='bench-asgi', daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, f'http://127.0.0.1:{port}'
+
+
+def _token():
+    now = int(time.time())
+    claims = {'sub': BENCH_USER_ID, 'aud': 'authenticated', 'role': 'authenticated', 'email': 'bench@example.com', 'iat': now, 'exp': now + 24 * 3600}
+    return jwt.encode(claims, JWT_SECRET, algorithm='HS256')
+
+
+def _send(client, url, scenario, token, etag=None):
+    headers = {'Authorization': f'Bearer {token}', **scenario.get('headers', {})}
+    if etag:
+        headers['If-None-Match'] = etag
+    start = time.perf_counter()
+    try:
+        response = client.request(
+            scenario['method'], url,
+            params=scenario.get('params'),
+            json=scenario.get('json'),
+            content=scenario.get('content'),
+            headers=headers,
+        )
+        outcome = response.status_code
+        response_etag = response.headers.get('ETag')
+    except httpx.HTTPError as e:
+        outcome = type(e).__name__
+        response_etag = None
+    return time.perf_counter() - start, outcome, response_etag
+
+
+def run_level(client, url, scenario, token, concurrency, total, etag=None):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(lambda _: _send(client, url, scenario, token, etag)[:2], range(total)))
+    wall = time.perf_counter() - started
+
+    outcomes = Counter(str(outcome) for _, outcome in samples)
+    ok = sorted(latency for latency, outcome in samples if isinstance(outcome, int) and outcome < 400)
+    ms = lambda value: None if value is None else round(value * 1000, 3)
+    return {
+        'concurrency': concurrency,
+        'requests': total,
+        'ok': len(ok),
+        'errors': total - len(ok),
+        'status_counts': dict(outcomes),
+        'throughput_rps': round(len(ok) / wall, 2) if wall else None,
+        'p50_ms': ms(percentile(ok, 50)),
+        'p95_ms': ms(percentile(ok, 95)),
+        'p99_ms': ms(percentile(ok, 99)),
+    }
+
+
+def _run_routes(route_names, scenarios, wsgi_url, asgi_url, client, token, levels, total, results, skipped, revalidate=False):
+    from django.urls import reverse
+
+    for name in route_names:
+        scenario = scenarios.get(name)
+        if scenario is None:
+            skipped.append({'route': name, 'reason': 'no scenario in benchmarks/scenarios.py'})
+            continue
+        base_url = asgi_url if scenario.get('asgi') else wsgi_url
+        if base_url is None:
+            skipped.append({'route': name, 'reason': 'uvicorn is not installed'})
+            continue
+
+        url = base_url + reverse(name)
+        _, _, etag = _send(client, url, scenario, token)  # warm caches and first-time syncs
+        # Polling clients send back the ETag they last saw.
+        etag = etag if revalidate and scenario['method'] == 'GET' else None
+        for concurrency in levels:
+            row = {'route': name, 'method': scenario['method'], 'server': 'asgi' if scenario.get('asgi') else 'wsgi'}
+            row.update(run_level(client, url, scenario, token, concurrency, total, etag))
+            results.append(row)
+            print(
+                f"{name:34} c={concurrency:<4} {row['throughput_rps'] or 0:>9.1f} req/s  "
+                f"p50 {row['p50_ms'] or 0:>8.1f}  p95 {row['p95_ms'] or 0:>8.1f}  p99 {row['p99_ms'] or 0:>8.1f} ms  "
+                f"errors {row['errors']}",
+                file=sys.stderr,
+            )
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', default='1,4,16', help="Comma-separated concurrency levels.")
+    parser.add_argument('--requests', type=int, default=100, help="Requests per route per concurrency level.")
+    parser.add_argument('--routes', help="Comma-separated URL names to run (default: all).")
+    parser.add_argument('--plaid-latency-ms', type=float, default=30.0)
+    parser.add_argument('--supabase-latency-ms', type=float, default=10.0)
+    parser.add_argument('--jitter-ms', type=float, default=5.0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of stub responses that fail.")
+    parser.add_argument('--items', type=int, default=2, help="Linked Plaid items for the benchmark user.")
+    parser.add_argument('--transactions', type=int, default=200, help="Transactions per item on first sync.")
+    parser.add_argument('--revalidate', action='store_true', help="Send GETs with If-None-Match set to the ETag of the warm-up response, like a polling client.")
+    parser.add_argument('--label', help="Free-form label stored with the results.")
+    parser.add_argument('--output', help="Write JSON results here (default: stdout).")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    levels = [int(c) for c in args.concurrency.split(',') if c]
+
+    plaid = PlaidStub(
+        transactions_per_item=args.transactions,
+        latency_ms=args.plaid_latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+    ).start()
+    supabase = SupabaseStub(
+        items_per_user=args.items,
+        latency_ms=args.supabase_latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate, seed=1,
+    ).start()
+    workdir = tempfile.TemporaryDirectory(prefix='ledgerly-bench-')
+    _configure_environment(plaid, supabase, os.path.join(workdir.name, 'bench.sqlite3'))
+
+    import django
+    django.setup()
+    from django.core.management import call_command
+    from ledgerly_app import urls as app_urls
+    from .scenarios import SCENARIOS
+
+    call_command('migrate', verbosity=0)
+    wsgi_server, wsgi_url = _start_wsgi()
+    asgi_server, asgi_url = _start_asgi()
+
+    wanted = set(args.routes.split(',')) if args.routes else None
+    route_names = [p.name for p in app_urls.urlpatterns if wanted is None or p.name in wanted]
+    token = _token()
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    client = httpx.Client(timeout=120, limits=limits)
+
+    results, skipped = [], []
+    # The app logs with print(); keep stdout for the JSON report.
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            _run_routes(route_names, SCENARIOS, wsgi_url, asgi_url, client, token, levels, args.requests, results, skipped, args.revalidate)
+        finally:
+            client.close()
+            wsgi_server.shutdown()
+            if asgi_server is not None:
+                asgi_server.should_exit = True
+            plaid.stop()
+            supabase.stop()
+            workdir.cleanup()
+
+    report = {
+        'meta': {
+            'commit': _git_commit(),
+            'label': args.label,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'config': {k: v for k, v in vars(args).items() if k not in ('output', 'label')},
+            'upstream_requests': {'plaid': plaid.requests, 'supabase': supabase.requests},
+        },
+        'results': results,
+        'skipped': skipped,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""One request per URL name in ledgerly_app/urls.py.
+
+Each scenario names the HTTP method and what to send. Requests carry a
+bearer token for the benchmark user, so user_id never needs to be passed.
+Routes without a scenario are reported by the driver, so adding a URL
+without adding it here shows up in the results.
+"""
+import json
+
+from .stubs import BENCH_USER_ID
+
+ITEM_ID = f'item-{BENCH_USER_ID}-0'
+
+_BULK_ROWS = ''.join(
+    json.dumps({'amount': 10 + n, 'description': f'Bench {n}', 'date_posted': '2024-01-02'}) + '\n'
+    for n in range(50)
+)
+
+SCENARIOS = {
+    'health_check': {'method': 'GET'},
+    'metrics': {'method': 'GET'},
+    'test_auth': {'method': 'GET'},
+    'create_link_token': {'method': 'POST', 'json': {}},
+    'exchange_public_token': {'method': 'POST', 'json': {'public_token': 'public-bench', 'institution_id': 'ins_new'}},
+    'check_plaid_status': {'method': 'GET'},
+    'get_accounts': {'method': 'GET'},
+    'get_transactions': {'method': 'GET'},
+    'get_transaction_history': {'method': 'GET', 'params': {'limit': 50}},
+    # The stub's transactions are dated in 2024.
+    'get_spending_analytics': {'method': 'GET', 'params': {'start_date': '2024-01-01', 'end_date': '2024-12-31'}},
+    'plaid-webhook': {
+        'method': 'POST',
+        'json': {'webhook_type': 'TRANSACTIONS', 'webhook_code': 'SYNC_UPDATES_AVAILABLE', 'item_id': ITEM_ID},
+    },
+    'refresh_transactions': {'method': 'POST', 'json': {}},
+    'get_connected_institutions': {'method': 'GET'},
+    'get_credit_score': {'method': 'GET'},
+    'create_sandbox_transaction': {'method': 'POST', 'json': {'amount': 12.5, 'description': 'Bench coffee'}},
+    'create_sandbox_transactions_bulk': {
+        'method': 'POST',
+        'content': _BULK_ROWS,
+        'headers': {'Content-Type': 'application/x-ndjson'},
+    },
+    'get_subscription_payments': {'method': 'GET'},
+    'get_upcoming_payments': {'method': 'GET'},
+    'get_cash_flow_forecast': {'method': 'GET', 'params': {'days': 180, 'skip': f'{ITEM_ID}-stream-0'}},
+    'async_get_accounts': {'method': 'GET', 'asgi': True},
+    'async_get_transactions': {'method': 'GET', 'asgi': True},
+    'async_refresh_transactions': {'method': 'POST', 'json': {}, 'asgi': True},
+    'async_get_subscription_payments': {'method': 'GET', 'asgi': True},
+    'async_get_upcoming_payments': {'method': 'GET', 'asgi': True},
+}
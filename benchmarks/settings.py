@@ -0,0 +1,15 @@
+"""Settings for benchmark runs: the app's settings with a throwaway database."""
+import os
+
+from ledgerly.settings import *  # noqa: F401,F403
+
+DEBUG = False
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.environ["BENCH_DB_PATH"],
+        # Concurrent requests write sync state and webhook jobs.
+        "OPTIONS": {"timeout": 30},
+    }
+}
@@ -0,0 +1,121 @@
+"""Cold-start cost of a worker: importing the app and loading the URLconf.
+
+Each run is a fresh interpreter, the way gunicorn starts (or recycles) a
+worker. It imports ledgerly.wsgi (or ledgerly.asgi) and resolves the URLconf,
+which Django otherwise defers to the first request, under ``-X importtime``.
+Reports the median boot time and the packages and modules that cost most.
+
+    python -m benchmarks.startup --runs 5 --output startup.json
+    python -m benchmarks.startup --budget-ms 600   # exit 1 if the median is over
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from .run import _git_commit
+
+_BOOT = """
+import time
+started = time.perf_counter()
+import {module}
+from django.urls import get_resolver
+get_resolver().url_patterns
+print(time.perf_counter() - started)
+"""
+
+
+def parse_importtime(stderr):
+    """(module, self_us, cumulative_us) rows from ``-X importtime`` output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def boot_once(target):
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'ledgerly.settings'}
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _BOOT.format(module=f'ledgerly.{target}')],
+        capture_output=True, text=True, env=env, check=True,
+    )
+    process_seconds = time.perf_counter() - started
+    return float(proc.stdout.strip().splitlines()[-1]), process_seconds, parse_importtime(proc.stderr)
+
+
+def summarize(runs, top):
+    ms = lambda us: round(us / 1000, 2)
+    module_self = defaultdict(list)
+    for _, _, rows in runs:
+        for name, self_us, cumulative_us in rows:
+            module_self[name].append((self_us, cumulative_us))
+
+    packages = defaultdict(int)
+    modules = []
+    for name, samples in module_self.items():
+        self_us = statistics.median(s for s, _ in samples)
+        cumulative_us = statistics.median(c for _, c in samples)
+        packages[name.split('.')[0]] += self_us
+        modules.append({'module': name, 'self_ms': ms(self_us), 'cumulative_ms': ms(cumulative_us)})
+
+    return {
+        'boot_ms': round(statistics.median(boot for boot, _, _ in runs) * 1000, 2),
+        'process_ms': round(statistics.median(process for _, process, _ in runs) * 1000, 2),
+        'modules_imported': round(statistics.median(len(rows) for _, _, rows in runs)),
+        'packages': [
+            {'package': name, 'self_ms': ms(self_us)}
+            for name, self_us in sorted(packages.items(), key=lambda p: -p[1])[:top]
+        ],
+        'slowest_modules': sorted(modules, key=lambda m: -m['self_ms'])[:top],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help="Fresh interpreters to time.")
+    parser.add_argument('--target', choices=['wsgi', 'asgi'], default='wsgi')
+    parser.add_argument('--top', type=int, default=15, help="Packages and modules to list.")
+    parser.add_argument('--budget-ms', type=float, help="Exit with status 1 if the median boot takes longer.")
+    parser.add_argument('--output', help="Write JSON results here (default: stdout).")
+    args = parser.parse_args(argv)
+
+    runs = [boot_once(args.target) for _ in range(args.runs)]
+    report = {
+        'meta': {
+            'commit': _git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'target': args.target,
+            'runs': args.runs,
+        },
+        **summarize(runs, args.top),
+    }
+    print(
+        f"ledgerly.{args.target}: boot {report['boot_ms']:.1f} ms (median of {args.runs}), "
+        f"process {report['process_ms']:.1f} ms, {report['modules_imported']} modules",
+        file=sys.stderr,
+    )
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    if args.budget_ms is not None and report['boot_ms'] > args.budget_ms:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
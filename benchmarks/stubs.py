@@ -0,0 +1,331 @@
+"""Local HTTP stand-ins for the Plaid and Supabase REST APIs.
+
+Both servers answer just the calls the app makes, with deterministic data
+shaped like the real responses (so plaid-python can deserialize them), and
+can add latency and fail a fraction of requests:
+
+    plaid = PlaidStub(latency_ms=40, jitter_ms=10, error_rate=0.01).start()
+    os.environ['PLAID_HOST'] = plaid.url
+"""
+import json
+import random
+import socket
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+BENCH_USER_ID = 'bench-user'
+
+CATEGORIES = [
+    {'primary': 'GENERAL_MERCHANDISE', 'detailed': 'GENERAL_MERCHANDISE_OTHER'},
+    {'primary': 'FOOD_AND_DRINK', 'detailed': 'FOOD_AND_DRINK_RESTAURANT'},
+    {'primary': 'TRANSPORTATION', 'detailed': 'TRANSPORTATION_TAXIS_AND_RIDE_SHARES'},
+    {'primary': 'ENTERTAINMENT', 'detailed': 'ENTERTAINMENT_TV_AND_MOVIES'},
+    {'primary': 'RENT_AND_UTILITIES', 'detailed': 'RENT_AND_UTILITIES_GAS_AND_ELECTRICITY'},
+]
+
+
+def _json_default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f'Cannot serialize {type(value).__name__}')
+
+
+class _StubServer:
+    """A threaded HTTP server on 127.0.0.1 with latency and error injection."""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self, port=0):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                # Headers and body go out in separate writes; without this,
+                # Nagle's algorithm adds ~40ms per keep-alive response.
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, *args):
+                pass
+
+            def _handle(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                status, payload = stub._dispatch(self.command, self.path, self.headers, body)
+                data = json.dumps(payload, default=_json_default).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PATCH = do_DELETE = _handle
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def _dispatch(self, method, path, headers, body):
+        with self._lock:
+            self.requests += 1
+            delay = self.latency_ms + self.random.uniform(0, self.jitter_ms)
+            fail = self.random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        if delay:
+            time.sleep(delay / 1000)
+        if fail:
+            return self.error_response()
+        return self.handle(method, path, headers, body)
+
+    def error_response(self):
+        return 500, {'error': 'injected failure'}
+
+    def handle(self, method, path, headers, body):
+        raise NotImplementedError
+
+
+class PlaidStub(_StubServer):
+    """The Plaid endpoints Ledgerly calls, for any access token."""
+
+    def __init__(self, transactions_per_item=100, streams_per_item=12, **kwargs):
+        super().__init__(**kwargs)
+        self.transactions_per_item = transactions_per_item
+        self.streams_per_item = streams_per_item
+        self.routes = {
+            '/accounts/get': self.accounts,
+            '/accounts/balance/get': self.accounts,
+            '/transactions/sync': self.transactions_sync,
+            '/transactions/recurring/get': self.recurring,
+            '/transactions/refresh': self.request_only,
+            '/institutions/get_by_id': self.institution,
+            '/item/public_token/exchange': self.exchange,
+            '/link/token/create': self.link_token,
+            '/sandbox/transactions/create': self.request_only,
+        }
+
+    def error_response(self):
+        return 500, {
+            'error_type': 'API_ERROR',
+            'error_code': 'INTERNAL_SERVER_ERROR',
+            'error_message': 'injected failure',
+            'display_message': None,
+            'request_id': 'stub',
+        }
+
+    def handle(self, method, path, headers, body):
+        route = self.routes.get(urlsplit(path).path)
+        if route is None:
+            return 404, {'error_type': 'INVALID_REQUEST', 'error_code': 'NOT_FOUND', 'error_message': path}
+        return 200, {'request_id': 'stub', **route(json.loads(body or b'{}'))}
+
+    @staticmethod
+    def _item_id(request):
+        return request.get('access_token', 'access-stub').replace('access-', 'item-', 1)
+
+    def _accounts(self, item_id):
+        return [
+            {
+                'account_id': f'{item_id}-{kind}',
+                'balances': {
+                    'available': 1000.0 + n,
+                    'current': 1200.0 + n,
+                    'limit': None,
+                    'iso_currency_code': 'USD',
+                    'unofficial_currency_code': None,
+                },
+                'mask': f'{n:04d}',
+                'name': f'Plaid {kind.title()}',
+                'official_name': None,
+                'type': 'depository',
+                'subtype': kind,
+            }
+            for n, kind in enumerate(['checking', 'savings'])
+        ]
+
+    def accounts(self, request):
+        item_id = self._item_id(request)
+        return {
+            'accounts': self._accounts(item_id),
+            'item': {
+                'item_id': item_id,
+                'webhook': None,
+                'error': None,
+                'available_products': [],
+                'billed_products': ['transactions'],
+                'consent_expiration_time': None,
+                'update_type': 'background',
+            },
+        }
+
+    def _transaction(self, item_id, n):
+        day = date(2024, 1, 1) + timedelta(days=n % 365)
+        return {
+            'transaction_id': f'{item_id}-txn-{n}',
+            'account_id': f'{item_id}-checking',
+            'amount': round(5 + (n * 37 % 20000) / 100, 2),
+            'iso_currency_code': 'USD',
+            'unofficial_currency_code': None,
+            'category': None,
+            'category_id': None,
+            'date': day,
+            'authorized_date': day,
+            'authorized_datetime': None,
+            'datetime': None,
+            'location': {
+                'address': None, 'city': None, 'region': None, 'postal_code': None,
+                'country': None, 'lat': None, 'lon': None, 'store_number': None,
+            },
+            'name': f'Merchant {n % 40}',
+            'merchant_name': f'Merchant {n % 40}',
+            'payment_meta': {
+                'by_order_of': None, 'payee': None, 'payer': None, 'payment_method': None,
+                'payment_processor': None, 'ppd_id': None, 'reason': None, 'reference_number': None,
+            },
+            'payment_channel': 'online',
+            'pending': False,
+            'pending_transaction_id': None,
+            'account_owner': None,
+            'transaction_code': None,
+            'personal_finance_category': CATEGORIES[n % len(CATEGORIES)],
+        }
+
+    def transactions_sync(self, request):
+        item_id = self._item_id(request)
+        # Everything on the first call, nothing new afterwards.
+        first = not request.get('cursor')
+        added = [self._transaction(item_id, n) for n in range(self.transactions_per_item)] if first else []
+        return {
+            'transactions_update_status': 'HISTORICAL_UPDATE_COMPLETE',
+            'accounts': self._accounts(item_id),
+            'added': added,
+            'modified': [],
+            'removed': [],
+            'next_cursor': f'{item_id}-cursor-1',
+            'has_more': False,
+        }
+
+    def _stream(self, item_id, n):
+        amount = {'amount': 9.99 + n, 'iso_currency_code': 'USD', 'unofficial_currency_code': None}
+        return {
+            'account_id': f'{item_id}-checking',
+            'stream_id': f'{item_id}-stream-{n}',
+            'category': None,
+            'category_id': None,
+            'description': 'Monthly subscription' if n % 3 == 0 else f'Bill {n}',
+            'merchant_name': f'Service {n}',
+            'first_date': date(2023, 1, 1),
+            'last_date': date(2024, 1, 1) + timedelta(days=n),
+            'predicted_next_date': date(2024, 2, 1) + timedelta(days=n * 3 % 28),
+            'frequency': 'MONTHLY',
+            'transaction_ids': [],
+            'average_amount': amount,
+            'last_amount': amount,
+            'is_active': True,
+            'status': 'MATURE',
+            'is_user_modified': False,
+            'personal_finance_category': {'primary': 'GENERAL_SERVICES', 'detailed': 'GENERAL_SERVICES_OTHER_GENERAL_SERVICES'},
+        }
+
+    def recurring(self, request):
+        item_id = self._item_id(request)
+        return {
+            'inflow_streams': [],
+            'outflow_streams': [self._stream(item_id, n) for n in range(self.streams_per_item)],
+            'updated_datetime': '2024-01-01T00:00:00Z',
+        }
+
+    def institution(self, request):
+        institution_id = request.get('institution_id')
+        return {
+            'institution': {
+                'institution_id': institution_id,
+                'name': f'Bank {institution_id}',
+                'products': ['transactions'],
+                'country_codes': ['US'],
+                'routing_numbers': [],
+                'oauth': False,
+                'connection_availability': 'SUPPORTED',
+            },
+        }
+
+    def exchange(self, request):
+        suffix = request.get('public_token', 'public-stub').replace('public-', '', 1)
+        return {'access_token': f'access-{suffix}', 'item_id': f'item-{suffix}'}
+
+    def link_token(self, request):
+        return {'link_token': 'link-sandbox-stub', 'expiration': '2030-01-01T00:00:00Z'}
+
+    def request_only(self, request):
+        return {}
+
+
+class SupabaseStub(_StubServer):
+    """PostgREST reads and inserts on user_plaid_items, plus Auth health."""
+
+    def __init__(self, items_per_user=2, **kwargs):
+        super().__init__(**kwargs)
+        self.items_per_user = items_per_user
+
+    def _items(self, user_id):
+        return [
+            {
+                'user_id': user_id,
+                'access_token': f'access-{user_id}-{n}',
+                'item_id': f'item-{user_id}-{n}',
+                'institution_id': f'ins_{n}',
+            }
+            for n in range(self.items_per_user)
+        ]
+
+    def handle(self, method, path, headers, body):
+        parts = urlsplit(path)
+        if parts.path == '/auth/v1/health':
+            return 200, {'name': 'GoTrue', 'version': 'stub'}
+        if parts.path != '/rest/v1/user_plaid_items':
+            return 404, {'message': f'no stub for {parts.path}'}
+        if method == 'POST':
+            return 201, []
+
+        query = parse_qs(parts.query)
+        columns = [c.strip() for c in query.get('select', ['*'])[0].split(',')]
+        filters = {k: v[0].split('.', 1)[1] for k, v in query.items() if v[0].startswith('eq.')}
+        if 'user_id' in filters:
+            rows = self._items(filters['user_id'])
+        elif 'item_id' in filters:
+            # Item ids are item-<user_id>-<n>.
+            user_id = filters['item_id'][len('item-'):].rsplit('-', 1)[0]
+            rows = self._items(user_id)
+        else:
+            rows = []
+        rows = [r for r in rows if all(r.get(k) == v for k, v in filters.items())]
+        if columns != ['*']:
+            rows = [{c: r.get(c) for c in columns} for r in rows]
+        return 200, rows
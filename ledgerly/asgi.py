@@ -5,6 +5,11 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
+
+The async endpoints under /api/async/ only avoid blocking a thread when served
+from here, e.g.:
+
+    gunicorn ledgerly.asgi:application -k uvicorn.workers.UvicornWorker
 """
 
 import os
@@ -13,4 +18,27 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ledgerly.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+
+async def _lifespan(receive, send):
+    # Django's handler serves HTTP only; the pooled async Plaid and Supabase
+    # clients are closed here when the server shuts down.
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            from ledgerly_app.plaid_init import aclose_plaid_client
+            from ledgerly_app.supabase_init import aclose_supabase_clients
+            await aclose_plaid_client()
+            await aclose_supabase_clients()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    await django_application(scope, receive, send)
@@ -57,6 +57,10 @@ REST_FRAMEWORK = {
         'ledgerly_app.authentication.SupabaseAuthentication',
     ],
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_RENDERER_CLASSES': [
+        'ledgerly_app.renderers.TimedJSONRenderer',
+        'ledgerly_app.renderers.TimedBrowsableAPIRenderer',
+    ],
 }
 
 SPECTACULAR_SETTINGS = {
@@ -69,6 +73,10 @@ SPECTACULAR_SETTINGS = {
 }
 
 MIDDLEWARE = [
+    # First, so Server-Timing and the request metrics cover the whole stack.
+    "ledgerly_app.instrumentation.ServerTimingMiddleware",
+    # Before anything that reads or rewrites the response body.
+    "ledgerly_app.compression.CompressionMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -115,6 +123,36 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+# Per-process memory by default; set REDIS_URL to share cached Plaid data
+# (recurring streams, etc.) across workers.
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "ledgerly",
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    }
+}
+
+if os.environ.get("REDIS_URL"):
+    CACHES["default"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ["REDIS_URL"],
+    }
+
+# Subscription classifier rules (see ledgerly_app/subscriptions.py). A JSON
+# file named by SUBSCRIPTION_RULES_FILE is layered on top of these.
+
+SUBSCRIPTION_RULES = {
+    "keywords": ["SUBSCRIPTION", "SUBSCRIBE"],
+    "categories": [],
+    "allow_merchants": [],
+    "deny_merchants": [],
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -153,6 +191,10 @@ STATIC_URL = "static/"
 STATIC_ROOT = BASE_DIR / "staticfiles"
 STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 
+# Prebuilt OpenAPI schema served at /api/schema/; written by
+# `manage.py build_openapi_schema` during the deploy, next to collectstatic.
+OPENAPI_SCHEMA_FILE = os.getenv("OPENAPI_SCHEMA_FILE", str(BASE_DIR / "openapi.json"))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
@@ -1,3 +1,29 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import PlaidAccount, PlaidItemSyncState, PlaidTransaction, WebhookJob
+
+
+@admin.register(PlaidItemSyncState)
+class PlaidItemSyncStateAdmin(admin.ModelAdmin):
+    list_display = ('item_id', 'user_id', 'last_synced_at')
+    search_fields = ('item_id', 'user_id')
+
+
+@admin.register(PlaidAccount)
+class PlaidAccountAdmin(admin.ModelAdmin):
+    list_display = ('account_id', 'name', 'type', 'user_id', 'current_balance')
+    search_fields = ('account_id', 'user_id', 'name')
+
+
+@admin.register(PlaidTransaction)
+class PlaidTransactionAdmin(admin.ModelAdmin):
+    list_display = ('transaction_id', 'date', 'name', 'amount', 'user_id')
+    search_fields = ('transaction_id', 'user_id', 'name', 'merchant_name')
+    list_filter = ('pending',)
+
+
+@admin.register(WebhookJob)
+class WebhookJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'item_id', 'status', 'attempts', 'coalesced_count', 'run_after')
+    search_fields = ('item_id',)
+    list_filter = ('status', 'kind')
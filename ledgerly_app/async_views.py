@@ -0,0 +1,264 @@
+"""Async versions of the I/O-bound endpoints, for serving under ASGI.
+
+They do the same work as their DRF counterparts in views.py, but wait on
+Supabase and Plaid without holding a thread: upstream calls go through the
+async clients in supabase_init/plaid_init and per-item calls inside one
+request run concurrently with asyncio.gather.
+"""
+import asyncio
+import json
+from datetime import date
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+
+from .authentication import aauthenticate
+from .plaid_init import get_async_plaid_client, get_plaid_client
+from .supabase_init import get_async_supabase_client
+from . import balance_cache, conditional, item_directory, multi_item, recurring_cache, resilience, subscriptions, sync_engine, transactions_store, upcoming_index
+
+
+def async_api_view(methods):
+    """Async stand-in for DRF's @api_view: method check, Supabase auth and
+    the same user_id fallback (query params for GET, JSON body otherwise)."""
+    def decorator(view):
+        @csrf_exempt
+        @wraps(view)
+        async def wrapper(request):
+            if request.method not in methods:
+                return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+
+            try:
+                user = await aauthenticate(request.headers.get('Authorization'))
+            except exceptions.AuthenticationFailed as e:
+                return JsonResponse({'detail': str(e.detail)}, status=403)
+
+            if user is not None:
+                user_id = user.username
+            elif request.method == 'GET':
+                user_id = request.GET.get('user_id')
+            else:
+                try:
+                    user_id = json.loads(request.body or b'{}').get('user_id')
+                except ValueError:
+                    user_id = None
+
+            if not user_id:
+                return JsonResponse(
+                    {'error': 'User ID is required. Please authenticate or provide "user_id".'},
+                    status=400,
+                )
+
+            try:
+                return await view(request, user_id)
+            except Exception as e:
+                # As views._error_response: 503 with Retry-After for upstream outages.
+                retry_after = resilience.retry_after(e)
+                if retry_after is None:
+                    return JsonResponse({'error': str(e)}, status=400)
+                return JsonResponse({'error': str(e)}, status=503, headers={'Retry-After': str(retry_after)})
+        return wrapper
+    return decorator
+
+
+async def _user_items(user_id):
+    return await item_directory.aget_user_items(user_id, await get_async_supabase_client())
+
+
+def _no_items():
+    return JsonResponse({'error': 'No Plaid access token found for user'}, status=404)
+
+
+def _all_failed(errors):
+    return JsonResponse({'error': 'All Plaid items failed', 'errors': errors}, status=502)
+
+
+async def _fetch_recurring_streams(items):
+    client = get_async_plaid_client()
+    return await multi_item.afan_out(
+        items,
+        lambda item: recurring_cache.aget_recurring_streams(item['item_id'], item['access_token'], client),
+    )
+
+
+def _merge_streams(results):
+    inflow_streams, outflow_streams = [], []
+    for item, streams in results:
+        inflow_streams.extend(multi_item.tag_rows(item, streams['inflow_streams']))
+        outflow_streams.extend(multi_item.tag_rows(item, streams['outflow_streams']))
+    return inflow_streams, outflow_streams
+
+
+def _list_response(rows, errors):
+    response = JsonResponse(rows, safe=False)
+    if errors:
+        response['X-Failed-Items'] = ','.join(e['item_id'] or '' for e in errors)
+    return response
+
+
+@async_api_view(['GET'])
+async def get_account_balance(request, user_id):
+    items = await _user_items(user_id)
+    if not items:
+        return _no_items()
+
+    max_age = int(request.GET.get('max_age') or balance_cache.default_max_age())
+    realtime = request.GET.get('realtime', 'true').lower() not in ('false', '0', 'no')
+
+    client = get_async_plaid_client()
+    results, errors = await multi_item.afan_out(
+        items,
+        lambda item: balance_cache.aget_balances(item['item_id'], item['access_token'], client, max_age, realtime),
+    )
+    if errors and not results:
+        return _all_failed(errors)
+
+    etag = None if errors else conditional.balance_etag(user_id, results)
+    not_modified = conditional.not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
+
+    accounts = []
+    item_rows = []
+    for item, snapshot in results:
+        accounts.extend(multi_item.tag_rows(item, snapshot['accounts']))
+        item_rows.append({**multi_item.item_tag(item), **balance_cache.age_fields(snapshot)})
+
+    return conditional.tag(JsonResponse({
+        'accounts': accounts,
+        'items': item_rows,
+        'age_seconds': max(row['age_seconds'] for row in item_rows),
+        'errors': errors,
+    }), etag)
+
+
+@async_api_view(['GET'])
+async def get_subscription_payments(request, user_id):
+    items = await _user_items(user_id)
+    if not items:
+        return _no_items()
+
+    results, errors = await _fetch_recurring_streams(items)
+    if errors and not results:
+        return _all_failed(errors)
+
+    classifier = subscriptions.get_classifier()
+    etag = None if errors else conditional.recurring_etag('subscriptions', user_id, results, classifier.version)
+    not_modified = conditional.not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
+
+    _, outflow_streams = _merge_streams(results)
+    return conditional.tag(_list_response(classifier.select(outflow_streams), errors), etag)
+
+
+@async_api_view(['GET'])
+async def get_upcoming_payments(request, user_id):
+    items = await _user_items(user_id)
+    if not items:
+        return _no_items()
+
+    start = date.fromisoformat(request.GET['from']) if request.GET.get('from') else None
+    end = date.fromisoformat(request.GET['to']) if request.GET.get('to') else None
+    limit = int(request.GET['limit']) if request.GET.get('limit') else None
+
+    results, errors = await _fetch_recurring_streams(items)
+    if errors and not results:
+        return _all_failed(errors)
+
+    etag = None if errors else conditional.recurring_etag('upcoming', user_id, results, start, end, limit)
+    not_modified = conditional.not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
+
+    upcoming = upcoming_index.query(
+        [(item, upcoming_index.for_streams(streams)) for item, streams in results],
+        start, end, limit,
+    )
+    return conditional.tag(_list_response(upcoming, errors), etag)
+
+
+@async_api_view(['POST'])
+async def refresh_transactions(request, user_id):
+    items = await _user_items(user_id)
+    if not items:
+        return _no_items()
+
+    client = get_async_plaid_client()
+    results, errors = await multi_item.afan_out(items, lambda item: client.transactions_refresh(item['access_token']))
+    if errors and not results:
+        return _all_failed(errors)
+
+    return JsonResponse({
+        'items': [{**multi_item.item_tag(item), **refresh} for item, refresh in results],
+        'errors': errors,
+    })
+
+
+def _in_worker(fn):
+    """``fn`` as a coroutine on a thread of its own, off the shared thread-sensitive executor.
+
+    Each thread holds its own database connection, so a long sync here does
+    not queue every other ORM call in the process behind it. Stale
+    connections are closed on the way out, as Django does per request.
+    """
+    def run(*args):
+        try:
+            return fn(*args)
+        finally:
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False)
+
+
+def _read(user_id):
+    """Stored accounts and transactions for get_transactions; runs in a worker thread."""
+    accounts = [
+        {
+            'account_id': a.account_id,
+            'item_id': a.item_id,
+            'name': a.name,
+            'mask': a.mask,
+            'type': a.type,
+            'subtype': a.subtype,
+        }
+        for a in transactions_store.get_user_accounts(user_id)
+    ]
+    added = list(transactions_store.get_user_transactions(user_id).values_list('data', flat=True))
+    return accounts, added
+
+
+@async_api_view(['GET'])
+async def get_transactions(request, user_id):
+    items = await _user_items(user_id)
+    if not items:
+        return _no_items()
+
+    # Sync cursors and recurring streams are independent; fetch both at once.
+    (cursors, sync_errors), (recurring_results, errors) = await asyncio.gather(
+        _in_worker(sync_engine.bootstrap)(user_id, items, get_plaid_client()),
+        _fetch_recurring_streams(items),
+    )
+
+    etag = None if sync_errors or errors else conditional.transactions_etag(user_id, cursors, recurring_results)
+    not_modified = conditional.not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
+
+    accounts, added = await _in_worker(_read)(user_id)
+    inflow_streams, outflow_streams = _merge_streams(recurring_results)
+    return conditional.tag(JsonResponse({
+        'accounts': accounts,
+        'added': added,
+        'modified': [],
+        'removed': [],
+        'next_cursor': cursors[items[0]['item_id']],
+        'next_cursors': cursors,
+        'has_more': False,
+        'inflow_streams': inflow_streams,
+        'outflow_streams': outflow_streams,
+        'errors': sync_errors + errors,
+    }), etag)
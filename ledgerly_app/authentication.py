@@ -1,40 +1,243 @@
-
+import asyncio
 import os
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+import jwt
 from rest_framework import authentication
 from rest_framework import exceptions
-from supabase import create_client, Client
 from django.contrib.auth.models import User
 
+from .supabase_init import get_async_supabase_client, get_supabase_client
+from . import instrumentation
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+
+class VerifiedTokenCache:
+    """Bounded LRU of verified token claims, each kept until the token expires."""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            claims, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return claims
+
+    def set(self, token, claims, expires_at):
+        with self._lock:
+            self._entries[token] = (claims, expires_at)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = VerifiedTokenCache(maxsize=int(os.environ.get('SUPABASE_TOKEN_CACHE_SIZE', 1024)))
+
+# PyJWKClient caches the key set itself; keep one per JWKS URL.
+_jwks_clients = {}
+_jwks_lock = threading.Lock()
+
+
+class LocalVerificationUnavailable(Exception):
+    """Raised when no signing key is configured for a token's algorithm."""
+
+
+def _get_jwks_client(supabase_url):
+    jwks_url = f"{supabase_url.rstrip('/')}/auth/v1/.well-known/jwks.json"
+    with _jwks_lock:
+        client = _jwks_clients.get(jwks_url)
+        if client is None:
+            client = jwt.PyJWKClient(
+                jwks_url,
+                cache_keys=True,
+                lifespan=float(os.environ.get('SUPABASE_JWKS_CACHE_SECONDS', 600)),
+                timeout=float(os.environ.get('SUPABASE_CONNECT_TIMEOUT', 5)),
+            )
+            _jwks_clients[jwks_url] = client
+        return client
+
+
+def verify_token_locally(token):
+    """Check the token's signature, expiry and audience without calling Supabase.
+
+    HS256 tokens are checked against SUPABASE_JWT_SECRET; asymmetric tokens
+    against the project's JWKS, which is fetched once and cached. The header
+    only picks the key: a JWKS key is checked with its own algorithm, never
+    the one the token names.
+    """
+    try:
+        header = jwt.get_unverified_header(token)
+    except jwt.PyJWTError as e:
+        raise exceptions.AuthenticationFailed(f'Invalid token: {e}')
+
+    if header.get('alg') == 'HS256':
+        algorithm = 'HS256'
+        key = os.environ.get('SUPABASE_JWT_SECRET')
+        if not key:
+            raise LocalVerificationUnavailable('SUPABASE_JWT_SECRET is not set')
+    else:
+        supabase_url = os.environ.get('SUPABASE_URL')
+        if not supabase_url:
+            raise LocalVerificationUnavailable('SUPABASE_URL is not set')
+        try:
+            signing_key = _get_jwks_client(supabase_url).get_signing_key_from_jwt(token)
+        except jwt.PyJWKClientConnectionError as e:
+            raise LocalVerificationUnavailable(str(e))
+        except jwt.PyJWTError as e:
+            raise exceptions.AuthenticationFailed(f'Invalid token: {e}')
+        algorithm, key = signing_key.algorithm_name, signing_key.key
+
+    try:
+        return jwt.decode(
+            token,
+            key,
+            algorithms=[algorithm],
+            audience=os.environ.get('SUPABASE_JWT_AUDIENCE', 'authenticated'),
+            options={'require': ['exp', 'sub']},
+        )
+    except jwt.PyJWTError as e:
+        raise exceptions.AuthenticationFailed(f'Invalid token: {e}')
+
+
+def _claims_from_user(token, user_data):
+    if not user_data:
+        raise exceptions.AuthenticationFailed('Invalid token')
+
+    # Supabase already validated the token; only its expiry is needed for caching.
+    claims = jwt.decode(token, options={'verify_signature': False})
+    claims['sub'] = user_data.user.id
+    claims['email'] = user_data.user.email
+    return claims
+
+
+def verify_token_remotely(token):
+    """Ask Supabase Auth for the token's user (one network round trip)."""
+    supabase: Client = get_supabase_client()
+    return _claims_from_user(token, supabase.auth.get_user(token))
+
+
+async def averify_token_remotely(token):
+    supabase = await get_async_supabase_client()
+    return _claims_from_user(token, await supabase.auth.get_user(token))
+
+
+def _remote_mode():
+    return os.environ.get('SUPABASE_AUTH_MODE', 'local') == 'remote'
+
+
+def _remote_fallback_enabled():
+    return os.environ.get('SUPABASE_AUTH_REMOTE_FALLBACK', 'true').lower() in ('1', 'true', 'yes')
+
+
+def _user_from_claims(claims):
+    # Create a transient user instance without saving to DB
+    # We map Supabase UUID to username
+    user = User(username=claims['sub'], email=claims.get('email', ''))
+    # We explicitly set is_active to True, though it defaults to True
+    user.is_active = True
+    return user
+
+
+async def aauthenticate(auth_header):
+    """Async SupabaseAuthentication for the ASGI views.
+
+    Returns a transient User, or None when there is no Authorization header.
+    Cache hits and HS256 tokens never leave the event loop; JWKS lookups run
+    in a thread and remote checks use the async Supabase client.
+    """
+    with instrumentation.timed('auth', 'authenticate'):
+        return await _aauthenticate(auth_header)
+
+
+async def _aauthenticate(auth_header):
+    if not auth_header:
+        return None
+
+    try:
+        token = auth_header.split(' ')[1]
+
+        claims = token_cache.get(token)
+        if claims is None:
+            if _remote_mode():
+                claims = await averify_token_remotely(token)
+            else:
+                try:
+                    if jwt.get_unverified_header(token).get('alg') == 'HS256':
+                        claims = verify_token_locally(token)
+                    else:
+                        claims = await asyncio.to_thread(verify_token_locally, token)
+                except LocalVerificationUnavailable:
+                    if not _remote_fallback_enabled():
+                        raise
+                    claims = await averify_token_remotely(token)
+            token_cache.set(token, claims, claims.get('exp', 0))
+
+        return _user_from_claims(claims)
+
+    except exceptions.AuthenticationFailed:
+        raise
+    except Exception as e:
+        raise exceptions.AuthenticationFailed(f'Authentication failed: {str(e)}')
+
+
 class SupabaseAuthentication(authentication.BaseAuthentication):
+    """Authenticate Supabase access tokens.
+
+    SUPABASE_AUTH_MODE selects 'local' verification (default) or a 'remote'
+    get_user() call per token. Local mode falls back to the remote lookup when
+    no signing key is available, unless SUPABASE_AUTH_REMOTE_FALLBACK=false.
+    """
+
     def authenticate(self, request):
+        with instrumentation.timed('auth', 'authenticate'):
+            return self._authenticate(request)
+
+    def _authenticate(self, request):
         auth_header = request.headers.get('Authorization')
         if not auth_header:
             return None
 
         try:
-            # Connect to Supabase
-            url: str = os.environ.get("SUPABASE_URL")
-            key: str = os.environ.get("SUPABASE_KEY")
-            supabase: Client = create_client(url, key)
-
-            # Verify token involves getting the user from Supabase
             # The token is passed as "Bearer <token>"
             token = auth_header.split(' ')[1]
-            user_data = supabase.auth.get_user(token)
-            
-            if not user_data:
-                raise exceptions.AuthenticationFailed('Invalid token')
-
-            uid = user_data.user.id
-            email = user_data.user.email
-
-            # Create a transient user instance without saving to DB
-            # We map Supabase UUID to username
-            user = User(username=uid, email=email)
-            # We explicitly set is_active to True, though it defaults to True
-            user.is_active = True
-            
-            return (user, None)
 
+            claims = token_cache.get(token)
+            if claims is None:
+                claims = self.verify(token)
+                token_cache.set(token, claims, claims.get('exp', 0))
+
+            return (_user_from_claims(claims), None)
+
+        except exceptions.AuthenticationFailed:
+            raise
         except Exception as e:
             raise exceptions.AuthenticationFailed(f'Authentication failed: {str(e)}')
+
+    def verify(self, token):
+        if _remote_mode():
+            return verify_token_remotely(token)
+
+        try:
+            return verify_token_locally(token)
+        except LocalVerificationUnavailable:
+            if _remote_fallback_enabled():
+                return verify_token_remotely(token)
+            raise
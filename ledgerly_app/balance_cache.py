@@ -0,0 +1,173 @@
+import os
+import time
+
+from django.core.cache import cache
+
+from .plaid_init import get_plaid_client
+from . import conditional, resilience, single_flight
+
+CACHE_PREFIX = 'balances:'
+# Last snapshot fetched per item, kept past expiry and invalidation for when Plaid is down.
+STALE_PREFIX = 'balances-stale:'
+
+# Where a snapshot came from. accounts/balance/get forces a real-time pull from
+# the bank; accounts/get returns the balances Plaid already has, at no charge.
+SOURCE_REALTIME = 'realtime'
+SOURCE_CACHED = 'cached'
+
+
+def _ttl():
+    return int(os.getenv('BALANCE_CACHE_TTL', 60 * 60))
+
+
+def _stale_ttl():
+    return int(os.getenv('BALANCE_STALE_TTL', 24 * 60 * 60))
+
+
+def default_max_age():
+    """Seconds a balance may be served from the cache when the request does not say.
+
+    Non-zero, so a client polling within it revalidates its ETag (304)
+    without a real-time Plaid call; ``max_age=0`` still forces one.
+    """
+    return int(os.getenv('BALANCE_DEFAULT_MAX_AGE', 60))
+
+
+def cache_key(item_id, source=SOURCE_REALTIME):
+    # One key per source, so an accounts/get snapshot never replaces a real-time one.
+    return f'{CACHE_PREFIX}{source}:{item_id}'
+
+
+def stale_key(item_id):
+    return f'{STALE_PREFIX}{item_id}'
+
+
+def _keys(item_id, realtime):
+    # A request that takes accounts/get balances takes real-time ones as well.
+    sources = (SOURCE_REALTIME,) if realtime else (SOURCE_REALTIME, SOURCE_CACHED)
+    return [cache_key(item_id, source) for source in sources]
+
+
+def _newest(snapshots):
+    return max(snapshots.values(), key=lambda snapshot: snapshot['fetched_at'], default=None)
+
+
+def _usable(snapshot, max_age, realtime):
+    if snapshot is None or not max_age:
+        return False
+    if realtime and snapshot['source'] != SOURCE_REALTIME:
+        return False
+    return time.time() - snapshot['fetched_at'] <= max_age
+
+
+def _fetched_since(snapshot, started, realtime):
+    # A snapshot another worker stored after this call started is as fresh
+    # as the one this call would have fetched.
+    if snapshot is None or (realtime and snapshot['source'] != SOURCE_REALTIME):
+        return None
+    return snapshot if snapshot['fetched_at'] >= started else None
+
+
+def _snapshot(accounts, source):
+    return {
+        'accounts': accounts,
+        'fetched_at': time.time(),
+        'source': source,
+        # Unchanged balances keep their version across refreshes.
+        'version': conditional.fingerprint([accounts, source]),
+    }
+
+
+def get_balances(item_id, access_token, max_age=0, realtime=True, client=None):
+    """Account balances for an item, no older than ``max_age`` seconds.
+
+    A snapshot in the cache is returned while it is within the budget; past
+    it (or with ``max_age`` 0) Plaid is asked again, through accounts/balance/get
+    when ``realtime`` is set and accounts/get otherwise. A real-time request is
+    never answered with a snapshot from accounts/get. Returns a dict with
+    'accounts', 'fetched_at' (epoch seconds), 'source' and a content 'version'.
+    Concurrent refreshes of one item share a single Plaid call. While Plaid
+    is down or rate limiting, the last snapshot fetched for the item is
+    returned, whatever its age or source and even after ``invalidate``; its
+    age_fields say how old it is.
+    """
+    keys = _keys(item_id, realtime)
+    snapshot = _newest(cache.get_many(keys))
+    if _usable(snapshot, max_age, realtime):
+        return snapshot
+
+    from plaid.model.accounts_balance_get_request import AccountsBalanceGetRequest
+    from plaid.model.accounts_get_request import AccountsGetRequest
+
+    client = client or get_plaid_client()
+    started = time.time()
+
+    def fetch():
+        if realtime:
+            response = client.accounts_balance_get(AccountsBalanceGetRequest(access_token=access_token)).to_dict()
+            snapshot = _snapshot(response.get('accounts', []), SOURCE_REALTIME)
+        else:
+            response = client.accounts_get(AccountsGetRequest(access_token=access_token)).to_dict()
+            snapshot = _snapshot(response.get('accounts', []), SOURCE_CACHED)
+        cache.set(cache_key(item_id, snapshot['source']), snapshot, _ttl())
+        cache.set(stale_key(item_id), snapshot, _stale_ttl())
+        return snapshot
+
+    method = 'accounts_balance_get' if realtime else 'accounts_get'
+    try:
+        return single_flight.call(f'{method}:{item_id}', fetch, lambda: _fetched_since(_newest(cache.get_many(keys)), started, realtime))
+    except Exception as e:
+        stale = cache.get(stale_key(item_id))
+        if stale is None or not resilience.serve_stale(e):
+            raise
+        print(f"Serving cached balances for item {item_id}: {e}")
+        return stale
+
+
+async def aget_balances(item_id, access_token, client, max_age=0, realtime=True):
+    """Async get_balances for the ASGI views; ``client`` is an AsyncPlaidClient."""
+    keys = _keys(item_id, realtime)
+    snapshot = _newest(await cache.aget_many(keys))
+    if _usable(snapshot, max_age, realtime):
+        return snapshot
+
+    started = time.time()
+
+    async def fetch():
+        if realtime:
+            response = await client.accounts_balance_get(access_token)
+            snapshot = _snapshot(response.get('accounts', []), SOURCE_REALTIME)
+        else:
+            response = await client.accounts_get(access_token)
+            snapshot = _snapshot(response.get('accounts', []), SOURCE_CACHED)
+        await cache.aset(cache_key(item_id, snapshot['source']), snapshot, _ttl())
+        await cache.aset(stale_key(item_id), snapshot, _stale_ttl())
+        return snapshot
+
+    async def peek():
+        return _fetched_since(_newest(await cache.aget_many(keys)), started, realtime)
+
+    method = 'accounts_balance_get' if realtime else 'accounts_get'
+    try:
+        return await single_flight.acall(f'{method}:{item_id}', fetch, peek)
+    except Exception as e:
+        stale = await cache.aget(stale_key(item_id))
+        if stale is None or not resilience.serve_stale(e):
+            raise
+        print(f"Serving cached balances for item {item_id}: {e}")
+        return stale
+
+
+def age_fields(snapshot, now=None):
+    """'as_of', 'age_seconds' and 'source' describing how fresh a snapshot is."""
+    now = time.time() if now is None else now
+    return {
+        'as_of': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(snapshot['fetched_at'])),
+        'age_seconds': max(0, int(now - snapshot['fetched_at'])),
+        'source': snapshot['source'],
+    }
+
+
+def invalidate(item_id):
+    # The stale copy stays, for when Plaid is down.
+    cache.delete_many([cache_key(item_id, source) for source in (SOURCE_REALTIME, SOURCE_CACHED)])
@@ -0,0 +1,81 @@
+"""Negotiated response compression: brotli when the client takes it, gzip otherwise.
+
+CompressionMiddleware is Django's GZipMiddleware with two changes. Bodies
+under COMPRESSION_MIN_BYTES (1024 by default) are sent as they are, since
+compressing them saves less than it costs. Clients that list ``br`` in
+Accept-Encoding get brotli at BROTLI_QUALITY (4 by default, tuned for
+dynamic responses), provided the optional ``brotli`` package is installed.
+Streaming responses such as the NDJSON transaction history are compressed
+chunk by chunk, and each chunk is flushed as soon as it is ready.
+"""
+import os
+
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+re_accepts_brotli = _lazy_re_compile(r'\bbr\b')
+
+
+def _min_bytes():
+    return int(os.getenv('COMPRESSION_MIN_BYTES', 1024))
+
+
+def _quality():
+    return int(os.getenv('BROTLI_QUALITY', 4))
+
+
+def _brotli_sequence(chunks, quality):
+    compressor = brotli.Compressor(quality=quality)
+    for chunk in chunks:
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+async def _abrotli_sequence(chunks, quality):
+    compressor = brotli.Compressor(quality=quality)
+    async for chunk in chunks:
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware(GZipMiddleware):
+    def process_response(self, request, response):
+        if not response.streaming and len(response.content) < _min_bytes():
+            return response
+
+        accepts_brotli = re_accepts_brotli.search(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if brotli is None or not accepts_brotli or response.has_header('Content-Encoding'):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        quality = _quality()
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = _abrotli_sequence(response.streaming_content, quality)
+            else:
+                response.streaming_content = _brotli_sequence(response.streaming_content, quality)
+            del response.headers['Content-Length']
+        else:
+            compressed = brotli.compress(response.content, quality=quality)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # As GZipMiddleware does: the encoded body is no longer byte-identical,
+        # so a strong ETag becomes weak (If-None-Match compares weakly).
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
@@ -0,0 +1,97 @@
+"""ETags and conditional GETs for the read endpoints clients poll.
+
+An endpoint builds its ETag from version stamps it already holds: the
+transactions/sync cursor of each item, the version of each item's cached
+recurring streams and of each balance snapshot. A client that sends the
+ETag back in If-None-Match gets 304 Not Modified before the body is built,
+and without a Plaid call whenever those stamps come from the caches.
+Responses with failed items are never tagged, so a partial answer is not
+revalidated as if it were complete.
+"""
+import hashlib
+import json
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+
+def fingerprint(value):
+    """Stable short hash of JSON-like data, used as a cache entry's version."""
+    encoded = json.dumps(value, sort_keys=True, separators=(',', ':'), default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:32]
+
+
+def make_etag(*parts, weak=False):
+    """A quoted ETag over ``parts``. Weak ones (W/) promise equivalent, not identical, bodies."""
+    etag = f'"{fingerprint(parts)}"'
+    return f'W/{etag}' if weak else etag
+
+
+def _cache_headers(response, etag):
+    response['ETag'] = etag
+    # Per-user data: browsers may keep it, but must revalidate before reuse.
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def not_modified(request, etag):
+    """A 304 response when If-None-Match matches ``etag``, otherwise None.
+
+    Other preconditions are evaluated as Django does, so a failed If-Match
+    returns 412.
+    """
+    if etag is None:
+        return None
+    response = get_conditional_response(request, etag=etag)
+    if response is not None and response.status_code == 304:
+        _cache_headers(response, etag)
+    return response
+
+
+def tag(response, etag):
+    """Attach ``etag`` and revalidation headers to a 200 response."""
+    if etag is None or response.status_code != 200:
+        return response
+    return _cache_headers(response, etag)
+
+
+def recurring_etag(kind, user_id, results, *extra):
+    """ETag for a response built from cached recurring streams.
+
+    ``results`` are the (item, streams) pairs from recurring_cache; ``extra``
+    holds anything else that shapes the body, such as the query range.
+    Returns None if an entry has no version.
+    """
+    versions = sorted((item['item_id'], streams.get('version')) for item, streams in results)
+    if any(version is None for _, version in versions):
+        return None
+    return make_etag(kind, user_id, versions, *extra)
+
+
+def balance_etag(user_id, results):
+    """Weak ETag over balance snapshot versions.
+
+    It is weak because ``as_of`` and ``age_seconds`` move on while the balances
+    themselves stay the same.
+    """
+    versions = sorted((item['item_id'], snapshot.get('version')) for item, snapshot in results)
+    if any(version is None for _, version in versions):
+        return None
+    return make_etag('balances', user_id, versions, weak=True)
+
+
+def transactions_etag(user_id, cursors, recurring_results):
+    """ETag for get_transactions: every item's sync cursor plus its recurring streams."""
+    if any(cursor is None for cursor in cursors.values()):
+        return None
+    return recurring_etag('transactions', user_id, recurring_results, sorted(cursors.items()))
+
+
+def forecast_etag(user_id, results, *extra):
+    """ETag for the cash-flow forecast: each item's balance snapshot and recurring stream versions."""
+    versions = sorted(
+        (item['item_id'], snapshot.get('version'), streams.get('version'))
+        for item, (snapshot, streams) in results
+    )
+    if any(None in version for version in versions):
+        return None
+    return make_etag('forecast', user_id, versions, *extra)
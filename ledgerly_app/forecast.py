@@ -0,0 +1,254 @@
+"""Cash-flow forecast: projected daily balances from recurring streams.
+
+Each active inflow and outflow stream is expanded into dated payments by
+its frequency, starting from predicted_next_date and anchored to that day of
+the month for monthly-style frequencies. The payments are scattered onto an
+(accounts x days) grid of cents with np.bincount. A cumulative sum along the
+days, added to each account's latest balance, gives the projected end-of-day
+balance.
+
+Only depository accounts are projected. Streams on credit and loan accounts
+are left out, since those balances are debts; what reaches the cash
+accounts is the card or loan payment, which is a stream of its own.
+
+Scenarios adjust the inputs, not the result: ``skip`` drops streams and
+``add`` inserts one-off payments. With balances and streams cached, a
+scenario costs one more projection, a few milliseconds.
+"""
+from datetime import date, timedelta
+
+from . import multi_item
+from .numeric import np
+
+DEFAULT_DAYS = 90
+MAX_DAYS = 365
+
+FREQUENCY_DAYS = {'WEEKLY': 7, 'BIWEEKLY': 14}
+FREQUENCY_MONTHS = {'MONTHLY': 1, 'ANNUALLY': 12}
+SEMI_MONTHLY = 'SEMI_MONTHLY'
+
+
+def _to_cents(value):
+    return int(round(float(value) * 100))
+
+
+def _amount(stream):
+    for field in ('average_amount', 'last_amount'):
+        amount = (stream.get(field) or {}).get('amount')
+        if amount is not None:
+            return abs(_to_cents(amount))
+    return None
+
+
+def _frequency(stream):
+    # Plaid models stringify enum values; raw payloads are plain strings.
+    return str(stream.get('frequency') or 'UNKNOWN').upper()
+
+
+def _monthly(first, months, end):
+    """Dates ``months`` apart on first's day of the month (clamped to short months), before ``end``."""
+    first = np.datetime64(first, 'D')
+    first_month = first.astype('datetime64[M]')
+    month_starts = np.arange(first_month, np.datetime64(end, 'M') + 1, months)
+    month_ends = (month_starts + 1).astype('datetime64[D]') - 1
+    anchored = month_starts.astype('datetime64[D]') + (first - first_month.astype('datetime64[D]'))
+    dates = np.minimum(anchored, month_ends)
+    return dates[dates < np.datetime64(end, 'D')]
+
+
+def _as_date(value):
+    return value if isinstance(value, date) else date.fromisoformat(str(value))
+
+
+def _interval(stream):
+    """Average days between a stream's payments so far, or None with fewer than two."""
+    first_date, last_date = stream.get('first_date'), stream.get('last_date')
+    payments = len(stream.get('transaction_ids') or [])
+    if not first_date or not last_date or payments < 2:
+        return None
+    days = (_as_date(last_date) - _as_date(first_date)).days
+    return round(days / (payments - 1)) or None
+
+
+def _every(first, step, start, end):
+    # Dates ``step`` days apart from ``first``, rolled forward to start at or after ``start``.
+    if first < start:
+        first += timedelta(days=-(-(start - first).days // step) * step)
+    return np.arange(np.datetime64(first, 'D'), np.datetime64(end, 'D'), step)
+
+
+def occurrence_dates(first, frequency, start, end, interval=None):
+    """Dates in [start, end) on which a stream next predicted for ``first`` pays.
+
+    Occurrences before ``start`` (a payment Plaid expected but has not seen
+    yet) are rolled forward by the frequency. A stream of unknown frequency
+    repeats every ``interval`` days when one is given (see _interval).
+    Without one it pays once, on ``first``, and is left out if that date
+    has passed.
+    """
+    if frequency in FREQUENCY_DAYS:
+        return _every(first, FREQUENCY_DAYS[frequency], start, end)
+    if frequency in FREQUENCY_MONTHS:
+        dates = _monthly(first, FREQUENCY_MONTHS[frequency], end)
+    elif frequency == SEMI_MONTHLY:
+        # Twice a month, about half a month apart.
+        second = first + timedelta(days=15) if first.day <= 15 else first - timedelta(days=15)
+        dates = np.sort(np.concatenate([_monthly(first, 1, end), _monthly(second, 1, end)]))
+        dates = dates[dates >= np.datetime64(first, 'D')]
+    elif interval:
+        return _every(first, interval, start, end)
+    else:
+        dates = np.array([first], dtype='datetime64[D]')
+        dates = dates[dates < np.datetime64(end, 'D')]
+    return dates[dates >= np.datetime64(start, 'D')]
+
+
+def _accounts(results):
+    accounts = []
+    for item, (snapshot, _) in results:
+        for account in snapshot['accounts']:
+            balances = account.get('balances') or {}
+            balance = balances.get('available')
+            if balance is None:
+                balance = balances.get('current')
+            if str(account.get('type')) != 'depository' or balance is None:
+                continue
+            accounts.append({
+                'account_id': account['account_id'],
+                **multi_item.item_tag(item),
+                'name': account.get('name'),
+                'mask': account.get('mask'),
+                'starting_cents': _to_cents(balance),
+            })
+    return accounts
+
+
+def _stream_events(results, account_index, start, end, skip):
+    """Payment columns (account code, day offset, signed cents) and their event rows."""
+    codes, offsets, cents, events = [], [], [], []
+    skipped = []
+    for _, (_, streams) in results:
+        for direction, key, sign in (('inflow', 'inflow_streams', 1), ('outflow', 'outflow_streams', -1)):
+            for stream in streams.get(key, []):
+                if stream.get('stream_id') in skip:
+                    skipped.append(stream['stream_id'])
+                    continue
+                first = stream.get('predicted_next_date')
+                amount = _amount(stream)
+                if not stream.get('is_active') or not first or amount is None or stream.get('account_id') not in account_index:
+                    continue
+                dates = occurrence_dates(_as_date(first), _frequency(stream), start, end, _interval(stream))
+                day_offsets = (dates - np.datetime64(start, 'D')).astype(np.int64)
+                codes.append(np.full(len(dates), account_index[stream['account_id']]))
+                offsets.append(day_offsets)
+                cents.append(np.full(len(dates), sign * amount))
+                for day in dates.tolist():
+                    events.append({
+                        'date': day.isoformat(),
+                        'account_id': stream['account_id'],
+                        'stream_id': stream.get('stream_id'),
+                        'description': stream.get('merchant_name') or stream.get('description'),
+                        # Plaid's sign: positive is money out.
+                        'amount': -sign * amount / 100,
+                        'direction': direction,
+                    })
+    return codes, offsets, cents, events, skipped
+
+
+def _added_events(add, accounts, account_index, start, end):
+    """Columns and event rows for one-off scenario payments. ``amount`` uses Plaid's sign."""
+    codes, offsets, cents, events = [], [], [], []
+    for payment in add:
+        account_id = payment.get('account_id') or accounts[0]['account_id']
+        if account_id not in account_index:
+            raise ValueError(f'Unknown or non-depository account_id: {account_id}')
+        day = _as_date(payment['date'])
+        if not start <= day < end:
+            continue
+        amount = _to_cents(payment['amount'])
+        codes.append(np.array([account_index[account_id]]))
+        offsets.append(np.array([(day - start).days]))
+        cents.append(np.array([-amount]))
+        events.append({
+            'date': day.isoformat(),
+            'account_id': account_id,
+            'stream_id': None,
+            'description': payment.get('description') or 'Scenario payment',
+            'amount': amount / 100,
+            'direction': 'outflow' if amount > 0 else 'inflow',
+            'scenario': True,
+        })
+    return codes, offsets, cents, events
+
+
+def project(starting_cents, codes, offsets, cents, days):
+    """(accounts x days) matrix of projected end-of-day balances in cents."""
+    n = len(starting_cents)
+    combined = codes * days + offsets
+    deltas = np.bincount(combined, weights=cents, minlength=n * days).reshape(n, days).astype(np.int64)
+    return np.asarray(starting_cents, dtype=np.int64)[:, None] + np.cumsum(deltas, axis=1)
+
+
+def _summary(balances, dates, threshold_cents):
+    # Lowest point and the first day below the threshold, for one series.
+    below = np.flatnonzero(balances < threshold_cents)
+    lowest = int(np.argmin(balances))
+    return {
+        'balances': (balances / 100).round(2).tolist(),
+        'lowest_balance': round(int(balances[lowest]) / 100, 2),
+        'lowest_balance_date': dates[lowest],
+        'first_overdraft_date': dates[below[0]] if len(below) else None,
+    }
+
+
+def build(results, start, days=DEFAULT_DAYS, skip=(), add=(), threshold=0):
+    """Projected balances per depository account, and combined, for ``days`` days from ``start``.
+
+    ``results`` are (item, (balance snapshot, recurring streams)) pairs.
+    An overdraft is a projected balance below ``threshold``. Payments due
+    on a day count toward that day's balance.
+    """
+    days = int(days)
+    if not 1 <= days <= MAX_DAYS:
+        raise ValueError(f'days must be between 1 and {MAX_DAYS}')
+    end = start + timedelta(days=days)
+    skip = set(skip)
+
+    accounts = _accounts(results)
+    if not accounts:
+        raise ValueError('No depository accounts with a balance to project')
+    account_index = {account['account_id']: i for i, account in enumerate(accounts)}
+
+    codes, offsets, cents, events, skipped = _stream_events(results, account_index, start, end, skip)
+    added = _added_events(add, accounts, account_index, start, end)
+    codes, offsets, cents = codes + added[0], offsets + added[1], cents + added[2]
+    events += added[3]
+
+    empty = np.array([], dtype=np.int64)
+    projected = project(
+        [account['starting_cents'] for account in accounts],
+        np.concatenate(codes) if codes else empty,
+        np.concatenate(offsets) if offsets else empty,
+        np.concatenate(cents) if cents else empty,
+        days,
+    )
+
+    dates = [str(d) for d in np.arange(np.datetime64(start, 'D'), np.datetime64(end, 'D'))]
+    threshold_cents = _to_cents(threshold)
+    starting = sum(account['starting_cents'] for account in accounts)
+    return {
+        'start_date': start.isoformat(),
+        'days': days,
+        'dates': dates,
+        'accounts': [
+            {
+                **{k: v for k, v in account.items() if k != 'starting_cents'},
+                'starting_balance': account['starting_cents'] / 100,
+                **_summary(projected[i], dates, threshold_cents),
+            }
+            for i, account in enumerate(accounts)
+        ],
+        'combined': {'starting_balance': starting / 100, **_summary(projected.sum(axis=0), dates, threshold_cents)},
+        'events': sorted(events, key=lambda event: event['date']),
+        'skipped_streams': sorted(set(skipped)),
+    }
@@ -0,0 +1,74 @@
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import InstitutionMetadata
+from .plaid_init import get_plaid_client
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _fetch_institution(client, institution_id):
+    from plaid.model.country_code import CountryCode
+    from plaid.model.institutions_get_by_id_request import InstitutionsGetByIdRequest
+
+    request_plaid = InstitutionsGetByIdRequest(
+        institution_id=institution_id,
+        country_codes=[CountryCode('US')]
+    )
+    institution = client.institutions_get_by_id(request_plaid)['institution']
+    return institution.institution_id, institution.name
+
+
+def get_institutions(institution_ids, client=None):
+    """Resolve institution names, hitting Plaid only for unknown or stale IDs.
+
+    Fresh rows (younger than INSTITUTION_CACHE_TTL seconds, 30 days by default)
+    come from the local table. Misses are fetched concurrently, at most
+    INSTITUTION_FETCH_CONCURRENCY at a time, and written back in one upsert.
+    Returns (names, errors): dicts keyed by institution_id.
+    """
+    wanted = list(dict.fromkeys(i for i in institution_ids if i))
+    fresh_after = timezone.now() - timedelta(seconds=_env_int('INSTITUTION_CACHE_TTL', 30 * 24 * 60 * 60))
+    names = dict(
+        InstitutionMetadata.objects
+        .filter(institution_id__in=wanted, fetched_at__gte=fresh_after)
+        .values_list('institution_id', 'name')
+    )
+    misses = [i for i in wanted if i not in names]
+    errors = {}
+    if not misses:
+        return names, errors
+
+    client = client or get_plaid_client()
+    workers = min(_env_int('INSTITUTION_FETCH_CONCURRENCY', 4), len(misses))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Each call gets the request's context so its timing lands in Server-Timing.
+        futures = {i: executor.submit(contextvars.copy_context().run, _fetch_institution, client, i) for i in misses}
+
+    now = timezone.now()
+    fetched = []
+    for institution_id, future in futures.items():
+        try:
+            _, name = future.result()
+        except Exception as e:
+            print(f"Error fetching institution details for {institution_id}: {e}")
+            errors[institution_id] = str(e)
+            continue
+        names[institution_id] = name
+        fetched.append(InstitutionMetadata(institution_id=institution_id, name=name, fetched_at=now))
+
+    if fetched:
+        InstitutionMetadata.objects.bulk_create(
+            fetched,
+            update_conflicts=True,
+            unique_fields=['institution_id'],
+            update_fields=['name', 'fetched_at'],
+        )
+    return names, errors
@@ -0,0 +1,241 @@
+"""Timing of upstream calls per request, Server-Timing headers and Prometheus metrics.
+
+Code that talks to Supabase or Plaid, checks auth or renders a response
+wraps the work in ``timed(kind, name)``. Inside a request (set up by
+ServerTimingMiddleware) each kind's total goes into that response's
+Server-Timing header. Every call is also added to process-wide histograms,
+served in Prometheus text format by ``metrics_view``. Each worker process
+keeps its own numbers, so scrape every worker.
+"""
+import contextvars
+import hmac
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.http import HttpResponse
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(label, '')) for label in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['counts'][i] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {key: {**s, 'counts': list(s['counts'])} for key, s in self._series.items()}
+        for key, s in sorted(series.items()):
+            labels = _labels(self.labels, key)
+            for bound, count in zip(self.buckets, s['counts']):
+                lines.append(f'{self.name}_bucket{{{labels}{"," if labels else ""}le="{bound:g}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{labels}{"," if labels else ""}le="+Inf"}} {s["count"]}')
+            lines.append(f'{self.name}_sum{{{labels}}} {s["sum"]:.6f}')
+            lines.append(f'{self.name}_count{{{labels}}} {s["count"]}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(label, '')) for label in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            lines.append(f'{self.name}{{{_labels(self.labels, key)}}} {value}')
+        return lines
+
+
+def _labels(names, values):
+    escape = lambda v: v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ','.join(f'{n}="{escape(v)}"' for n, v in zip(names, values))
+
+
+request_duration = Histogram(
+    'ledgerly_request_duration_seconds', 'Time spent handling a request.',
+    ('endpoint', 'method', 'status'), DURATION_BUCKETS,
+)
+response_size = Histogram(
+    'ledgerly_response_size_bytes', 'Size of response bodies.',
+    ('endpoint',), SIZE_BUCKETS,
+)
+upstream_duration = Histogram(
+    'ledgerly_upstream_duration_seconds', 'Time spent in Supabase, Plaid, auth and rendering, per call.',
+    ('kind', 'name', 'endpoint'), DURATION_BUCKETS,
+)
+upstream_size = Histogram(
+    'ledgerly_upstream_response_size_bytes', 'Size of Supabase and Plaid response bodies.',
+    ('kind', 'name'), SIZE_BUCKETS,
+)
+upstream_errors = Counter(
+    'ledgerly_upstream_errors_total', 'Upstream calls that raised.',
+    ('kind', 'name', 'endpoint'),
+)
+upstream_retries = Counter(
+    'ledgerly_upstream_retries_total', 'Upstream calls retried, by reason.',
+    ('kind', 'reason'),
+)
+circuit_rejections = Counter(
+    'ledgerly_circuit_rejections_total', 'Upstream calls refused while the circuit was open.',
+    ('kind',),
+)
+
+METRICS = [request_duration, response_size, upstream_duration, upstream_size, upstream_errors, upstream_retries, circuit_rejections]
+
+
+class RequestTimings:
+    """Per-kind totals for one request. Shared with the threads it fans out to."""
+
+    def __init__(self, endpoint=''):
+        self.endpoint = endpoint
+        self.totals = {}
+        self._lock = threading.Lock()
+
+    def add(self, kind, seconds):
+        with self._lock:
+            total, count = self.totals.get(kind, (0.0, 0))
+            self.totals[kind] = (total + seconds, count + 1)
+
+    def header(self, total_seconds):
+        with self._lock:
+            totals = dict(self.totals)
+        parts = [
+            f'{kind};dur={seconds * 1000:.1f};desc="{count} call{"s" if count != 1 else ""}"'
+            for kind, (seconds, count) in sorted(totals.items())
+        ]
+        parts.append(f'total;dur={total_seconds * 1000:.1f}')
+        return ', '.join(parts)
+
+
+_current = contextvars.ContextVar('ledgerly_request_timings', default=None)
+
+
+def record(kind, name, seconds, failed=False):
+    timings = _current.get()
+    if timings is not None:
+        timings.add(kind, seconds)
+    endpoint = timings.endpoint if timings is not None else ''
+    upstream_duration.observe(seconds, kind=kind, name=name, endpoint=endpoint)
+    if failed:
+        upstream_errors.inc(kind=kind, name=name, endpoint=endpoint)
+
+
+def record_size(kind, name, size):
+    upstream_size.observe(size, kind=kind, name=name)
+
+
+@contextmanager
+def timed(kind, name):
+    started = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        record(kind, name, time.perf_counter() - started, failed)
+
+
+def _endpoint(request):
+    match = getattr(request, 'resolver_match', None)
+    return (match.url_name or match.view_name) if match else 'unmatched'
+
+
+class ServerTimingMiddleware:
+    """Collects the timings of each request and reports them in Server-Timing.
+
+    Works for both WSGI and ASGI requests. Put it first in MIDDLEWARE so
+    the total covers the rest of the stack.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = RequestTimings()
+        token = _current.set(timings)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, timings, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, timings, time.perf_counter() - started)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = _current.get()
+        if timings is not None:
+            timings.endpoint = _endpoint(request)
+
+    def _finish(self, request, response, timings, elapsed):
+        endpoint = timings.endpoint or _endpoint(request)
+        response['Server-Timing'] = timings.header(elapsed)
+        request_duration.observe(elapsed, endpoint=endpoint, method=request.method, status=response.status_code)
+        if not response.streaming:
+            response_size.observe(len(response.content), endpoint=endpoint)
+        return response
+
+
+def expose():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.expose())
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint. Set METRICS_TOKEN to require a bearer token."""
+    token = os.getenv('METRICS_TOKEN')
+    if token:
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+        if not hmac.compare_digest(supplied, token):
+            return HttpResponse('Forbidden\n', status=403, content_type='text/plain')
+    return HttpResponse(expose(), content_type='text/plain; version=0.0.4; charset=utf-8')
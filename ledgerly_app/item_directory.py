@@ -0,0 +1,117 @@
+import os
+
+from django.core.cache import cache
+
+from .supabase_init import get_async_supabase_client, get_supabase_client
+from . import resilience
+
+USER_PREFIX = 'plaid-items:'
+OWNER_PREFIX = 'plaid-item-owner:'
+# Last directory read per user, kept for when Supabase is down.
+STALE_PREFIX = 'plaid-items-stale:'
+ITEM_COLUMNS = "access_token, item_id, institution_id"
+
+
+def _ttl():
+    return int(os.getenv('ITEM_DIRECTORY_TTL', 5 * 60))
+
+
+def _stale_ttl():
+    return int(os.getenv('ITEM_DIRECTORY_STALE_TTL', 24 * 60 * 60))
+
+
+def user_key(user_id):
+    return f'{USER_PREFIX}{user_id}'
+
+
+def owner_key(item_id):
+    return f'{OWNER_PREFIX}{item_id}'
+
+
+def stale_key(user_id):
+    return f'{STALE_PREFIX}{user_id}'
+
+
+def _remember(user_id, items):
+    # The owner entries let item-scoped events (webhooks, jobs) find the
+    # user's directory entry without another Supabase query.
+    ttl = _ttl()
+    cache.set(user_key(user_id), items, ttl)
+    cache.set(stale_key(user_id), items, _stale_ttl())
+    cache.set_many({owner_key(item['item_id']): user_id for item in items if item.get('item_id')}, ttl)
+
+
+def get_user_items(user_id, supabase=None):
+    """A user's linked Plaid items (access_token, item_id, institution_id).
+
+    Served from the Django cache for ITEM_DIRECTORY_TTL seconds; linking an
+    item or an ITEM webhook drops the entry early. The cache backend bounds
+    the number of entries (MAX_ENTRIES locally, eviction policy on Redis).
+    While Supabase is down, the last list read for the user is returned.
+    """
+    items = cache.get(user_key(user_id))
+    if items is not None:
+        return items
+
+    supabase = supabase or get_supabase_client()
+    try:
+        response = supabase.table("user_plaid_items").select(ITEM_COLUMNS).eq("user_id", user_id).execute()
+    except Exception as e:
+        items = cache.get(stale_key(user_id)) if resilience.serve_stale(e) else None
+        if items is None:
+            raise
+        print(f"Serving cached Plaid items for user {user_id}: {e}")
+        return items
+    items = response.data or []
+    _remember(user_id, items)
+    return items
+
+
+async def aget_user_items(user_id, supabase=None):
+    """Async get_user_items for the ASGI views; ``supabase`` is an AsyncClient."""
+    items = await cache.aget(user_key(user_id))
+    if items is not None:
+        return items
+
+    supabase = supabase or await get_async_supabase_client()
+    try:
+        response = await supabase.table("user_plaid_items").select(ITEM_COLUMNS).eq("user_id", user_id).execute()
+    except Exception as e:
+        items = await cache.aget(stale_key(user_id)) if resilience.serve_stale(e) else None
+        if items is None:
+            raise
+        print(f"Serving cached Plaid items for user {user_id}: {e}")
+        return items
+    items = response.data or []
+    await cache.aset(user_key(user_id), items, _ttl())
+    await cache.aset(stale_key(user_id), items, _stale_ttl())
+    await cache.aset_many({owner_key(item['item_id']): user_id for item in items if item.get('item_id')}, _ttl())
+    return items
+
+
+def get_item(item_id, supabase=None):
+    """user_id and access_token for one item, or None if it is not linked."""
+    user_id = cache.get(owner_key(item_id))
+    if user_id is not None:
+        for item in get_user_items(user_id, supabase):
+            if item['item_id'] == item_id:
+                return {**item, 'user_id': user_id}
+
+    supabase = supabase or get_supabase_client()
+    response = supabase.table("user_plaid_items").select("user_id, access_token").eq("item_id", item_id).execute()
+    if not response.data:
+        return None
+    return response.data[0]
+
+
+def invalidate_user(user_id):
+    # The stale copy goes too: after a link or unlink it no longer stands in for the real list.
+    cache.delete_many([user_key(user_id), stale_key(user_id)])
+
+
+def invalidate_item(item_id):
+    """Forget the directory entry of whichever user owns ``item_id``."""
+    user_id = cache.get(owner_key(item_id))
+    cache.delete(owner_key(item_id))
+    if user_id is not None:
+        invalidate_user(user_id)
@@ -0,0 +1,29 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ledgerly_app import openapi
+
+
+class Command(BaseCommand):
+    help = "Write the OpenAPI schema to OPENAPI_SCHEMA_FILE for /api/schema/ to serve. Run it on every deploy."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help="Where to write the schema (defaults to OPENAPI_SCHEMA_FILE).")
+        parser.add_argument('--check', action='store_true', help="Exit with an error if the file is missing or out of date instead of writing it.")
+
+    def handle(self, *args, **options):
+        path = Path(options['output']) if options['output'] else openapi.schema_file()
+        content = openapi.dumps(openapi.generate())
+
+        if options['check']:
+            current = path.read_text(encoding='utf-8') if path.exists() else None
+            if current != content:
+                raise CommandError(f"{path} is missing or out of date; run manage.py build_openapi_schema.")
+            self.stdout.write(f"{path} is up to date.")
+            return
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content, encoding='utf-8')
+        openapi.reset()
+        self.stdout.write(f"Wrote the OpenAPI schema to {path} ({len(content)} bytes).")
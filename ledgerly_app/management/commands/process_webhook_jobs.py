@@ -0,0 +1,29 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from ledgerly_app import webhook_queue
+
+
+class Command(BaseCommand):
+    help = "Process queued Plaid webhook jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help="Worker threads to run.")
+        parser.add_argument('--once', action='store_true', help="Drain runnable jobs on this thread and exit.")
+
+    def handle(self, *args, **options):
+        if options['once']:
+            processed = webhook_queue.run_pending()
+            self.stdout.write(f"Processed {processed} job(s).")
+            return
+
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+        signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+        webhook_queue.worker_pool.start(workers=options['workers'])
+        self.stdout.write(f"Processing webhook jobs with {options['workers']} worker(s).")
+        stop.wait()
+        webhook_queue.worker_pool.stop()
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ledgerly_app import rollups, sync_engine
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute transaction rollups from the stored transactions and repair any that differ. "
+        "Run it once after migrating, to fill the rollups for existing transactions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Only this user's items.")
+        parser.add_argument('--item', action='append', help="Only this item (repeatable).")
+        parser.add_argument('--verify', action='store_true', help="Report differences and exit with an error instead of repairing them.")
+
+    def handle(self, *args, **options):
+        item_ids = options['item'] or rollups.item_ids(options['user'])
+        drifted = 0
+        for item_id in item_ids:
+            # Under the item's sync lease; rollups.rebuild also locks the item's sync state row,
+            # which keeps out syncs in other processes.
+            with sync_engine.item_lease(item_id):
+                drift = rollups.verify(item_id) if options['verify'] else rollups.rebuild(item_id)
+            drifted += len(drift)
+            for group in drift[:10]:
+                self.stdout.write(
+                    f"{item_id}: {group['period']} {group['period_start']} {group['dimension']}={group['key']} "
+                    f"stored {group['stored']}, expected {group['expected']}"
+                )
+            if len(drift) > 10:
+                self.stdout.write(f"{item_id}: ... and {len(drift) - 10} more")
+
+        if options['verify'] and drifted:
+            raise CommandError(f"{drifted} rollup group(s) differ from the transactions; run manage.py rebuild_rollups.")
+        self.stdout.write(f"Checked rollups for {len(item_ids)} item(s); {drifted} group(s) {'repaired' if drifted else 'differed'}.")
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ledgerly_app import item_directory, sandbox_ingest
+
+
+class Command(BaseCommand):
+    help = "Load sandbox transactions for a user's Plaid item from a CSV or NDJSON file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV (with header row) or NDJSON file of transactions.")
+        parser.add_argument('--user-id', required=True, help="Supabase user ID that owns the item.")
+        parser.add_argument('--item-id', help="Item to load into (defaults to the user's first item).")
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help="File format (defaults to the file extension).")
+        parser.add_argument('--concurrency', type=int, help="Batches in flight at once.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+        with open(path, encoding='utf-8') as f:
+            rows = sandbox_ingest.parse_rows(f.read(), fmt)
+
+        validated, errors = sandbox_ingest.validate_rows(rows)
+        if errors:
+            for error in errors:
+                self.stderr.write(f"Row {error['row']}: {error['errors']}")
+            raise CommandError(f"{len(errors)} invalid row(s); nothing was sent.")
+
+        items = item_directory.get_user_items(options['user_id'])
+        if options['item_id']:
+            items = [item for item in items if item['item_id'] == options['item_id']]
+        if not items:
+            raise CommandError("No Plaid item found for that user.")
+
+        def progress(done, total):
+            self.stdout.write(f"\r{done}/{total} transactions sent", ending='')
+            self.stdout.flush()
+
+        summary = sandbox_ingest.ingest(
+            items[0]['access_token'],
+            sandbox_ingest.build_transactions(validated),
+            concurrency=options['concurrency'],
+            progress=progress,
+        )
+        self.stdout.write('')
+        for failed in summary['failed_batches']:
+            self.stderr.write(f"Rows {failed['first_row']}-{failed['first_row'] + failed['rows'] - 1} failed: {failed['error']}")
+        self.stdout.write(
+            f"Sent {summary['submitted']} of {summary['total']} transactions in {summary['batches']} batch(es)."
+        )
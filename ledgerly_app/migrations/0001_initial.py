@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:07
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlaidAccount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('account_id', models.CharField(max_length=100, unique=True)),
+                ('item_id', models.CharField(db_index=True, max_length=100)),
+                ('user_id', models.CharField(db_index=True, max_length=64)),
+                ('name', models.CharField(blank=True, default='', max_length=255)),
+                ('official_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('mask', models.CharField(blank=True, max_length=10, null=True)),
+                ('type', models.CharField(blank=True, default='', max_length=50)),
+                ('subtype', models.CharField(blank=True, max_length=50, null=True)),
+                ('current_balance', models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True)),
+                ('available_balance', models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True)),
+                ('iso_currency_code', models.CharField(blank=True, max_length=3, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PlaidItemSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item_id', models.CharField(max_length=100, unique=True)),
+                ('user_id', models.CharField(db_index=True, max_length=64)),
+                ('cursor', models.TextField(blank=True, default='')),
+                ('last_synced_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PlaidTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transaction_id', models.CharField(max_length=100, unique=True)),
+                ('user_id', models.CharField(max_length=64)),
+                ('item_id', models.CharField(db_index=True, max_length=100)),
+                ('account_id', models.CharField(max_length=100)),
+                ('date', models.DateField()),
+                ('authorized_date', models.DateField(blank=True, null=True)),
+                ('name', models.CharField(blank=True, default='', max_length=255)),
+                ('merchant_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('iso_currency_code', models.CharField(blank=True, max_length=3, null=True)),
+                ('pending', models.BooleanField(default=False)),
+                ('category_primary', models.CharField(blank=True, max_length=100, null=True)),
+                ('category_detailed', models.CharField(blank=True, max_length=100, null=True)),
+                ('payment_channel', models.CharField(blank=True, max_length=20, null=True)),
+                ('data', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user_id', '-date', '-id'], name='txn_user_date_idx'), models.Index(fields=['account_id', '-date'], name='txn_account_date_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledgerly_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plaiditemsyncstate',
+            name='pagination_start_cursor',
+            field=models.TextField(blank=True, null=True),
+        ),
+    ]
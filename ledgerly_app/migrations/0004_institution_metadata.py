@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledgerly_app', '0003_webhook_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InstitutionMetadata',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('institution_id', models.CharField(max_length=100, unique=True)),
+                ('name', models.CharField(max_length=255)),
+                ('fetched_at', models.DateTimeField()),
+            ],
+        ),
+    ]
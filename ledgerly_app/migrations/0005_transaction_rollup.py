@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledgerly_app', '0004_institution_metadata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.CharField(max_length=64)),
+                ('item_id', models.CharField(max_length=100)),
+                ('period', models.CharField(max_length=5)),
+                ('period_start', models.DateField()),
+                ('dimension', models.CharField(max_length=20)),
+                ('key', models.CharField(max_length=255)),
+                ('cents', models.BigIntegerField(default=0)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user_id', 'dimension', 'period', 'period_start'], name='rollup_user_period_idx')],
+                'constraints': [models.UniqueConstraint(fields=('item_id', 'user_id', 'period', 'period_start', 'dimension', 'key'), name='rollup_unique_group')],
+            },
+        ),
+    ]
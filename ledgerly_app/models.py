@@ -1,3 +1,156 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 
-# Create your models here.
+
+class PlaidItemSyncState(models.Model):
+    """transactions/sync cursor for one Plaid item, stored next to the data it describes."""
+    item_id = models.CharField(max_length=100, unique=True)
+    user_id = models.CharField(max_length=64, db_index=True)
+    cursor = models.TextField(blank=True, default='')
+    # Cursor the current pagination loop started from; set while has_more is
+    # true so a crashed or mutated loop can be restarted from the right place.
+    pagination_start_cursor = models.TextField(null=True, blank=True)
+    last_synced_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.item_id
+
+
+class PlaidAccount(models.Model):
+    account_id = models.CharField(max_length=100, unique=True)
+    item_id = models.CharField(max_length=100, db_index=True)
+    user_id = models.CharField(max_length=64, db_index=True)
+    name = models.CharField(max_length=255, blank=True, default='')
+    official_name = models.CharField(max_length=255, blank=True, null=True)
+    mask = models.CharField(max_length=10, blank=True, null=True)
+    type = models.CharField(max_length=50, blank=True, default='')
+    subtype = models.CharField(max_length=50, blank=True, null=True)
+    current_balance = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+    available_balance = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+    iso_currency_code = models.CharField(max_length=3, blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name or self.account_id
+
+
+class PlaidTransaction(models.Model):
+    transaction_id = models.CharField(max_length=100, unique=True)
+    user_id = models.CharField(max_length=64)
+    item_id = models.CharField(max_length=100, db_index=True)
+    account_id = models.CharField(max_length=100)
+    date = models.DateField()
+    authorized_date = models.DateField(null=True, blank=True)
+    name = models.CharField(max_length=255, blank=True, default='')
+    merchant_name = models.CharField(max_length=255, blank=True, null=True)
+    amount = models.DecimalField(max_digits=14, decimal_places=2)
+    iso_currency_code = models.CharField(max_length=3, blank=True, null=True)
+    pending = models.BooleanField(default=False)
+    category_primary = models.CharField(max_length=100, blank=True, null=True)
+    category_detailed = models.CharField(max_length=100, blank=True, null=True)
+    payment_channel = models.CharField(max_length=20, blank=True, null=True)
+    # Full Plaid transaction object, returned as-is by the API.
+    data = models.JSONField(encoder=DjangoJSONEncoder, default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user_id', '-date', '-id'], name='txn_user_date_idx'),
+            models.Index(fields=['account_id', '-date'], name='txn_account_date_idx'),
+        ]
+
+    def __str__(self):
+        return self.transaction_id
+
+
+class TransactionRollup(models.Model):
+    """Total cents and transaction count for one item, period and group.
+
+    Kept current by each transactions/sync delta (see rollups), so summaries
+    read one row per period and group rather than every transaction.
+    """
+    PERIOD_DAY = 'day'
+    PERIOD_MONTH = 'month'
+
+    user_id = models.CharField(max_length=64)
+    item_id = models.CharField(max_length=100)
+    period = models.CharField(max_length=5)
+    # The day itself, or the first of the month.
+    period_start = models.DateField()
+    # category, merchant, account or flow (inflow/outflow).
+    dimension = models.CharField(max_length=20)
+    key = models.CharField(max_length=255)
+    cents = models.BigIntegerField(default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user_id', 'dimension', 'period', 'period_start'], name='rollup_user_period_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                # Item first: verify and rebuild read one item's rows.
+                fields=['item_id', 'user_id', 'period', 'period_start', 'dimension', 'key'],
+                name='rollup_unique_group',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id}:{self.period}:{self.period_start}:{self.dimension}:{self.key}'
+
+
+class WebhookJob(models.Model):
+    """Queued webhook work. At most one pending job exists per item and kind,
+    so a burst of webhooks for the same item collapses into a single sync."""
+    KIND_TRANSACTIONS_SYNC = 'transactions_sync'
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    item_id = models.CharField(max_length=100)
+    kind = models.CharField(max_length=50, default=KIND_TRANSACTIONS_SYNC)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    # Webhook codes folded into this job, in arrival order.
+    webhook_codes = models.JSONField(default=list)
+    coalesced_count = models.PositiveIntegerField(default=0)
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField()
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    result = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='webhookjob_status_run_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['item_id', 'kind'],
+                condition=models.Q(status='pending'),
+                name='webhookjob_one_pending_per_item',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.kind}:{self.item_id} ({self.status})'
+
+
+class InstitutionMetadata(models.Model):
+    """Cached /institutions/get_by_id results; names and IDs rarely change."""
+    institution_id = models.CharField(max_length=100, unique=True)
+    name = models.CharField(max_length=255)
+    fetched_at = models.DateTimeField()
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,83 @@
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from . import plaid_init
+
+# Shared by every request in the worker. Calls submitted here must not fan
+# out again, or they could wait on threads that are all busy waiting.
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('MULTI_ITEM_WORKERS', 16)),
+    thread_name_prefix='plaid-item',
+)
+
+
+def item_tag(item):
+    return {'item_id': item.get('item_id'), 'institution_id': item.get('institution_id')}
+
+
+def default_timeout():
+    # Never shorter than PLAID_DEADLINE, or an item still retrying within
+    # its deadline would be reported as timed out.
+    return max(float(os.getenv('MULTI_ITEM_TIMEOUT', 30)), plaid_init.policy.setting('DEADLINE'))
+
+
+def fan_out(items, fn, timeout=None):
+    """Call ``fn(item)`` for every item in parallel.
+
+    Each item gets ``timeout`` seconds (MULTI_ITEM_TIMEOUT, 30 by default
+    and never less than PLAID_DEADLINE); since they run side by side, the
+    call takes as long as the slowest item.
+    Returns ``(results, errors)``: results is a list of ``(item, value)`` in
+    input order for the items that succeeded, errors a list of dicts naming
+    the item that failed or timed out.
+    """
+    if timeout is None:
+        timeout = default_timeout()
+
+    # copy_context() carries the request's timing collector into the worker threads.
+    futures = [(item, _executor.submit(contextvars.copy_context().run, fn, item)) for item in items]
+    wait([f for _, f in futures], timeout=timeout)
+
+    results, errors = [], []
+    for item, future in futures:
+        if not future.done():
+            future.cancel()
+            errors.append({**item_tag(item), 'error': f'Timed out after {timeout:g}s'})
+            continue
+        try:
+            results.append((item, future.result()))
+        except Exception as e:
+            print(f"Plaid call failed for item {item.get('item_id')}: {e}")
+            errors.append({**item_tag(item), 'error': str(e)})
+    return results, errors
+
+
+async def afan_out(items, coro_fn, timeout=None):
+    """Async counterpart of fan_out: awaits ``coro_fn(item)`` for every item
+    with asyncio.gather, each bounded by ``timeout``. Same return shape."""
+    if timeout is None:
+        timeout = default_timeout()
+
+    outcomes = await asyncio.gather(
+        *(asyncio.wait_for(coro_fn(item), timeout) for item in items),
+        return_exceptions=True,
+    )
+
+    results, errors = [], []
+    for item, outcome in zip(items, outcomes):
+        if isinstance(outcome, asyncio.TimeoutError):
+            errors.append({**item_tag(item), 'error': f'Timed out after {timeout:g}s'})
+        elif isinstance(outcome, Exception):
+            print(f"Plaid call failed for item {item.get('item_id')}: {outcome}")
+            errors.append({**item_tag(item), 'error': str(outcome)})
+        else:
+            results.append((item, outcome))
+    return results, errors
+
+
+def tag_rows(item, rows):
+    """Copy rows (dicts) adding the item_id/institution_id they came from."""
+    tag = item_tag(item)
+    return [{**row, **tag} for row in rows]
@@ -0,0 +1,79 @@
+"""The OpenAPI document, built at deploy time and served from a file.
+
+SpectacularAPIView walks every view and serializer to build the schema on
+each request. ``manage.py build_openapi_schema`` writes it once, next to
+collectstatic in the deploy, and CachedSchemaView serves that file instead:
+it is read on the first request and each format (YAML, JSON) is rendered
+once per process. Without the file the schema is generated on first use and
+kept for the life of the process, so local development needs no extra step.
+"""
+import json
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse
+from drf_spectacular.generators import SchemaGenerator
+from drf_spectacular.views import SpectacularAPIView
+from rest_framework.utils.encoders import JSONEncoder
+
+_lock = threading.Lock()
+_schema = None
+_rendered = {}
+
+
+def schema_file():
+    return Path(settings.OPENAPI_SCHEMA_FILE)
+
+
+def generate():
+    return SchemaGenerator().get_schema(request=None, public=True)
+
+
+def dumps(schema):
+    return json.dumps(schema, cls=JSONEncoder, indent=2, ensure_ascii=False) + '\n'
+
+
+def _load():
+    path = schema_file()
+    if path.exists():
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    print(f"OpenAPI schema file {path} not found; generating the schema. Run manage.py build_openapi_schema when deploying.")
+    return json.loads(dumps(generate()))
+
+
+def get_schema():
+    global _schema
+    if _schema is None:
+        with _lock:
+            if _schema is None:
+                _schema = _load()
+    return _schema
+
+
+def reset():
+    """Forget the loaded schema and its renderings, e.g. after rebuilding the file."""
+    global _schema
+    with _lock:
+        _schema = None
+        _rendered.clear()
+
+
+class CachedSchemaView(SpectacularAPIView):
+    """SpectacularAPIView with the same content negotiation, serving the prebuilt schema."""
+
+    def _get_schema_response(self, request):
+        renderer = request.accepted_renderer
+        key = (type(renderer), request.accepted_media_type)
+        content = _rendered.get(key)
+        if content is None:
+            content = renderer.render(get_schema(), request.accepted_media_type, {'request': request})
+            _rendered[key] = content
+
+        content_type = request.accepted_media_type
+        if renderer.charset:
+            content_type = f'{content_type}; charset={renderer.charset}'
+        response = HttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = f'inline; filename="{self._get_filename(request, None)}"'
+        return response
@@ -1,29 +1,156 @@
-
+import asyncio
+import atexit
+import json
 import os
+import threading
+import weakref
+from urllib.parse import urlsplit
+
+import httpx
 import plaid
-from plaid.api import plaid_api
+import urllib3
 
-def get_plaid_client():
+from . import instrumentation, resilience
+
+# One PlaidApi per worker process. urllib3 keeps connections alive inside the
+# pool manager, so reusing the client skips the TLS handshake on every request.
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_float(name, default):
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+# Plaid endpoints that only read, so sending one again is harmless.
+IDEMPOTENT_PATHS = frozenset({
+    '/accounts/get',
+    '/accounts/balance/get',
+    '/institutions/get',
+    '/institutions/get_by_id',
+    '/item/get',
+    '/transactions/get',
+    '/transactions/recurring/get',
+    '/transactions/sync',
+})
+
+
+def plaid_error_code(exc):
+    """error_code from a Plaid error (ApiException or PlaidAsyncError), or None."""
+    body = getattr(exc, 'body', None)
+    if not body:
+        return None
+    try:
+        return json.loads(body).get('error_code')
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+def classify_plaid(exc):
+    """resilience classification of a failed Plaid call."""
+    if isinstance(exc, (plaid.ApiException, PlaidAsyncError)):
+        if exc.status == 429 or plaid_error_code(exc) == 'RATE_LIMIT_EXCEEDED':
+            return resilience.RATE_LIMITED, None
+        # status 0 is how plaid-python reports an SSL failure.
+        if exc.status == 0 or (exc.status or 0) >= 500:
+            return resilience.TRANSIENT, None
+        return None, None
+    if isinstance(exc, (urllib3.exceptions.HTTPError, httpx.TransportError)):
+        return resilience.TRANSIENT, None
+    return None, None
+
+
+policy = resilience.Policy(
+    'plaid', 'PLAID', classify_plaid,
+    deadline=30.0, base_delay=0.2, max_delay=2.0, rate_limit_delay=1.0, cooldown=30.0,
+)
+
+
+def _bounded(timeout, remaining):
+    # Cut a (connect, read) or total timeout down to what the deadline leaves.
+    if timeout is None:
+        return remaining
+    if isinstance(timeout, tuple):
+        return tuple(min(t, remaining) for t in timeout)
+    return min(timeout, remaining)
+
+
+class PooledApiClient(plaid.ApiClient):
+    """ApiClient that runs every call under the Plaid resilience policy.
+
+    Each attempt gets the default (connect, read) timeout, cut short by
+    what is left of PLAID_DEADLINE.
+    """
+
+    def __init__(self, configuration, request_timeout=None):
+        super().__init__(configuration)
+        self.request_timeout = request_timeout
+
+    def call_api(self, resource_path, method, *args, **kwargs):
+        timeout = kwargs.pop('_request_timeout', None) or self.request_timeout
+
+        def attempt(remaining):
+            # Timed here rather than in request() so deserialization is included.
+            with instrumentation.timed('plaid', resource_path):
+                return plaid.ApiClient.call_api(
+                    self, resource_path, method, *args, _request_timeout=_bounded(timeout, remaining), **kwargs
+                )
+
+        return resilience.call(policy, attempt, idempotent=resource_path in IDEMPOTENT_PATHS)
+
+    def request(self, method, url, *args, **kwargs):
+        if kwargs.get('_request_timeout') is None:
+            kwargs['_request_timeout'] = self.request_timeout
+        response = super().request(method, url, *args, **kwargs)
+        if isinstance(response.data, bytes):
+            instrumentation.record_size('plaid', urlsplit(url).path, len(response.data))
+        return response
+
+
+def _credentials():
     client_id = os.getenv('PLAID_CLIENT_ID')
     secret = os.getenv('PLAID_SECRET')
-    environment = os.getenv('PLAID_ENV', 'sandbox')
 
     if not client_id or not secret:
         raise ValueError("Missing PLAID_CLIENT_ID or PLAID_SECRET in environment")
+    return client_id, secret
 
-    # Debug print: Remove this once it works!
-    print(f"Loading Plaid with Client ID: {client_id}")
 
+def plaid_host():
+    # PLAID_HOST points the clients at another base URL, e.g. the local
+    # stand-in used by the benchmarks.
+    override = os.getenv('PLAID_HOST')
+    if override:
+        return override.rstrip('/')
 
+    environment = os.getenv('PLAID_ENV', 'sandbox')
 
     if environment == 'sandbox':
-        host = plaid.Environment.Sandbox
+        return plaid.Environment.Sandbox
     elif environment == 'development':
-        host = plaid.Environment.Development
+        return plaid.Environment.Development
     elif environment == 'production':
-        host = plaid.Environment.Production
-    else:
-        host = plaid.Environment.Sandbox
+        return plaid.Environment.Production
+    return plaid.Environment.Sandbox
+
+
+def _request_timeout():
+    return (
+        _env_float('PLAID_CONNECT_TIMEOUT', 5.0),
+        _env_float('PLAID_READ_TIMEOUT', 30.0),
+    )
+
+
+def _build_plaid_client():
+    client_id, secret = _credentials()
+    host = plaid_host()
 
     configuration = plaid.Configuration(
         host=host,
@@ -32,6 +159,137 @@ def get_plaid_client():
             'secret': secret,
         }
     )
-    api_client = plaid.ApiClient(configuration)
-    client = plaid_api.PlaidApi(api_client)
+    # Max keep-alive connections to Plaid per worker; size it to the number of
+    # threads that may call Plaid at once.
+    configuration.connection_pool_maxsize = _env_int('PLAID_POOL_MAXSIZE', 10)
+    # Retries are up to resilience; urllib3's own would multiply them.
+    configuration.retries = 0
+
+    # plaid_api imports every request and response model Plaid has (several
+    # hundred modules), so it is loaded on the first client build rather
+    # than when a worker boots.
+    from plaid.api import plaid_api
+
+    api_client = PooledApiClient(configuration, request_timeout=_request_timeout())
+    return plaid_api.PlaidApi(api_client)
+
+
+def get_plaid_client():
+    """Return the shared PlaidApi client for this worker, creating it on first use."""
+    global _client, _client_pid
+
+    pid = os.getpid()
+    client = _client
+    if client is not None and _client_pid == pid:
+        return client
+
+    with _client_lock:
+        # A client inherited across fork() would share sockets with the parent.
+        if _client is None or _client_pid != pid:
+            _client = _build_plaid_client()
+            _client_pid = pid
+        return _client
+
+
+def close_plaid_client():
+    """Drop the shared client and close its pooled connections."""
+    global _client, _client_pid
+
+    with _client_lock:
+        client, _client, _client_pid = _client, None, None
+
+    if client is None:
+        return
+    api_client = client.api_client
+    api_client.rest_client.pool_manager.clear()
+    api_client.close()
+
+
+atexit.register(close_plaid_client)
+
+
+class PlaidAsyncError(Exception):
+    """Plaid error response from AsyncPlaidClient; mirrors plaid.ApiException."""
+
+    def __init__(self, status, body):
+        self.status = status
+        self.body = body
+        try:
+            self.error = json.loads(body)
+        except ValueError:
+            self.error = {}
+        self.error_code = self.error.get('error_code')
+        super().__init__(f"({status}) {self.error.get('error_message') or body}")
+
+
+class AsyncPlaidClient:
+    """Minimal async Plaid client for the ASGI views.
+
+    Talks to the Plaid JSON API over a pooled httpx.AsyncClient and returns
+    plain dicts, i.e. what ``PlaidApi`` responses give from ``to_dict()``.
+    """
+
+    def __init__(self, host, client_id, secret):
+        connect_timeout, read_timeout = _request_timeout()
+        max_connections = _env_int('PLAID_POOL_MAXSIZE', 10)
+        self.client_id = client_id
+        self.secret = secret
+        self.http = httpx.AsyncClient(
+            base_url=host,
+            headers={'Plaid-Version': '2020-09-14'},
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        )
+
+    async def post(self, path, body):
+        payload = {'client_id': self.client_id, 'secret': self.secret, **body}
+        connect_timeout, read_timeout = _request_timeout()
+
+        async def attempt(remaining):
+            timeout = httpx.Timeout(min(read_timeout, remaining), connect=min(connect_timeout, remaining))
+            with instrumentation.timed('plaid', path):
+                response = await self.http.post(path, json=payload, timeout=timeout)
+            instrumentation.record_size('plaid', path, len(response.content))
+            if response.status_code >= 400:
+                raise PlaidAsyncError(response.status_code, response.text)
+            return response.json()
+
+        return await resilience.acall(policy, attempt, idempotent=path in IDEMPOTENT_PATHS)
+
+    async def accounts_get(self, access_token):
+        return await self.post('/accounts/get', {'access_token': access_token})
+
+    async def accounts_balance_get(self, access_token):
+        return await self.post('/accounts/balance/get', {'access_token': access_token})
+
+    async def transactions_recurring_get(self, access_token):
+        return await self.post('/transactions/recurring/get', {'access_token': access_token})
+
+    async def transactions_refresh(self, access_token):
+        return await self.post('/transactions/refresh', {'access_token': access_token})
+
+    async def aclose(self):
+        await self.http.aclose()
+
+
+# httpx.AsyncClient connections belong to the event loop that opened them,
+# so async clients are kept per loop rather than per process.
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_plaid_client():
+    """Return the AsyncPlaidClient for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client_id, secret = _credentials()
+        client = AsyncPlaidClient(plaid_host(), client_id, secret)
+        _async_clients[loop] = client
     return client
+
+
+async def aclose_plaid_client():
+    """Close the running loop's async client; call from ASGI lifespan shutdown."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
@@ -0,0 +1,131 @@
+import os
+import threading
+
+from django.core.cache import cache
+
+from .plaid_init import get_plaid_client
+from . import conditional, resilience, single_flight, upcoming_index
+
+CACHE_PREFIX = 'recurring-streams:'
+# Last streams fetched per item, kept past expiry and invalidation for when Plaid is down.
+STALE_PREFIX = 'recurring-streams-stale:'
+
+_stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'stale': 0}
+_stats_lock = threading.Lock()
+
+
+def _ttl():
+    return int(os.getenv('RECURRING_CACHE_TTL', 6 * 60 * 60))
+
+
+def _stale_ttl():
+    return int(os.getenv('RECURRING_STALE_TTL', 7 * 24 * 60 * 60))
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def cache_key(item_id):
+    return f'{CACHE_PREFIX}{item_id}'
+
+
+def stale_key(item_id):
+    return f'{STALE_PREFIX}{item_id}'
+
+
+def _serve_stale(item_id, error, stale):
+    if stale is None or not resilience.serve_stale(error):
+        return None
+    _count('stale')
+    print(f"Serving stale recurring streams for item {item_id}: {error}")
+    return stale
+
+
+def _entry(response):
+    inflow_streams = response.get('inflow_streams', [])
+    outflow_streams = response.get('outflow_streams', [])
+    return {
+        'inflow_streams': inflow_streams,
+        'outflow_streams': outflow_streams,
+        # Rebuilt with every refill, so it always matches the cached streams.
+        'upcoming': upcoming_index.build(outflow_streams),
+        # Content hash: a refill that brings back the same streams keeps the
+        # version, so ETags built from it still match.
+        'version': conditional.fingerprint([inflow_streams, outflow_streams]),
+    }
+
+
+def get_recurring_streams(item_id, access_token, client=None):
+    """Inflow and outflow streams for an item, from cache or transactions/recurring/get.
+
+    Returns a dict with 'inflow_streams', 'outflow_streams', the item's
+    'upcoming' index (see upcoming_index) and a content 'version'. Entries live
+    for RECURRING_CACHE_TTL seconds unless a webhook invalidates them first.
+    Concurrent misses for one item share a single Plaid call. While Plaid
+    is down or rate limiting, the last streams fetched are returned instead,
+    for up to RECURRING_STALE_TTL seconds.
+    """
+    key = cache_key(item_id)
+    streams = cache.get(key)
+    if streams is not None:
+        _count('hits')
+        return streams
+
+    _count('misses')
+    from plaid.model.transactions_recurring_get_request import TransactionsRecurringGetRequest
+
+    client = client or get_plaid_client()
+
+    def fetch():
+        response = client.transactions_recurring_get(TransactionsRecurringGetRequest(access_token=access_token)).to_dict()
+        streams = _entry(response)
+        cache.set(key, streams, _ttl())
+        cache.set(stale_key(item_id), streams, _stale_ttl())
+        return streams
+
+    try:
+        return single_flight.call(f'transactions_recurring_get:{item_id}', fetch, lambda: cache.get(key))
+    except Exception as e:
+        stale = _serve_stale(item_id, e, cache.get(stale_key(item_id)))
+        if stale is None:
+            raise
+        return stale
+
+
+async def aget_recurring_streams(item_id, access_token, client):
+    """Async get_recurring_streams for the ASGI views; ``client`` is an AsyncPlaidClient."""
+    key = cache_key(item_id)
+    streams = await cache.aget(key)
+    if streams is not None:
+        _count('hits')
+        return streams
+
+    _count('misses')
+
+    async def fetch():
+        response = await client.transactions_recurring_get(access_token)
+        streams = _entry(response)
+        await cache.aset(key, streams, _ttl())
+        await cache.aset(stale_key(item_id), streams, _stale_ttl())
+        return streams
+
+    try:
+        return await single_flight.acall(f'transactions_recurring_get:{item_id}', fetch, lambda: cache.aget(key))
+    except Exception as e:
+        stale = _serve_stale(item_id, e, await cache.aget(stale_key(item_id)))
+        if stale is None:
+            raise
+        return stale
+
+
+def invalidate(item_id):
+    cache.delete(cache_key(item_id))
+    _count('invalidations')
+
+
+def stats():
+    """Hit/miss/invalidation/stale counters for this worker process."""
+    with _stats_lock:
+        return dict(_stats)
@@ -0,0 +1,33 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer, BrowsableAPIRenderer, JSONRenderer
+
+from . import instrumentation
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Newline-delimited JSON. Selected with ?format=ndjson or
+    Accept: application/x-ndjson; streaming views return their own
+    StreamingHttpResponse and only use this for content negotiation."""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        rows = data if isinstance(data, list) else [data]
+        return ''.join(json.dumps(row, cls=DjangoJSONEncoder) + '\n' for row in rows).encode(self.charset)
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """JSONRenderer that reports its time under "render" in Server-Timing."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with instrumentation.timed('render', 'json'):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class TimedBrowsableAPIRenderer(BrowsableAPIRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with instrumentation.timed('render', 'browsable_api'):
+            return super().render(data, accepted_media_type, renderer_context)
@@ -0,0 +1,252 @@
+"""Deadlines, retries and circuit breakers for calls to Plaid and Supabase.
+
+Each upstream has a Policy, and every call to it goes through ``call`` (or
+``acall``):
+
+- The call must finish within the policy's deadline (PLAID_DEADLINE,
+  SUPABASE_DEADLINE), retries included. Each attempt's timeout is cut to
+  the time that is left.
+- Idempotent calls that fail transiently (timeouts, dropped connections,
+  5xx) are retried up to *_MAX_ATTEMPTS times with full-jitter exponential
+  backoff. Other calls are tried once, since retrying a POST could link an
+  item or create a transaction twice.
+- A rate-limit response (Plaid's RATE_LIMIT_EXCEEDED, or HTTP 429) is
+  retried after a longer backoff, or after Retry-After when one is sent,
+  provided the deadline allows. It does not count against the breaker,
+  because the upstream is limiting us, not failing.
+- After *_BREAKER_THRESHOLD transient failures in a row the breaker opens.
+  For *_BREAKER_COOLDOWN seconds calls then fail at once with
+  UpstreamUnavailable. After that one probe call is let through, and its
+  outcome closes the breaker or opens it again.
+
+Breaker state is per worker process, like the metrics in instrumentation.
+Callers that hold a cache answer from it when ``serve_stale(exc)`` says a
+failure is the upstream's.
+"""
+import asyncio
+import math
+import os
+import random
+import threading
+import time
+
+from . import instrumentation
+
+TRANSIENT = 'transient'
+RATE_LIMITED = 'rate_limited'
+
+# Floor for an attempt's timeout, so a nearly spent deadline still gets one real try.
+MIN_TIMEOUT = 0.5
+
+_policies = {}
+
+
+def _env_float(name, default):
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+class UpstreamUnavailable(Exception):
+    """The upstream's circuit is open, so the call was not made."""
+
+    def __init__(self, upstream, retry_after):
+        self.upstream = upstream
+        self.retry_after = retry_after
+        super().__init__(f'{upstream} is unavailable; retry in {math.ceil(retry_after)}s')
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, threshold, cooldown):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise UpstreamUnavailable unless a call may go out now."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            remaining = self.opened_at + self.cooldown() - time.monotonic()
+            if self.state == self.OPEN and remaining <= 0:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+        instrumentation.circuit_rejections.inc(kind=self.name)
+        raise UpstreamUnavailable(self.name, max(remaining, 1))
+
+    def succeeded(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def failed(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold():
+                if self.state != self.OPEN:
+                    print(f"Circuit for {self.name} opened after {self.failures} failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+    def abandoned(self):
+        # The call was cancelled before it finished; let another probe through.
+        with self._lock:
+            self._probing = False
+
+    def is_open(self):
+        return self.state == self.OPEN
+
+    def snapshot(self):
+        with self._lock:
+            return {'state': self.state, 'failures': self.failures}
+
+
+class Policy:
+    """Deadline, retry and breaker settings for one upstream.
+
+    ``classify(exc)`` returns ``(kind, retry_after)``: kind is TRANSIENT,
+    RATE_LIMITED or None for failures that are the caller's own (bad
+    input, an expired item), and retry_after is the upstream's hint in
+    seconds, if it sent one. Settings are read from ``<prefix>_*``
+    environment variables on every call.
+    """
+
+    def __init__(self, name, prefix, classify, deadline, base_delay, max_delay, rate_limit_delay, cooldown):
+        self.name = name
+        self.prefix = prefix
+        self.classify = classify
+        self._defaults = {
+            'DEADLINE': deadline,
+            'MAX_ATTEMPTS': 3,
+            'RETRY_BASE': base_delay,
+            'RETRY_MAX': max_delay,
+            'RATE_LIMIT_BACKOFF': rate_limit_delay,
+            'BREAKER_THRESHOLD': 5,
+            'BREAKER_COOLDOWN': cooldown,
+        }
+        self.breaker = CircuitBreaker(
+            name,
+            threshold=lambda: int(self.setting('BREAKER_THRESHOLD')),
+            cooldown=lambda: self.setting('BREAKER_COOLDOWN'),
+        )
+        _policies[name] = self
+
+    def setting(self, name):
+        return _env_float(f'{self.prefix}_{name}', self._defaults[name])
+
+
+def backoff(attempt, base, cap):
+    """Full jitter: uniform over [0, min(cap, base * 2**(attempt - 1))]."""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+def _retry_delay(policy, exc, attempt, idempotent, deadline):
+    """Record ``exc`` with the breaker; seconds to wait before the next attempt, or None."""
+    kind, hint = policy.classify(exc)
+    if kind == TRANSIENT:
+        policy.breaker.failed()
+    else:
+        # Any answer from the upstream, even a refusal, shows it is up.
+        policy.breaker.succeeded()
+
+    if kind is None or not idempotent or attempt >= policy.setting('MAX_ATTEMPTS') or policy.breaker.is_open():
+        return None
+    if kind == RATE_LIMITED:
+        delay = hint if hint is not None else backoff(attempt, policy.setting('RATE_LIMIT_BACKOFF'), policy.setting('RATE_LIMIT_BACKOFF') * 8)
+    else:
+        delay = backoff(attempt, policy.setting('RETRY_BASE'), policy.setting('RETRY_MAX'))
+    if time.monotonic() + delay + MIN_TIMEOUT > deadline:
+        return None
+    instrumentation.upstream_retries.inc(kind=policy.name, reason=kind)
+    return delay
+
+
+def call(policy, fn, idempotent=False):
+    """``fn(timeout)`` under ``policy``, where ``timeout`` is the seconds left before the deadline.
+
+    Raises UpstreamUnavailable while the breaker is open, otherwise the
+    last attempt's exception once retries are used up.
+    """
+    deadline = time.monotonic() + policy.setting('DEADLINE')
+    attempt = 0
+    while True:
+        attempt += 1
+        policy.breaker.before_call()
+        try:
+            result = fn(max(deadline - time.monotonic(), MIN_TIMEOUT))
+        except Exception as e:
+            delay = _retry_delay(policy, e, attempt, idempotent, deadline)
+            if delay is None:
+                raise
+        except BaseException:
+            policy.breaker.abandoned()
+            raise
+        else:
+            policy.breaker.succeeded()
+            return result
+        time.sleep(delay)
+
+
+async def acall(policy, fn, idempotent=False):
+    """Async ``call``: ``fn(timeout)`` returns an awaitable."""
+    deadline = time.monotonic() + policy.setting('DEADLINE')
+    attempt = 0
+    while True:
+        attempt += 1
+        policy.breaker.before_call()
+        try:
+            result = await fn(max(deadline - time.monotonic(), MIN_TIMEOUT))
+        except Exception as e:
+            delay = _retry_delay(policy, e, attempt, idempotent, deadline)
+            if delay is None:
+                raise
+        except BaseException:
+            policy.breaker.abandoned()
+            raise
+        else:
+            policy.breaker.succeeded()
+            return result
+        await asyncio.sleep(delay)
+
+
+def classify(exc):
+    """(policy, kind, retry_after) for the first upstream that recognises ``exc``, else (None, None, None)."""
+    for policy in _policies.values():
+        kind, hint = policy.classify(exc)
+        if kind is not None:
+            return policy, kind, hint
+    return None, None, None
+
+
+def serve_stale(exc):
+    """True when ``exc`` is an upstream outage or rate limit, so cached data beats an error."""
+    return isinstance(exc, UpstreamUnavailable) or classify(exc)[1] is not None
+
+
+def retry_after(exc):
+    """Whole seconds a client should wait before retrying, or None if ``exc`` is not the upstream's fault."""
+    if isinstance(exc, UpstreamUnavailable):
+        return math.ceil(exc.retry_after)
+    policy, kind, hint = classify(exc)
+    if kind is None:
+        return None
+    if hint is None:
+        hint = policy.setting('RATE_LIMIT_BACKOFF' if kind == RATE_LIMITED else 'RETRY_MAX')
+    return max(1, math.ceil(hint))
+
+
+def stats():
+    """Breaker state per upstream for this worker process."""
+    return {name: policy.breaker.snapshot() for name, policy in _policies.items()}
@@ -0,0 +1,206 @@
+"""Per-item daily and monthly totals, maintained from transactions/sync deltas.
+
+A TransactionRollup row holds total cents and a transaction count for one
+item, one day or month, and one group. The groups are a transaction's
+category, merchant and account, and its flow: inflow (income, refunds) or
+outflow. Every transaction counts once per dimension and period.
+
+apply_sync_delta calls ``apply_delta`` in the same database transaction
+as its writes. Additions add, removals subtract, and a modification
+subtracts the stored version and adds the new one. The net change per
+group is added in the database by one upsert, so a page costs the same
+however long the history is. Each sync page locks the item's
+PlaidItemSyncState row while it writes (sync_engine._checkpoint), and a
+rebuild holds the same row lock, so the two never interleave even across
+processes. The cache lease (sync_engine.item_lease) only keeps them apart
+within one process under the local-memory cache.
+
+``verify`` recomputes an item's rollups from its transactions and reports
+the groups that differ; ``rebuild`` also repairs them. Both run from the
+rebuild_rollups management command.
+"""
+from django.db import connection, transaction
+from django.db.models import BigIntegerField, Case, Count, F, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, NullIf, Round
+
+from .models import PlaidItemSyncState, PlaidTransaction, TransactionRollup
+
+# Group key per dimension, as an expression over PlaidTransaction.
+DIMENSIONS = {
+    'category': Coalesce('category_primary', Value('UNCATEGORIZED')),
+    'merchant': Coalesce(NullIf('merchant_name', Value('')), 'name'),
+    'account': F('account_id'),
+    'flow': Case(When(amount__lt=0, then=Value('inflow')), default=Value('outflow')),
+}
+GROUP_FIELDS = ('user_id', 'item_id', 'period', 'period_start', 'dimension', 'key')
+# Columns of PlaidTransaction that group_keys and the amounts read.
+TRANSACTION_FIELDS = ('transaction_id', 'user_id', 'item_id', 'account_id', 'date', 'name', 'merchant_name', 'amount', 'category_primary')
+BULK_BATCH_SIZE = 500
+
+
+def group_keys(row):
+    """Each dimension's key for a PlaidTransaction, the same as DIMENSIONS gives in SQL."""
+    return {
+        'category': row.category_primary if row.category_primary is not None else 'UNCATEGORIZED',
+        'merchant': row.merchant_name or row.name,
+        'account': row.account_id,
+        'flow': 'inflow' if row.amount < 0 else 'outflow',
+    }
+
+
+def _periods(day):
+    return ((TransactionRollup.PERIOD_DAY, day), (TransactionRollup.PERIOD_MONTH, day.replace(day=1)))
+
+
+def _add(totals, user_id, item_id, day, dimension, key, cents, count):
+    for period, start in _periods(day):
+        entry = totals.setdefault((user_id, item_id, period, start, dimension, key), [0, 0])
+        entry[0] += cents
+        entry[1] += count
+
+
+def _accumulate(totals, rows, sign):
+    for row in rows:
+        cents = int(row.amount * 100)
+        for dimension, key in group_keys(row).items():
+            _add(totals, row.user_id, row.item_id, row.date, dimension, key, sign * cents, sign)
+    return totals
+
+
+def _group(rollup):
+    return tuple(getattr(rollup, field) for field in GROUP_FIELDS)
+
+
+def _write(changes, existing):
+    """Set each group in ``changes`` to its (cents, count); a group at zero is deleted."""
+    created, updated, emptied = [], [], []
+    for group, (cents, count) in changes.items():
+        rollup = existing.get(group)
+        if rollup is None:
+            if cents or count:
+                created.append(TransactionRollup(**dict(zip(GROUP_FIELDS, group)), cents=cents, count=count))
+        elif cents or count:
+            rollup.cents, rollup.count = cents, count
+            updated.append(rollup)
+        else:
+            emptied.append(rollup.pk)
+    if created:
+        TransactionRollup.objects.bulk_create(created, batch_size=BULK_BATCH_SIZE)
+    if updated:
+        TransactionRollup.objects.bulk_update(updated, ['cents', 'count'], batch_size=BULK_BATCH_SIZE)
+    if emptied:
+        TransactionRollup.objects.filter(pk__in=emptied).delete()
+    return len(created) + len(updated) + len(emptied)
+
+
+def _increment_sql():
+    # Django's upserts overwrite on conflict; rollups must add to what is there.
+    quote = connection.ops.quote_name
+    table = quote(TransactionRollup._meta.db_table)
+    columns = [quote(field) for field in (*GROUP_FIELDS, 'cents', 'count')]
+    return (
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))}) "
+        f"ON CONFLICT ({', '.join(columns[:len(GROUP_FIELDS)])}) DO UPDATE SET "
+        f"{quote('cents')} = {table}.{quote('cents')} + excluded.{quote('cents')}, "
+        f"{quote('count')} = {table}.{quote('count')} + excluded.{quote('count')}"
+    )
+
+
+def apply_delta(before, after):
+    """Move the rollups from the ``before`` versions of some transactions to their ``after`` versions.
+
+    ``before`` are the stored rows a delta replaces or removes, ``after``
+    the rows it writes. Each moved group is incremented in place with one
+    upsert; groups left at zero are deleted. Returns the number of groups moved.
+    """
+    deltas = _accumulate(_accumulate({}, before, -1), after, 1)
+    deltas = {group: delta for group, delta in deltas.items() if delta != [0, 0]}
+    if not deltas:
+        return 0
+    adapt = connection.ops.adapt_datefield_value
+    with connection.cursor() as cursor:
+        cursor.executemany(_increment_sql(), [
+            (user_id, item_id, period, adapt(start), dimension, key, cents, count)
+            for (user_id, item_id, period, start, dimension, key), (cents, count) in deltas.items()
+        ])
+    shrunk = [group for group, (_, count) in deltas.items() if count < 0]
+    if shrunk:
+        TransactionRollup.objects.filter(
+            item_id__in={group[1] for group in shrunk},
+            period_start__in={group[3] for group in shrunk},
+            cents=0,
+            count=0,
+        ).delete()
+    return len(deltas)
+
+
+def expected(item_id):
+    """An item's rollups recomputed from its transactions: {group: [cents, count]}."""
+    totals = {}
+    transactions = PlaidTransaction.objects.filter(item_id=item_id)
+    for dimension, expression in DIMENSIONS.items():
+        rows = (
+            transactions
+            .annotate(group_key=expression)
+            .values('user_id', 'date', 'group_key')
+            .annotate(cents=Sum(Cast(Round(F('amount') * 100), BigIntegerField())), transactions=Count('*'))
+            .order_by()
+            .values_list('user_id', 'date', 'group_key', 'cents', 'transactions')
+        )
+        for user_id, day, key, cents, count in rows:
+            _add(totals, user_id, item_id, day, dimension, key, cents, count)
+    return totals
+
+
+def _compare(item_id):
+    # (changes that would make the stored rollups match, the stored rows by group)
+    existing = {_group(rollup): rollup for rollup in TransactionRollup.objects.filter(item_id=item_id)}
+    wanted = expected(item_id)
+    changes = {
+        group: tuple(totals)
+        for group, totals in wanted.items()
+        if group not in existing or (existing[group].cents, existing[group].count) != tuple(totals)
+    }
+    changes.update({group: (0, 0) for group in existing if group not in wanted})
+    return changes, existing
+
+
+def _drift(changes, existing):
+    return [
+        {
+            **dict(zip(GROUP_FIELDS, group)),
+            'stored': (existing[group].cents, existing[group].count) if group in existing else None,
+            'expected': totals if any(totals) else None,
+        }
+        for group, totals in changes.items()
+    ]
+
+
+def verify(item_id):
+    """Groups whose stored totals differ from the item's transactions, as dicts with 'stored' and 'expected' (cents, count)."""
+    return _drift(*_compare(item_id))
+
+
+def rebuild(item_id):
+    """Repair an item's rollups from its transactions. Returns the groups that had drifted, as ``verify`` does."""
+    with transaction.atomic():
+        # The row a sync page locks while it writes; holding it keeps syncs
+        # in other processes from moving the rollups mid-rebuild.
+        list(PlaidItemSyncState.objects.select_for_update().filter(item_id=item_id))
+        changes, existing = _compare(item_id)
+        drift = _drift(changes, existing)
+        _write(changes, existing)
+    return drift
+
+
+def item_ids(user_id=None):
+    """Items with transactions or rollups, optionally only the user's."""
+    transactions = PlaidTransaction.objects.all()
+    rollups = TransactionRollup.objects.all()
+    if user_id:
+        transactions = transactions.filter(user_id=user_id)
+        rollups = rollups.filter(user_id=user_id)
+    return sorted(
+        set(transactions.order_by().values_list('item_id', flat=True).distinct())
+        | set(rollups.order_by().values_list('item_id', flat=True).distinct())
+    )
@@ -0,0 +1,116 @@
+"""Bulk loading of sandbox transactions from CSV or NDJSON.
+
+Rows are validated together with SandboxTransactionCreateSerializer and sent
+to /sandbox/transactions/create in batches of the most Plaid accepts per
+request, several batches at a time.
+"""
+import csv
+import io
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date
+
+from .plaid_init import get_plaid_client
+from .serializers import SandboxTransactionCreateSerializer
+
+# /sandbox/transactions/create takes at most 10 transactions per request.
+PLAID_BATCH_SIZE = 10
+MAX_REPORTED_ERRORS = 100
+
+
+def parse_rows(text, fmt):
+    """Rows as dicts from CSV (with a header line) or NDJSON text."""
+    if fmt == 'csv':
+        return [
+            {k: v for k, v in row.items() if v not in (None, '')}
+            for row in csv.DictReader(io.StringIO(text))
+        ]
+    if fmt == 'ndjson':
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    raise ValueError(f'Unsupported format {fmt!r}; use csv or ndjson')
+
+
+def validate_rows(rows):
+    """Validate every row in one serializer pass.
+
+    Returns ``(validated, errors)``; errors name the 1-based row number and
+    are capped at MAX_REPORTED_ERRORS. Nothing should be sent unless errors
+    is empty.
+    """
+    serializer = SandboxTransactionCreateSerializer(data=rows, many=True)
+    if serializer.is_valid():
+        return serializer.validated_data, []
+    row_errors = serializer.errors
+    # Recent DRF versions report only the failing rows, keyed by index.
+    if isinstance(row_errors, dict):
+        row_errors = sorted(row_errors.items())
+    else:
+        row_errors = enumerate(row_errors)
+    errors = [{'row': index + 1, 'errors': detail} for index, detail in row_errors if detail]
+    return [], errors[:MAX_REPORTED_ERRORS]
+
+
+def build_transactions(validated):
+    from plaid.model.custom_sandbox_transaction import CustomSandboxTransaction
+
+    today = date.today()
+    return [
+        CustomSandboxTransaction(
+            date_transacted=row.get('date_transacted') or today,
+            date_posted=row.get('date_posted') or today,
+            amount=float(row['amount']),
+            description=str(row['description']),
+            iso_currency_code=str(row.get('iso_currency_code') or 'USD'),
+        )
+        for row in validated
+    ]
+
+
+def ingest(access_token, transactions, client=None, concurrency=None, progress=None):
+    """Send ``transactions`` for one item in PLAID_BATCH_SIZE batches.
+
+    Up to ``concurrency`` batches (SANDBOX_INGEST_CONCURRENCY, 4 by default)
+    are in flight at once. ``progress(done, total)`` is called with row
+    counts after each batch. Returns a summary with failed batches listed.
+    """
+    from plaid.model.sandbox_transactions_create_request import SandboxTransactionsCreateRequest
+
+    client = client or get_plaid_client()
+    if concurrency is None:
+        concurrency = int(os.getenv('SANDBOX_INGEST_CONCURRENCY', 4))
+
+    batches = [
+        (start, transactions[start:start + PLAID_BATCH_SIZE])
+        for start in range(0, len(transactions), PLAID_BATCH_SIZE)
+    ]
+
+    def send(batch):
+        client.sandbox_transactions_create(
+            SandboxTransactionsCreateRequest(access_token=access_token, transactions=batch)
+        )
+
+    done = 0
+    failed = []
+    # A private pool: seeding thousands of rows must not occupy the shared
+    # multi_item workers that serve user requests.
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='sandbox-ingest') as executor:
+        futures = {executor.submit(send, batch): (start, batch) for start, batch in batches}
+        for future in as_completed(futures):
+            start, batch = futures[future]
+            try:
+                future.result()
+                done += len(batch)
+            except Exception as e:
+                print(f"Sandbox batch at row {start + 1} failed: {e}")
+                failed.append({'first_row': start + 1, 'rows': len(batch), 'error': str(e)})
+            if progress is not None:
+                progress(done, len(transactions))
+
+    failed.sort(key=lambda f: f['first_row'])
+    return {
+        'submitted': done,
+        'total': len(transactions),
+        'batches': len(batches),
+        'failed_batches': failed,
+    }
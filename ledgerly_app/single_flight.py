@@ -0,0 +1,201 @@
+"""Coalescing of identical concurrent upstream calls, and per-key leases.
+
+``call(key, fn, peek)``: while a call for ``key`` is in flight, later
+callers wait for it and get its result (or exception) rather than making
+their own. Keys name the Plaid method and the item, e.g.
+``transactions_recurring_get:<item_id>``. Within a process the followers
+wait on an event. Other worker processes see a lease in the Django cache
+and wait for the leader's result to appear in the cache, which is what
+``peek()`` reads. ``acall`` is the same for coroutines on one event loop.
+
+``lease(key)`` is a lock held in the cache, for work that must not overlap
+at all, such as advancing an item's sync cursor.
+
+Leases live in the Django cache, so they span every worker when REDIS_URL is
+set and the threads of one process with the default local-memory cache.
+"""
+import asyncio
+import os
+import threading
+import time
+import uuid
+import weakref
+from contextlib import contextmanager
+
+from django.core.cache import cache
+
+LEASE_PREFIX = 'lease:'
+POLL_INTERVAL = 0.05
+
+
+class LeaseTimeout(Exception):
+    """The lease stayed with another holder for longer than the caller would wait."""
+
+
+_stats = {'calls': 0, 'shared': 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def _wait_seconds():
+    # Long enough to cover a slow Plaid call; a follower then makes its own.
+    return float(os.getenv('SINGLE_FLIGHT_WAIT', 15))
+
+
+class Group:
+    """Callers sharing a key while one call is in flight get that call's outcome."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {'done': threading.Event(), 'result': None, 'error': None}
+        _count('calls' if leader else 'shared')
+
+        if not leader:
+            call['done'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+
+        try:
+            call['result'] = fn()
+        except BaseException as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['done'].set()
+        return call['result']
+
+
+class AsyncGroup:
+    """Group for coroutines. In-flight calls are kept per event loop."""
+
+    def __init__(self):
+        self._calls = weakref.WeakKeyDictionary()
+
+    async def do(self, key, fn):
+        calls = self._calls.setdefault(asyncio.get_running_loop(), {})
+        task = calls.get(key)
+        _count('calls' if task is None else 'shared')
+        if task is None:
+            task = calls[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda _: calls.pop(key, None))
+        # A cancelled follower must not cancel the call the others wait on.
+        return await asyncio.shield(task)
+
+
+flights = Group()
+aflights = AsyncGroup()
+
+
+class Lease:
+    def __init__(self, key, ttl):
+        self.key = f'{LEASE_PREFIX}{key}'
+        self.ttl = ttl
+        self.token = uuid.uuid4().hex
+
+    def try_acquire(self):
+        return cache.add(self.key, self.token, self.ttl)
+
+    async def atry_acquire(self):
+        return await cache.aadd(self.key, self.token, self.ttl)
+
+    def refresh(self):
+        """Push the expiry out by ``ttl``; call it between steps of long work."""
+        cache.touch(self.key, self.ttl)
+
+    def release(self):
+        # Only drop our own lease: if it expired, someone else may hold it now.
+        if cache.get(self.key) == self.token:
+            cache.delete(self.key)
+
+    async def arelease(self):
+        if await cache.aget(self.key) == self.token:
+            await cache.adelete(self.key)
+
+
+@contextmanager
+def lease(key, ttl, wait):
+    """Hold the lease on ``key`` for the block, waiting up to ``wait`` seconds for it.
+
+    The lease expires after ``ttl`` seconds unless refreshed, so a worker
+    that dies while holding it does not block the key forever.
+    """
+    held = Lease(key, ttl)
+    deadline = time.monotonic() + wait
+    while not held.try_acquire():
+        if time.monotonic() >= deadline:
+            raise LeaseTimeout(f'{key} is busy in another worker')
+        time.sleep(POLL_INTERVAL)
+    try:
+        yield held
+    finally:
+        held.release()
+
+
+def _shared(key, fn, peek):
+    held = Lease(key, ttl=_wait_seconds())
+    deadline = time.monotonic() + _wait_seconds()
+    while True:
+        if held.try_acquire():
+            try:
+                return fn()
+            finally:
+                held.release()
+        value = peek()
+        if value is not None:
+            return value
+        if time.monotonic() >= deadline:
+            return fn()
+        time.sleep(POLL_INTERVAL)
+
+
+async def _ashared(key, fn, peek):
+    held = Lease(key, ttl=_wait_seconds())
+    deadline = time.monotonic() + _wait_seconds()
+    while True:
+        if await held.atry_acquire():
+            try:
+                return await fn()
+            finally:
+                await held.arelease()
+        value = await peek()
+        if value is not None:
+            return value
+        if time.monotonic() >= deadline:
+            return await fn()
+        await asyncio.sleep(POLL_INTERVAL)
+
+
+def call(key, fn, peek):
+    """``fn()`` once for all concurrent callers of ``key``.
+
+    ``fn`` must store its result where ``peek()`` finds it, since followers
+    in other workers read it from there. ``peek`` returns None until then.
+    A follower that waits longer than SINGLE_FLIGHT_WAIT makes the call
+    itself.
+    """
+    return flights.do(key, lambda: _shared(key, fn, peek))
+
+
+async def acall(key, fn, peek):
+    """Async ``call``: ``fn`` and ``peek`` are coroutine functions."""
+    return await aflights.do(key, lambda: _ashared(key, fn, peek))
+
+
+def stats():
+    """Calls made and calls that joined one already in flight, for this worker process."""
+    with _stats_lock:
+        return dict(_stats)
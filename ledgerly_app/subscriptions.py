@@ -0,0 +1,140 @@
+"""Subscription classification for recurring outflow streams.
+
+Rules have four parts, all optional:
+
+- ``keywords``: matched case-insensitively anywhere in the stream's category
+  codes, description or merchant name,
+- ``categories``: exact personal finance category codes (primary or detailed),
+- ``allow_merchants``: merchant names that are always subscriptions,
+- ``deny_merchants``: merchant names that never are (wins over everything else).
+
+They come from ``settings.SUBSCRIPTION_RULES`` with the JSON file named by
+SUBSCRIPTION_RULES_FILE layered on top, so merchants can be added without a
+deploy. The file is re-read when it changes.
+"""
+import json
+import os
+import re
+import threading
+
+from django.conf import settings
+
+from . import conditional
+
+# Joins the searched fields so one regex scan covers all of them; it cannot
+# appear in a keyword, so matches never straddle two fields.
+_FIELD_SEPARATOR = '\x1f'
+
+
+def _normalize(name):
+    return ' '.join((name or '').upper().split())
+
+
+class SubscriptionClassifier:
+    """A rule set compiled into one alternation regex plus set lookups.
+
+    Verdicts are memoized by stream_id, up to ``memo_size`` streams.
+    """
+
+    def __init__(self, rules=None, memo_size=4096):
+        rules = rules or {}
+        keywords = sorted({k.upper() for k in rules.get('keywords', []) if k}, key=len, reverse=True)
+        self.pattern = re.compile('|'.join(map(re.escape, keywords)), re.IGNORECASE) if keywords else None
+        self.categories = frozenset(c.upper() for c in rules.get('categories', []))
+        self.allow = frozenset(_normalize(m) for m in rules.get('allow_merchants', []))
+        self.deny = frozenset(_normalize(m) for m in rules.get('deny_merchants', []))
+        self.memo_size = memo_size
+        self._memo = {}
+        # Same rules, same version in every worker; part of the ETag of
+        # responses that classify streams.
+        self.version = conditional.fingerprint(rules)
+
+    def _classify(self, stream):
+        merchant = _normalize(stream.get('merchant_name'))
+        if merchant in self.deny:
+            return False
+        if merchant in self.allow:
+            return True
+
+        primary = stream.get('personal_finance_category_primary') or ''
+        detailed = stream.get('personal_finance_category_detailed') or ''
+        if self.categories and (primary.upper() in self.categories or detailed.upper() in self.categories):
+            return True
+        if self.pattern is None:
+            return False
+        text = _FIELD_SEPARATOR.join((primary, detailed, stream.get('description') or '', merchant))
+        return self.pattern.search(text) is not None
+
+    def is_subscription(self, stream):
+        stream_id = stream.get('stream_id')
+        if stream_id is None:
+            return self._classify(stream)
+
+        verdict = self._memo.get(stream_id)
+        if verdict is None:
+            verdict = self._classify(stream)
+            if len(self._memo) >= self.memo_size:
+                self._memo.clear()
+            self._memo[stream_id] = verdict
+        return verdict
+
+    def select(self, outflow_streams):
+        """Active outflow streams that are subscriptions, in input order."""
+        is_subscription = self.is_subscription
+        return [s for s in outflow_streams if s.get('is_active') and is_subscription(s)]
+
+
+_classifier = None
+_classifier_source = None
+_classifier_lock = threading.Lock()
+
+
+def load_rules():
+    """Rules from settings, overlaid with SUBSCRIPTION_RULES_FILE if set.
+
+    A missing or malformed file is logged and the settings rules are used alone.
+    """
+    rules = dict(getattr(settings, 'SUBSCRIPTION_RULES', None) or {})
+    path = os.getenv('SUBSCRIPTION_RULES_FILE')
+    if path:
+        try:
+            with open(path) as f:
+                rules.update(json.load(f))
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Ignoring subscription rules file {path}: {e}")
+    return rules
+
+
+def _rules_source():
+    path = os.getenv('SUBSCRIPTION_RULES_FILE')
+    if not path:
+        return None
+    try:
+        return path, os.stat(path).st_mtime_ns
+    except OSError:
+        return path, None
+
+
+def get_classifier():
+    """The shared classifier, rebuilt when the rules file changes."""
+    global _classifier, _classifier_source
+
+    source = _rules_source()
+    if _classifier is not None and source == _classifier_source:
+        return _classifier
+
+    with _classifier_lock:
+        if _classifier is None or source != _classifier_source:
+            _classifier = SubscriptionClassifier(
+                load_rules(),
+                memo_size=int(os.getenv('SUBSCRIPTION_MEMO_SIZE', 4096)),
+            )
+            _classifier_source = source
+        return _classifier
+
+
+def reload_rules():
+    """Drop the shared classifier (and its memo) so the next call recompiles."""
+    global _classifier
+    with _classifier_lock:
+        _classifier = None
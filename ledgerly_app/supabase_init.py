@@ -0,0 +1,349 @@
+import asyncio
+import atexit
+import os
+import threading
+import time
+import weakref
+from typing import TYPE_CHECKING
+
+import httpx
+
+from . import instrumentation, resilience
+
+if TYPE_CHECKING:
+    from supabase import AsyncClient, Client
+
+# Supabase clients per worker process, keyed by (url, key). Every client shares
+# a pooled httpx session, so PostgREST and Auth calls reuse open connections.
+_clients = {}
+_clients_pid = None
+_clients_lock = threading.Lock()
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_float(name, default):
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _resolve(url=None, key=None):
+    url = url or os.environ.get("SUPABASE_URL")
+    key = key or os.environ.get("SUPABASE_KEY")
+    if not url or not key:
+        raise ValueError("Missing SUPABASE_URL or SUPABASE_KEY in environment")
+    return url, key
+
+
+def _call_name(request):
+    # "/rest/v1/user_plaid_items" -> "rest/user_plaid_items", "/auth/v1/user" -> "auth/user"
+    parts = [p for p in request.url.path.split('/') if p and p != 'v1']
+    return f"{request.method} {'/'.join(parts)}"
+
+
+def _start_timer(request):
+    request.extensions['ledgerly_started'] = time.perf_counter()
+
+
+def _finish_timer(response):
+    # Runs before the body is read; read it here so the timing includes it.
+    response.read()
+    _record(response)
+
+
+async def _astart_timer(request):
+    _start_timer(request)
+
+
+async def _afinish_timer(response):
+    await response.aread()
+    _record(response)
+
+
+def _record(response):
+    request = response.request
+    name = _call_name(request)
+    started = request.extensions.get('ledgerly_started', time.perf_counter())
+    instrumentation.record('supabase', name, time.perf_counter() - started, failed=response.status_code >= 500)
+    instrumentation.record_size('supabase', name, len(response.content))
+
+
+class _RetryableStatus(Exception):
+    """A 5xx or 429 response, raised inside ResilientTransport so it can be retried."""
+
+    def __init__(self, response):
+        self.response = response
+        super().__init__(f'Supabase returned {response.status_code}')
+
+
+def _retry_after_header(response):
+    try:
+        return float(response.headers['Retry-After'])
+    except (KeyError, ValueError):
+        return None
+
+
+def classify_supabase(exc):
+    """resilience classification of a failed Supabase request."""
+    if isinstance(exc, _RetryableStatus):
+        if exc.response.status_code == 429:
+            return resilience.RATE_LIMITED, _retry_after_header(exc.response)
+        return resilience.TRANSIENT, None
+    if isinstance(exc, httpx.TransportError):
+        return resilience.TRANSIENT, None
+    return None, None
+
+
+policy = resilience.Policy(
+    'supabase', 'SUPABASE', classify_supabase,
+    deadline=10.0, base_delay=0.1, max_delay=1.0, rate_limit_delay=1.0, cooldown=15.0,
+)
+
+# PostgREST reads; writes are sent once.
+_IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+
+
+def _bounded(timeouts, remaining):
+    return {name: remaining if value is None else min(value, remaining) for name, value in timeouts.items()}
+
+
+def _retryable(response):
+    return response.status_code >= 500 or response.status_code == 429
+
+
+class ResilientTransport(httpx.BaseTransport):
+    """Sends each request under the Supabase resilience policy.
+
+    When retries run out on a 5xx or 429 the last response is returned as
+    it is, so the Supabase client reports it as usual. When they run out on
+    a connection failure (or it opens the breaker), ``on_broken`` is called
+    before the error is raised, so the client's owner can swap it out.
+    """
+
+    def __init__(self, transport, on_broken=None):
+        self.transport = transport
+        self.on_broken = on_broken
+
+    def handle_request(self, request):
+        timeouts = dict(request.extensions.get('timeout', {}))
+        failed = []
+
+        def attempt(remaining):
+            while failed:
+                failed.pop().close()
+            request.extensions['timeout'] = _bounded(timeouts, remaining)
+            response = self.transport.handle_request(request)
+            if _retryable(response):
+                failed.append(response)
+                raise _RetryableStatus(response)
+            return response
+
+        try:
+            return resilience.call(policy, attempt, idempotent=request.method in _IDEMPOTENT_METHODS)
+        except _RetryableStatus as e:
+            return e.response
+        except httpx.TransportError:
+            if self.on_broken is not None:
+                self.on_broken()
+            raise
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncResilientTransport(httpx.AsyncBaseTransport):
+    """ResilientTransport for httpx.AsyncClient."""
+
+    def __init__(self, transport, on_broken=None):
+        self.transport = transport
+        self.on_broken = on_broken
+
+    async def handle_async_request(self, request):
+        timeouts = dict(request.extensions.get('timeout', {}))
+        failed = []
+
+        async def attempt(remaining):
+            while failed:
+                await failed.pop().aclose()
+            request.extensions['timeout'] = _bounded(timeouts, remaining)
+            response = await self.transport.handle_async_request(request)
+            if _retryable(response):
+                failed.append(response)
+                raise _RetryableStatus(response)
+            return response
+
+        try:
+            return await resilience.acall(policy, attempt, idempotent=request.method in _IDEMPOTENT_METHODS)
+        except _RetryableStatus as e:
+            return e.response
+        except httpx.TransportError:
+            if self.on_broken is not None:
+                self.on_broken()
+            raise
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def _http_client_options(is_async=False, on_broken=None):
+    max_connections = _env_int('SUPABASE_POOL_MAXSIZE', 20)
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_connections,
+        keepalive_expiry=_env_float('SUPABASE_KEEPALIVE_EXPIRY', 30.0),
+    )
+    if is_async:
+        transport = AsyncResilientTransport(httpx.AsyncHTTPTransport(limits=limits), on_broken)
+    else:
+        transport = ResilientTransport(httpx.HTTPTransport(limits=limits), on_broken)
+    return {
+        'event_hooks': {
+            'request': [_astart_timer if is_async else _start_timer],
+            'response': [_afinish_timer if is_async else _finish_timer],
+        },
+        'transport': transport,
+        'timeout': httpx.Timeout(
+            _env_float('SUPABASE_READ_TIMEOUT', 10.0),
+            connect=_env_float('SUPABASE_CONNECT_TIMEOUT', 5.0),
+        ),
+    }
+
+
+def _build_http_client(on_broken=None):
+    return httpx.Client(**_http_client_options(on_broken=on_broken))
+
+
+def _build_supabase_client(url, key):
+    # supabase (with pydantic and its storage, auth and realtime clients) is
+    # a quarter of a second to import; load it with the first client rather
+    # than on every worker boot.
+    from supabase import ClientOptions, create_client
+
+    def replace():
+        # A request gave up on a dead connection: later ones get a fresh pool.
+        reset_supabase_client(url, key, broken=client)
+
+    options = ClientOptions(
+        # Server-side use only: never keep or refresh a session on the shared client.
+        auto_refresh_token=False,
+        persist_session=False,
+        httpx_client=_build_http_client(on_broken=replace),
+    )
+    client = create_client(url, key, options=options)
+    return client
+
+
+def _close(client):
+    http_client = client.options.httpx_client
+    if http_client is not None:
+        http_client.close()
+
+
+def get_supabase_client(url=None, key=None) -> 'Client':
+    """Return the shared Supabase client for this worker, creating it on first use."""
+    global _clients_pid
+
+    url, key = _resolve(url, key)
+    pid = os.getpid()
+    client = _clients.get((url, key))
+    if client is not None and _clients_pid == pid:
+        return client
+
+    with _clients_lock:
+        # Clients inherited across fork() would share sockets with the parent.
+        if _clients_pid != pid:
+            _clients.clear()
+            _clients_pid = pid
+        client = _clients.get((url, key))
+        if client is None:
+            client = _build_supabase_client(url, key)
+            _clients[(url, key)] = client
+        return client
+
+
+def reset_supabase_client(url=None, key=None, broken=None):
+    """Swap in a fresh shared client.
+
+    With ``broken``, only that client is replaced: when several requests
+    fail on it at once, the first swaps it and the rest keep the new one.
+    The old client is not closed: requests on other threads may still be
+    using it. Its connections go when the last of them drops it.
+    ResilientTransport calls this when a request runs out of retries on
+    a connection failure.
+    """
+    url, key = _resolve(url, key)
+    with _clients_lock:
+        current = _clients.get((url, key))
+        if broken is not None and current is not broken:
+            return current
+        client = _build_supabase_client(url, key)
+        _clients[(url, key)] = client
+    return client
+
+
+def check_supabase_health(url=None, key=None) -> bool:
+    """Ping Supabase Auth over the shared session.
+
+    A ping that fails on a dead connection swaps the client like any other
+    request does (see ResilientTransport).
+    """
+    url, key = _resolve(url, key)
+    client = get_supabase_client(url, key)
+    try:
+        response = client.options.httpx_client.get(
+            f"{url.rstrip('/')}/auth/v1/health",
+            headers={"apikey": key},
+        )
+        return response.status_code == 200
+    except httpx.HTTPError:
+        return False
+
+
+def close_supabase_clients():
+    """Drop every shared client and close its pooled connections."""
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        _close(client)
+
+
+atexit.register(close_supabase_clients)
+
+
+# httpx.AsyncClient connections belong to the event loop that opened them,
+# so async clients are kept per loop rather than per process.
+_async_clients = weakref.WeakKeyDictionary()
+
+
+async def get_async_supabase_client(url=None, key=None) -> 'AsyncClient':
+    """Return the async Supabase client for the running event loop."""
+    url, key = _resolve(url, key)
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get((url, key))
+    if client is None:
+        from supabase import AsyncClientOptions, acreate_client
+
+        def replace():
+            # As for the shared client: the loop's next caller builds a fresh one.
+            if clients.get((url, key)) is client:
+                del clients[(url, key)]
+
+        options = AsyncClientOptions(
+            auto_refresh_token=False,
+            persist_session=False,
+            httpx_client=httpx.AsyncClient(**_http_client_options(is_async=True, on_broken=replace)),
+        )
+        client = await acreate_client(url, key, options=options)
+        clients[(url, key)] = client
+    return client
+
+
+async def aclose_supabase_clients():
+    """Close the running loop's async clients; call from ASGI lifespan shutdown."""
+    clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.options.httpx_client.aclose()
@@ -0,0 +1,162 @@
+import os
+
+import plaid
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import PlaidItemSyncState
+from .plaid_init import get_plaid_client, plaid_error_code
+from . import multi_item, single_flight, transactions_store
+
+SYNC_PAGE_SIZE = 500
+MUTATION_DURING_PAGINATION = 'TRANSACTIONS_SYNC_MUTATION_DURING_PAGINATION'
+# Restarts allowed per sync_item() call before the mutation error is raised.
+MAX_PAGINATION_RESTARTS = 3
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _load_state(user_id, item_id):
+    state, _ = PlaidItemSyncState.objects.get_or_create(item_id=item_id, defaults={'user_id': user_id})
+    return state
+
+
+class SyncSuperseded(Exception):
+    """Another sync of the item advanced its cursor first; this run's page was dropped."""
+
+
+def _checkpoint(user_id, item_id, page, loop_start_cursor, expected_cursor):
+    """Apply one page and advance the stored cursor in a single transaction.
+
+    The item's state row is locked first and the page is only applied if
+    the stored cursor is still ``expected_cursor``, the one this run last
+    stored. Otherwise another run got there first (the cache lease does not
+    span processes with the local-memory cache) and applying the page again
+    would count it twice in the rollups; SyncSuperseded is raised.
+    """
+    with transaction.atomic():
+        state = PlaidItemSyncState.objects.select_for_update().get(item_id=item_id)
+        if state.cursor != (expected_cursor or ''):
+            raise SyncSuperseded(f'Cursor for {item_id} moved during sync')
+        counts = transactions_store.apply_sync_delta(
+            user_id, item_id,
+            added=page.get('added', []),
+            modified=page.get('modified', []),
+            removed=page.get('removed', []),
+            accounts=page.get('accounts', []),
+        )
+        has_more = bool(page.get('has_more'))
+        PlaidItemSyncState.objects.filter(item_id=item_id).update(
+            user_id=user_id,
+            cursor=page.get('next_cursor') or '',
+            pagination_start_cursor=loop_start_cursor if has_more else None,
+            last_synced_at=timezone.now(),
+            updated_at=timezone.now(),
+        )
+    return counts
+
+
+def sync_item(user_id, item_id, access_token, client=None):
+    """Drain transactions/sync for one item until has_more is false.
+
+    Each page is applied and checkpointed atomically, so a crashed sync
+    resumes from the last stored cursor. On
+    TRANSACTIONS_SYNC_MUTATION_DURING_PAGINATION the loop restarts from the
+    cursor it began with, as Plaid requires; re-applying pages is idempotent.
+    Returns totals for the pages applied.
+
+    One sync per item runs at a time, under a lease in the cache. Where the
+    lease does not reach (another process with the local-memory cache),
+    each page checks the stored cursor under a row lock, and a run that
+    finds it moved stops with 'superseded' in its totals. A second
+    caller waits up to SYNC_LOCK_WAIT seconds and then continues from the
+    cursor the first one stored, usually a single page with nothing new. It
+    does not take the first caller's result, because an update that arrived
+    mid-sync may not be in it. Raises single_flight.LeaseTimeout if the
+    wait runs out.
+    """
+    with item_lease(item_id) as held:
+        return _sync_item(user_id, item_id, access_token, client or get_plaid_client(), held)
+
+
+def item_lease(item_id):
+    """The lease held while an item's stored transactions change: by a sync, or a rollup rebuild."""
+    return single_flight.lease(f'transactions_sync:{item_id}', ttl=_env_int('SYNC_LOCK_TTL', 120), wait=_env_int('SYNC_LOCK_WAIT', 60))
+
+
+def bootstrap(user_id, items, client=None):
+    """Each item's stored cursor, first syncing the items never synced before.
+
+    Those syncs run side by side through multi_item.fan_out; each worker
+    thread closes its database connection when its sync is done. Returns
+    ({item_id: cursor}, errors), with None for an item whose sync failed.
+    """
+    cursors = {item['item_id']: transactions_store.get_cursor(item['item_id']) for item in items}
+    unsynced = [item for item in items if cursors[item['item_id']] is None]
+    if not unsynced:
+        return cursors, []
+    client = client or get_plaid_client()
+
+    def sync(item):
+        try:
+            return sync_item(user_id, item['item_id'], item['access_token'], client=client)['next_cursor']
+        finally:
+            close_old_connections()
+
+    results, errors = multi_item.fan_out(unsynced, sync)
+    cursors.update((item['item_id'], cursor) for item, cursor in results)
+    return cursors, errors
+
+
+def _sync_item(user_id, item_id, access_token, client, held):
+    from plaid.model.transactions_sync_request import TransactionsSyncRequest
+
+    state = _load_state(user_id, item_id)
+
+    # A loop interrupted mid-pagination keeps its original start cursor.
+    loop_start_cursor = state.pagination_start_cursor
+    if loop_start_cursor is None:
+        loop_start_cursor = state.cursor
+    cursor = state.cursor
+    # The stored cursor as this run last wrote it; restarts re-read from
+    # loop_start_cursor but the stored one stays where the last page left it.
+    stored_cursor = state.cursor
+
+    totals = {'added': 0, 'modified': 0, 'removed': 0, 'pages': 0, 'restarts': 0}
+    while True:
+        try:
+            request_plaid = TransactionsSyncRequest(
+                access_token=access_token,
+                cursor=cursor or '',
+                count=SYNC_PAGE_SIZE,
+            )
+            page = transactions_store.to_plain_dict(client.transactions_sync(request_plaid))
+        except plaid.ApiException as e:
+            if plaid_error_code(e) != MUTATION_DURING_PAGINATION or totals['restarts'] >= MAX_PAGINATION_RESTARTS:
+                raise
+            totals['restarts'] += 1
+            cursor = loop_start_cursor
+            continue
+
+        try:
+            counts = _checkpoint(user_id, item_id, page, loop_start_cursor, stored_cursor)
+        except SyncSuperseded:
+            # The other run has applied these changes, or will; leave the item to it.
+            print(f"Sync of item {item_id} superseded after {totals['pages']} page(s): another sync moved its cursor")
+            totals['superseded'] = True
+            totals['next_cursor'] = transactions_store.get_cursor(item_id)
+            return totals
+        stored_cursor = page.get('next_cursor') or ''
+        # Long backfills outlive SYNC_LOCK_TTL; keep the lease while pages come in.
+        held.refresh()
+        for key in ('added', 'modified', 'removed'):
+            totals[key] += counts[key]
+        totals['pages'] += 1
+        cursor = page.get('next_cursor')
+
+        if not page.get('has_more'):
+            totals['next_cursor'] = cursor
+            return totals
@@ -1,13 +1,39 @@
-from django.test import TestCase
-from unittest.mock import patch, MagicMock
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase, override_settings
+from unittest.mock import AsyncMock, patch, MagicMock
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db.models import QuerySet
+from django.http import HttpResponse, StreamingHttpResponse
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.test import APIClient
-from rest_framework import status
+from rest_framework import exceptions, status
 import os
 
+import io
+import json
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+import brotli
+import gzip
+import httpx
+import jwt
+import plaid
+
+from . import analytics, authentication, balance_cache, compression, forecast, instrumentation, item_directory, openapi, multi_item, plaid_init, recurring_cache, resilience, rollups, single_flight, subscriptions, supabase_init, sync_engine, transactions_store, upcoming_index, webhook_queue
+from .authentication import token_cache
+from .models import InstitutionMetadata, PlaidItemSyncState, PlaidTransaction, TransactionRollup, WebhookJob
+
 class WebhookTests(TestCase):
     def setUp(self):
         self.client = APIClient()
+        cache.clear()
 
     @patch('ledgerly_app.views.get_plaid_client')
     def test_create_link_token_webhook_url(self, mock_get_plaid_client):
@@ -28,21 +54,23 @@ class WebhookTests(TestCase):
             request_plaid = args[0]
             self.assertEqual(request_plaid.webhook, 'https://test-webhook.com')
 
-    @patch('ledgerly_app.views.get_plaid_client')
-    @patch('ledgerly_app.views.create_client')
-    def test_handle_plaid_webhook(self, mock_create_client, mock_get_plaid_client):
+    @patch.dict(os.environ, {'WEBHOOK_WORKERS': '0'})
+    @patch('ledgerly_app.webhook_queue.get_plaid_client')
+    @patch('ledgerly_app.webhook_queue.get_supabase_client')
+    def test_handle_plaid_webhook(self, mock_get_supabase_client, mock_get_plaid_client):
         # Mock Supabase
         mock_supabase = MagicMock()
-        mock_create_client.return_value = mock_supabase
-        # Mock select response with cursor
-        mock_supabase.table.return_value.select.return_value.eq.return_value.execute.return_value.data = [{'access_token': 'test_access_token', 'cursor': 'old_cursor'}]
+        mock_get_supabase_client.return_value = mock_supabase
+        mock_supabase.table.return_value.select.return_value.eq.return_value.execute.return_value.data = [{'user_id': 'test_user', 'access_token': 'test_access_token'}]
+        # Cursor from the previous sync lives in the local store
+        transactions_store.save_cursor('test_user', 'test_item_id', 'old_cursor')
         
         # Mock Plaid
         mock_plaid_client = MagicMock()
         mock_get_plaid_client.return_value = mock_plaid_client
         mock_plaid_client.transactions_sync.return_value = {
-            'added': [], 
-            'modified': [], 
+            'added': [{'transaction_id': 'txn_1', 'account_id': 'acc_1', 'amount': 12.5, 'date': '2024-01-02', 'name': 'Coffee'}],
+            'modified': [],
             'removed': [],
             'next_cursor': 'new_next_cursor'
         }
@@ -57,10 +85,16 @@ class WebhookTests(TestCase):
         response = self.client.post(url, data, format='json')
         
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        
+        self.assertEqual(response.json()['status'], 'queued')
+        # Nothing upstream is called until a worker picks up the job
+        mock_plaid_client.transactions_sync.assert_not_called()
+
+        self.assertEqual(webhook_queue.run_pending(), 1)
+        self.assertEqual(WebhookJob.objects.get().status, WebhookJob.STATUS_DONE)
+
         # Verify Supabase select
         mock_supabase.table.assert_any_call('user_plaid_items')
-        mock_supabase.table().select.assert_called_with('access_token, cursor')
+        mock_supabase.table().select.assert_called_with('user_id, access_token')
         mock_supabase.table().select().eq.assert_called_with('item_id', 'test_item_id')
         
         # Verify Plaid sync called with old cursor
@@ -68,23 +102,58 @@ class WebhookTests(TestCase):
         args, _ = mock_plaid_client.transactions_sync.call_args
         self.assertEqual(args[0].cursor, 'old_cursor')
         
-        # Verify Supabase update called with new cursor
-        mock_supabase.table().update.assert_called_with({'cursor': 'new_next_cursor'})
-        mock_supabase.table().update().eq.assert_called_with('item_id', 'test_item_id')
+        # Verify the page was stored and the cursor advanced locally
+        self.assertTrue(PlaidTransaction.objects.filter(transaction_id='txn_1', user_id='test_user').exists())
+        self.assertEqual(transactions_store.get_cursor('test_item_id'), 'new_next_cursor')
 
     @patch('ledgerly_app.views.get_plaid_client')
-    @patch('ledgerly_app.views.create_client')
-    def test_get_transactions_recurring(self, mock_create_client, mock_get_plaid_client):
+    @patch('ledgerly_app.views.get_supabase_client')
+    def test_refresh_transactions(self, mock_get_supabase_client, mock_get_plaid_client):
         # Mock Supabase
         mock_supabase = MagicMock()
-        mock_create_client.return_value = mock_supabase
-        mock_supabase.table.return_value.select.return_value.eq.return_value.execute.return_value.data = [{'access_token': 'test_token', 'cursor': 'old_cursor'}]
+        mock_get_supabase_client.return_value = mock_supabase
+        mock_supabase.table.return_value.select.return_value.eq.return_value.execute.return_value.data = [{'access_token': 'test_token'}]
         
         # Mock Plaid
         mock_plaid_client = MagicMock()
         mock_get_plaid_client.return_value = mock_plaid_client
+        mock_plaid_client.transactions_refresh.return_value.to_dict.return_value = {'request_id': 'test_req_id'}
         
-        # Mock sync response
+        url = reverse('refresh_transactions')
+        # Similar user_id handling as before
+        response = self.client.post(url, {'user_id': 'test_user'}, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        # Verify Supabase call
+        mock_supabase.table.assert_called_with('user_plaid_items')
+        mock_supabase.table().select.assert_called_with('access_token, item_id, institution_id')
+        mock_supabase.table().select().eq.assert_called_with('user_id', 'test_user')
+        
+        # Verify Plaid refresh called
+        mock_plaid_client.transactions_refresh.assert_called()
+        self.assertEqual(response.json()['items'][0]['request_id'], 'test_req_id')
+
+
+class TransactionsBootstrapTests(TransactionTestCase):
+    # The bootstrap syncs run on fan_out's threads, which only see committed rows.
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+
+    @patch('ledgerly_app.views.get_plaid_client')
+    @patch('ledgerly_app.views.get_supabase_client')
+    def test_get_transactions_recurring(self, mock_get_supabase_client, mock_get_plaid_client):
+        # Mock Supabase
+        mock_supabase = MagicMock()
+        mock_get_supabase_client.return_value = mock_supabase
+        mock_supabase.table.return_value.select.return_value.eq.return_value.execute.return_value.data = [{'access_token': 'test_token', 'item_id': 'test_item_id'}]
+        
+        # Mock Plaid
+        mock_plaid_client = MagicMock()
+        mock_get_plaid_client.return_value = mock_plaid_client
+        
+        # Mock sync response for the first (bootstrap) sync
         mock_sync_response = MagicMock()
         mock_sync_response.to_dict.return_value = {
             'added': [], 'modified': [], 'removed': [], 'next_cursor': 'new_cursor'
@@ -117,36 +186,1267 @@ class WebhookTests(TestCase):
         data = response.json()
         self.assertIn('inflow_streams', data)
         self.assertIn('outflow_streams', data)
-        self.assertEqual(data['inflow_streams'], [{'description': 'salary'}])
-        self.assertEqual(data['outflow_streams'], [{'description': 'rent'}])
+        self.assertEqual(data['inflow_streams'], [{'description': 'salary', 'item_id': 'test_item_id', 'institution_id': None}])
+        self.assertEqual(data['outflow_streams'], [{'description': 'rent', 'item_id': 'test_item_id', 'institution_id': None}])
         
         # Verify calls
         mock_plaid_client.transactions_sync.assert_called()
         mock_plaid_client.transactions_recurring_get.assert_called()
 
+    @patch('ledgerly_app.sync_engine.sync_item')
     @patch('ledgerly_app.views.get_plaid_client')
-    @patch('ledgerly_app.views.create_client')
-    def test_refresh_transactions(self, mock_create_client, mock_get_plaid_client):
-        # Mock Supabase
-        mock_supabase = MagicMock()
-        mock_create_client.return_value = mock_supabase
-        mock_supabase.table.return_value.select.return_value.eq.return_value.execute.return_value.data = [{'access_token': 'test_token'}]
-        
-        # Mock Plaid
-        mock_plaid_client = MagicMock()
-        mock_get_plaid_client.return_value = mock_plaid_client
-        mock_plaid_client.transactions_refresh.return_value.to_dict.return_value = {'request_id': 'test_req_id'}
-        
-        url = reverse('refresh_transactions')
-        # Similar user_id handling as before
-        response = self.client.post(url, {'user_id': 'test_user'}, format='json')
-        
+    @patch('ledgerly_app.views.get_supabase_client')
+    def test_bootstrap_syncs_unsynced_items_side_by_side(self, mock_get_supabase_client, mock_get_plaid_client, mock_sync_item):
+        mock_get_supabase_client.return_value.table.return_value.select.return_value.eq.return_value.execute.return_value.data = [
+            {'access_token': 'token_a', 'item_id': 'item_a'},
+            {'access_token': 'token_b', 'item_id': 'item_b'},
+            {'access_token': 'token_c', 'item_id': 'item_c'},
+        ]
+        PlaidItemSyncState.objects.create(item_id='item_c', user_id='user', cursor='stored')
+        both_started = threading.Barrier(2, timeout=5)
+
+        def sync_item(user_id, item_id, access_token, client=None):
+            # Each sync waits for the other, so this only passes if they run at once.
+            both_started.wait()
+            return {'next_cursor': f'{access_token}_cursor'}
+
+        mock_sync_item.side_effect = sync_item
+        mock_get_plaid_client.return_value.transactions_recurring_get.return_value.to_dict.return_value = {'inflow_streams': [], 'outflow_streams': []}
+
+        data = self.client.get(reverse('get_transactions'), {'user_id': 'user'}).json()
+
+        self.assertEqual(data['errors'], [])
+        self.assertEqual(data['next_cursors'], {'item_a': 'token_a_cursor', 'item_b': 'token_b_cursor', 'item_c': 'stored'})
+        self.assertEqual(mock_sync_item.call_count, 2)
+
+
+class PlaidClientTests(TestCase):
+    def tearDown(self):
+        plaid_init.close_plaid_client()
+
+    @patch.dict(os.environ, {'PLAID_CLIENT_ID': 'id', 'PLAID_SECRET': 'secret', 'PLAID_POOL_MAXSIZE': '7'})
+    def test_client_is_shared_per_worker(self):
+        first = plaid_init.get_plaid_client()
+        second = plaid_init.get_plaid_client()
+
+        self.assertIs(first, second)
+        self.assertEqual(first.api_client.configuration.connection_pool_maxsize, 7)
+
+    @patch.dict(os.environ, {'PLAID_CLIENT_ID': 'id', 'PLAID_SECRET': 'secret'})
+    def test_close_resets_client(self):
+        first = plaid_init.get_plaid_client()
+        plaid_init.close_plaid_client()
+
+        self.assertIsNot(first, plaid_init.get_plaid_client())
+
+    @patch.dict(os.environ, {'PLAID_CLIENT_ID': 'id', 'PLAID_SECRET': 'secret', 'PLAID_HOST': 'http://127.0.0.1:9999/'})
+    def test_host_override(self):
+        self.assertEqual(plaid_init.get_plaid_client().api_client.configuration.host, 'http://127.0.0.1:9999')
+
+
+class SupabaseClientTests(TestCase):
+    def tearDown(self):
+        supabase_init.close_supabase_clients()
+
+    @patch.dict(os.environ, {'SUPABASE_URL': 'https://example.supabase.co', 'SUPABASE_KEY': 'key'})
+    def test_client_is_shared_per_worker(self):
+        first = supabase_init.get_supabase_client()
+
+        self.assertIs(first, supabase_init.get_supabase_client())
+        self.assertIs(first.postgrest.session, first.options.httpx_client)
+
+    @patch.dict(os.environ, {'SUPABASE_URL': 'https://example.supabase.co', 'SUPABASE_KEY': 'key', 'SUPABASE_MAX_ATTEMPTS': '1'})
+    def test_connection_failure_swaps_the_shared_client(self):
+        self.addCleanup(supabase_init.policy.breaker.succeeded)
+        first = supabase_init.get_supabase_client()
+        transport = first.options.httpx_client._transport.transport
+        with patch.object(transport, 'handle_request', side_effect=httpx.ConnectError('down')):
+            self.assertFalse(supabase_init.check_supabase_health())
+            second = supabase_init.get_supabase_client()
+            self.assertIsNot(first, second)
+
+            # A request still failing on the old client leaves the new one in place.
+            with self.assertRaises(httpx.ConnectError):
+                first.options.httpx_client.get('https://example.supabase.co/rest/v1/items')
+        self.assertIs(second, supabase_init.get_supabase_client())
+        # Requests still holding the old client can finish on it.
+        self.assertFalse(first.options.httpx_client.is_closed)
+
+
+@patch.dict(os.environ, {'SUPABASE_JWT_SECRET': 'test-secret-with-at-least-32-bytes', 'SUPABASE_AUTH_MODE': 'local'})
+class SupabaseAuthenticationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        token_cache.clear()
+
+    def make_token(self, **overrides):
+        claims = {
+            'sub': 'user-uuid',
+            'email': 'user@example.com',
+            'aud': 'authenticated',
+            'exp': int(time.time()) + 3600,
+        }
+        claims.update(overrides)
+        return jwt.encode(claims, 'test-secret-with-at-least-32-bytes', algorithm='HS256')
+
+    @patch('ledgerly_app.authentication.get_supabase_client')
+    def test_token_verified_locally_and_cached(self, mock_get_supabase_client):
+        token = self.make_token()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+        for _ in range(2):
+            response = self.client.get(reverse('test_auth'))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.json()['user_id'], 'user-uuid')
+
+        mock_get_supabase_client.assert_not_called()
+        self.assertIsNotNone(token_cache.get(token))
+
+    def test_expired_token_rejected(self):
+        token = self.make_token(exp=int(time.time()) - 10)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+        response = self.client.get(reverse('test_auth'))
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    @patch.dict(os.environ, {'SUPABASE_URL': 'https://example.supabase.co'})
+    @patch('ledgerly_app.authentication._get_jwks_client')
+    def test_jwks_key_is_checked_with_its_own_algorithm(self, mock_get_jwks_client):
+        from cryptography.hazmat.primitives.asymmetric import rsa
+
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        public_jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+        mock_get_jwks_client.return_value.get_signing_key_from_jwt.return_value = jwt.PyJWK({**public_jwk, 'alg': 'RS256'})
+        claims = {'sub': 'user-uuid', 'aud': 'authenticated', 'exp': int(time.time()) + 3600}
+
+        self.assertEqual(authentication.verify_token_locally(jwt.encode(claims, private_key, algorithm='RS256'))['sub'], 'user-uuid')
+        # The token's header does not get to pick another algorithm for the key.
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            authentication.verify_token_locally(jwt.encode(claims, private_key, algorithm='RS512'))
+
+    @patch('ledgerly_app.authentication.get_supabase_client')
+    def test_remote_mode_uses_supabase_auth(self, mock_get_supabase_client):
+        mock_user = MagicMock()
+        mock_user.user.id = 'remote-uuid'
+        mock_user.user.email = 'remote@example.com'
+        mock_get_supabase_client.return_value.auth.get_user.return_value = mock_user
+        token = self.make_token()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+        with patch.dict(os.environ, {'SUPABASE_AUTH_MODE': 'remote'}):
+            response = self.client.get(reverse('test_auth'))
+
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        
-        # Verify Supabase call
-        mock_supabase.table.assert_called_with('user_plaid_items')
-        mock_supabase.table().select.assert_called_with('access_token')
-        mock_supabase.table().select().eq.assert_called_with('user_id', 'test_user')
-        
-        # Verify Plaid refresh called
-        mock_plaid_client.transactions_refresh.assert_called()
+        self.assertEqual(response.json()['user_id'], 'remote-uuid')
+        mock_get_supabase_client.return_value.auth.get_user.assert_called_once_with(token)
+
+
+class TransactionStoreTests(TestCase):
+    def txn(self, transaction_id, amount, day='2024-01-02'):
+        return {
+            'transaction_id': transaction_id,
+            'account_id': 'acc_1',
+            'amount': amount,
+            'date': day,
+            'name': 'Coffee',
+            'personal_finance_category': {'primary': 'FOOD_AND_DRINK', 'detailed': 'FOOD_AND_DRINK_COFFEE'},
+        }
+
+    def test_apply_sync_delta_upserts_and_removes(self):
+        transactions_store.apply_sync_delta(
+            'user', 'item',
+            added=[self.txn('t1', 5), self.txn('t2', 7)],
+            accounts=[{'account_id': 'acc_1', 'name': 'Checking', 'type': 'depository', 'balances': {'current': 100}}],
+        )
+        transactions_store.apply_sync_delta(
+            'user', 'item',
+            modified=[self.txn('t1', 6)],
+            removed=[{'transaction_id': 't2'}],
+        )
+
+        rows = list(transactions_store.get_user_transactions('user'))
+        self.assertEqual([r.transaction_id for r in rows], ['t1'])
+        self.assertEqual(rows[0].amount, Decimal('6.00'))
+        self.assertEqual(rows[0].category_primary, 'FOOD_AND_DRINK')
+        self.assertEqual(transactions_store.get_user_accounts('user').get().current_balance, Decimal('100.00'))
+
+
+class TransactionHistoryTests(TestCase):
+    def setUp(self):
+        transactions_store.apply_sync_delta('user', 'item', added=[
+            {'transaction_id': f't{i}', 'account_id': 'acc_1' if i % 2 else 'acc_2', 'amount': i,
+             'date': f'2024-01-{i // 2 + 1:02d}', 'name': f't{i}'}
+            for i in range(7)
+        ])
+
+    def test_keyset_pages_cover_history_once(self):
+        seen, cursor = [], None
+        while True:
+            rows, cursor = transactions_store.history_page('user', limit=3, after=cursor)
+            seen.extend(r['transaction_id'] for r in rows)
+            if cursor is None:
+                break
+        expected = list(transactions_store.get_user_transactions('user').values_list('transaction_id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_endpoint_filters_and_streams_ndjson(self):
+        url = reverse('get_transaction_history')
+        response = self.client.get(url, {'user_id': 'user', 'account_id': 'acc_1', 'start_date': '2024-01-02', 'limit': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['transaction_id'] for r in response.json()['transactions']], ['t5'])
+        self.assertTrue(response.json()['has_more'])
+
+        response = self.client.get(url, {'user_id': 'user', 'format': 'ndjson'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 7)
+        self.assertEqual(json.loads(lines[0])['transaction_id'], 't6')
+
+        response = self.client.get(url, {'user_id': 'user', 'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+
+class SpendingAnalyticsTests(TestCase):
+    def setUp(self):
+        food = {'primary': 'FOOD_AND_DRINK'}
+        transactions_store.apply_sync_delta('user', 'item', added=[
+            {'transaction_id': 't1', 'account_id': 'acc', 'amount': 10.10, 'date': '2024-01-05', 'name': 'Cafe', 'personal_finance_category': food},
+            {'transaction_id': 't2', 'account_id': 'acc', 'amount': 20.20, 'date': '2024-01-20', 'name': 'Cafe', 'personal_finance_category': food},
+            {'transaction_id': 't3', 'account_id': 'acc', 'amount': 5.05, 'date': '2024-03-02', 'name': 'Cafe', 'personal_finance_category': food},
+            {'transaction_id': 't4', 'account_id': 'acc', 'amount': -1000, 'date': '2024-02-01', 'name': 'Payroll', 'personal_finance_category': {'primary': 'INCOME'}},
+            {'transaction_id': 't5', 'account_id': 'acc', 'amount': 3, 'date': '2024-02-10', 'name': 'Kiosk'},
+        ])
+        transactions_store.save_cursor('user', 'item', 'cursor-1')
+        self.url = reverse('get_spending_analytics')
+        self.params = {'user_id': 'user', 'start_date': '2024-01-01', 'end_date': '2024-03-31'}
+
+    def test_monthly_category_totals_and_deltas(self):
+        response = self.client.get(self.url, self.params)
+
+        self.assertEqual(response.status_code, 200)
+        report = response.json()
+        self.assertEqual(report['periods'], ['2024-01-01', '2024-02-01', '2024-03-01'])
+        self.assertEqual([g['key'] for g in report['groups']], ['FOOD_AND_DRINK', 'UNCATEGORIZED', 'INCOME'])
+        food = report['groups'][0]
+        self.assertEqual(food['total'], 35.35)
+        self.assertEqual(food['series'], {'total': [30.3, 0.0, 5.05], 'count': [2, 0, 1], 'delta': [None, -30.3, 5.05]})
+        self.assertEqual(report['overall']['count'], 5)
+        self.assertEqual(report['overall']['total'], -961.65)
+
+        revalidated = self.client.get(self.url, self.params, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_weekly_merchant_breakdown(self):
+        response = self.client.get(self.url, {**self.params, 'group_by': 'merchant', 'period': 'week', 'end_date': '2024-01-21', 'limit': 1})
+
+        report = response.json()
+        # 2024-01-01 was a Monday; the range spans three ISO weeks.
+        self.assertEqual(report['periods'], ['2024-01-01', '2024-01-08', '2024-01-15'])
+        self.assertEqual(report['groups'], [{
+            'key': 'Cafe', 'total': 30.3, 'count': 2,
+            'series': {'total': [10.1, 0.0, 20.2], 'count': [1, 0, 1], 'delta': [None, -10.1, 20.2]},
+        }])
+
+    def test_rejects_unknown_grouping(self):
+        response = self.client.get(self.url, {**self.params, 'group_by': 'color'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_default_range_is_twelve_calendar_months(self):
+        self.assertEqual(analytics.default_range(date(2024, 3, 15)), (date(2023, 4, 1), date(2024, 3, 15)))
+
+
+class RollupTests(TestCase):
+    def txn(self, transaction_id, amount, day, name='Cafe', category='FOOD_AND_DRINK'):
+        return {'transaction_id': transaction_id, 'account_id': 'acc', 'amount': amount, 'date': day, 'name': name,
+                'personal_finance_category': {'primary': category}}
+
+    def totals(self, period, dimension):
+        return {
+            (str(r.period_start), r.key): (r.cents, r.count)
+            for r in TransactionRollup.objects.filter(period=period, dimension=dimension)
+        }
+
+    def test_sync_deltas_add_modify_and_remove(self):
+        transactions_store.apply_sync_delta('user', 'item', added=[
+            self.txn('t1', 10.10, '2024-01-05'),
+            self.txn('t2', 20.20, '2024-01-20'),
+            self.txn('t3', -1000, '2024-01-31', name='Payroll', category='INCOME'),
+        ])
+        self.assertEqual(self.totals('month', 'category'), {
+            ('2024-01-01', 'FOOD_AND_DRINK'): (3030, 2), ('2024-01-01', 'INCOME'): (-100000, 1),
+        })
+        self.assertEqual(self.totals('month', 'flow'), {('2024-01-01', 'inflow'): (-100000, 1), ('2024-01-01', 'outflow'): (3030, 2)})
+
+        # t1 moves to February under a new merchant; t2 is removed.
+        transactions_store.apply_sync_delta(
+            'user', 'item',
+            modified=[{**self.txn('t1', 12.00, '2024-02-01'), 'merchant_name': 'Bakery'}],
+            removed=[{'transaction_id': 't2'}],
+        )
+        self.assertEqual(self.totals('month', 'category'), {
+            ('2024-01-01', 'INCOME'): (-100000, 1), ('2024-02-01', 'FOOD_AND_DRINK'): (1200, 1),
+        })
+        self.assertEqual(self.totals('day', 'merchant'), {('2024-01-31', 'Payroll'): (-100000, 1), ('2024-02-01', 'Bakery'): (1200, 1)})
+        # A replayed page changes nothing.
+        transactions_store.apply_sync_delta('user', 'item', added=[self.txn('t3', -1000, '2024-01-31', name='Payroll', category='INCOME')])
+        self.assertEqual(rollups.verify('item'), [])
+
+    def test_rebuild_command_verifies_and_repairs(self):
+        transactions_store.apply_sync_delta('user', 'item', added=[self.txn('t1', 10.10, '2024-01-05')])
+        TransactionRollup.objects.filter(period='month', dimension='category').update(cents=1)
+        PlaidTransaction.objects.filter(transaction_id='t1').update(amount=Decimal('11.00'))
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_rollups', '--verify', stdout=io.StringIO())
+        out = io.StringIO()
+        call_command('rebuild_rollups', '--user', 'user', stdout=out)
+
+        self.assertIn('8 group(s) repaired', out.getvalue())
+        self.assertEqual(rollups.verify('item'), [])
+        self.assertEqual(self.totals('month', 'category'), {('2024-01-01', 'FOOD_AND_DRINK'): (1100, 1)})
+
+    def test_rebuild_locks_the_item_sync_state_row(self):
+        # The cache lease does not span processes; the row lock a sync page takes does.
+        PlaidItemSyncState.objects.create(item_id='item', user_id='user', cursor='cursor')
+        select_for_update = QuerySet.select_for_update
+        locked = []
+
+        def lock(queryset, *args, **kwargs):
+            locked.append(queryset.model)
+            return select_for_update(queryset, *args, **kwargs)
+
+        with patch.object(QuerySet, 'select_for_update', lock):
+            rollups.rebuild('item')
+        self.assertEqual(locked, [PlaidItemSyncState])
+
+    def test_monthly_analytics_reads_month_rows_and_partial_month_days(self):
+        transactions_store.apply_sync_delta('user', 'item', added=[
+            self.txn('t1', 5, '2024-01-10'), self.txn('t2', 7, '2024-02-15'), self.txn('t3', 9, '2024-03-20'),
+        ])
+        report = analytics.spending('user', date(2024, 1, 15), date(2024, 3, 20))
+        self.assertEqual(report['overall']['series']['total'], [0.0, 7.0, 9.0])
+        self.assertEqual(analytics._whole_months(date(2024, 1, 15), date(2024, 3, 31)), (date(2024, 2, 1), date(2024, 3, 1)))
+
+
+class ForecastTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+
+    def test_occurrences_follow_frequency(self):
+        def dates(first, frequency, start=date(2024, 1, 1), end=date(2024, 4, 1), interval=None):
+            return [str(d) for d in forecast.occurrence_dates(first, frequency, start, end, interval)]
+
+        self.assertEqual(dates(date(2024, 1, 31), 'MONTHLY'), ['2024-01-31', '2024-02-29', '2024-03-31'])
+        self.assertEqual(dates(date(2024, 1, 5), 'SEMI_MONTHLY', end=date(2024, 2, 1)), ['2024-01-05', '2024-01-20'])
+        # An overdue weekly payment is rolled forward to the range.
+        self.assertEqual(dates(date(2023, 12, 28), 'WEEKLY', end=date(2024, 1, 12)), ['2024-01-04', '2024-01-11'])
+        self.assertEqual(dates(date(2024, 6, 1), 'ANNUALLY'), [])
+        self.assertEqual(dates(date(2024, 2, 10), 'UNKNOWN'), ['2024-02-10'])
+        # An overdue stream of unknown frequency repeats at its past interval, or is left out without one.
+        self.assertEqual(dates(date(2023, 12, 20), 'UNKNOWN', end=date(2024, 2, 1), interval=20), ['2024-01-09', '2024-01-29'])
+        self.assertEqual(dates(date(2023, 12, 20), 'UNKNOWN'), [])
+        self.assertEqual(forecast._interval({'first_date': '2023-01-01', 'last_date': '2023-03-02', 'transaction_ids': ['a', 'b', 'c', 'd']}), 20)
+        self.assertIsNone(forecast._interval({'first_date': '2023-01-01', 'last_date': '2023-01-01', 'transaction_ids': ['a']}))
+
+    @patch('ledgerly_app.views.timezone.localdate', return_value=date(2024, 1, 1))
+    @patch('ledgerly_app.views.get_plaid_client')
+    @patch('ledgerly_app.views.get_supabase_client')
+    def test_projects_balances_and_runs_scenarios(self, mock_get_supabase_client, mock_get_plaid_client, _):
+        mock_get_supabase_client.return_value.table.return_value.select.return_value.eq.return_value.execute.return_value.data = [
+            {'access_token': 'token', 'item_id': 'item_1', 'institution_id': 'ins_1'},
+        ]
+        plaid_client = mock_get_plaid_client.return_value
+        plaid_client.accounts_get.return_value.to_dict.return_value = {'accounts': [
+            {'account_id': 'checking', 'type': 'depository', 'balances': {'available': 100, 'current': 120}},
+            {'account_id': 'card', 'type': 'credit', 'balances': {'current': 500}},
+        ]}
+        plaid_client.transactions_recurring_get.return_value.to_dict.return_value = {
+            'inflow_streams': [
+                {'stream_id': 'pay', 'account_id': 'checking', 'is_active': True, 'frequency': 'BIWEEKLY',
+                 'predicted_next_date': '2024-01-05', 'average_amount': {'amount': -50}},
+            ],
+            'outflow_streams': [
+                {'stream_id': 'rent', 'account_id': 'checking', 'is_active': True, 'frequency': 'MONTHLY',
+                 'predicted_next_date': '2024-01-03', 'average_amount': {'amount': 120}},
+                {'stream_id': 'gym', 'account_id': 'card', 'is_active': True, 'frequency': 'MONTHLY',
+                 'predicted_next_date': '2024-01-02', 'average_amount': {'amount': 30}},
+            ],
+        }
+        url = reverse('get_cash_flow_forecast')
+
+        response = self.client.get(url, {'user_id': 'user', 'days': 10})
+
+        self.assertEqual(response.status_code, 200)
+        report = response.json()
+        self.assertEqual(report['dates'][0], '2024-01-01')
+        self.assertEqual(len(report['dates']), 10)
+        self.assertEqual([a['account_id'] for a in report['accounts']], ['checking'])
+        checking = report['accounts'][0]
+        self.assertEqual(checking['balances'][:5], [100.0, 100.0, -20.0, -20.0, 30.0])
+        self.assertEqual(checking['first_overdraft_date'], '2024-01-03')
+        self.assertEqual(checking['lowest_balance'], -20.0)
+        self.assertEqual([e['stream_id'] for e in report['events']], ['rent', 'pay'])
+        self.assertEqual(plaid_client.accounts_balance_get.call_count, 0)
+
+        revalidated = self.client.get(url, {'user_id': 'user', 'days': 10}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+
+        skipped = self.client.get(url, {'user_id': 'user', 'days': 10, 'skip': 'rent'}).json()
+        self.assertIsNone(skipped['combined']['first_overdraft_date'])
+        self.assertEqual(skipped['skipped_streams'], ['rent'])
+
+        scenario = self.client.post(url, {
+            'user_id': 'user', 'days': 10, 'skip': ['rent'],
+            'add': [{'date': '2024-01-08', 'amount': 200, 'description': 'Car repair'}],
+        }, format='json').json()
+        self.assertEqual(scenario['accounts'][0]['first_overdraft_date'], '2024-01-08')
+        self.assertEqual(scenario['accounts'][0]['balances'][-1], -50.0)
+        # Balances and streams came from the caches every time.
+        self.assertEqual(plaid_client.accounts_get.call_count, 1)
+        self.assertEqual(plaid_client.transactions_recurring_get.call_count, 1)
+
+
+class SyncEngineTests(TestCase):
+    def page(self, transaction_ids, next_cursor, has_more):
+        return {
+            'added': [
+                {'transaction_id': t, 'account_id': 'acc_1', 'amount': 1, 'date': '2024-01-02', 'name': t}
+                for t in transaction_ids
+            ],
+            'modified': [],
+            'removed': [],
+            'next_cursor': next_cursor,
+            'has_more': has_more,
+        }
+
+    def test_drains_all_pages_and_checkpoints(self):
+        client = MagicMock()
+        client.transactions_sync.side_effect = [
+            self.page(['t1'], 'c1', True),
+            self.page(['t2'], 'c2', False),
+        ]
+
+        totals = sync_engine.sync_item('user', 'item', 'token', client=client)
+
+        self.assertEqual(totals['pages'], 2)
+        self.assertEqual(totals['added'], 2)
+        cursors = [call.args[0].cursor for call in client.transactions_sync.call_args_list]
+        self.assertEqual(cursors, ['', 'c1'])
+        state = PlaidItemSyncState.objects.get(item_id='item')
+        self.assertEqual(state.cursor, 'c2')
+        self.assertIsNone(state.pagination_start_cursor)
+
+    def test_restarts_loop_on_mutation_during_pagination(self):
+        mutation = plaid.ApiException(status=400)
+        mutation.body = json.dumps({'error_code': 'TRANSACTIONS_SYNC_MUTATION_DURING_PAGINATION'})
+        client = MagicMock()
+        client.transactions_sync.side_effect = [
+            self.page(['t1'], 'c1', True),
+            mutation,
+            self.page(['t1'], 'c1b', True),
+            self.page(['t2'], 'c2', False),
+        ]
+
+        totals = sync_engine.sync_item('user', 'item', 'token', client=client)
+
+        self.assertEqual(totals['restarts'], 1)
+        cursors = [call.args[0].cursor for call in client.transactions_sync.call_args_list]
+        self.assertEqual(cursors, ['', 'c1', '', 'c1b'])
+        self.assertEqual(PlaidTransaction.objects.count(), 2)
+
+    def test_page_is_dropped_when_another_sync_moved_the_cursor(self):
+        def transactions_sync(request_plaid):
+            # A sync in another process stores its page while this one waits on Plaid.
+            transactions_store.apply_sync_delta('user', 'item', added=self.page(['t1'], 'c1', False)['added'])
+            transactions_store.save_cursor('user', 'item', 'c1')
+            return self.page(['t1'], 'c1', False)
+
+        client = MagicMock()
+        client.transactions_sync.side_effect = transactions_sync
+
+        totals = sync_engine.sync_item('user', 'item', 'token', client=client)
+
+        self.assertTrue(totals['superseded'])
+        self.assertEqual(totals['next_cursor'], 'c1')
+        self.assertEqual(totals['added'], 0)
+        self.assertEqual(rollups.verify('item'), [])
+
+    def test_resumes_from_last_checkpoint(self):
+        client = MagicMock()
+        client.transactions_sync.side_effect = [self.page(['t1'], 'c1', True), RuntimeError('worker died')]
+        with self.assertRaises(RuntimeError):
+            sync_engine.sync_item('user', 'item', 'token', client=client)
+
+        client.transactions_sync.side_effect = [self.page(['t2'], 'c2', False)]
+        sync_engine.sync_item('user', 'item', 'token', client=client)
+
+        self.assertEqual(client.transactions_sync.call_args.args[0].cursor, 'c1')
+        self.assertEqual(PlaidTransaction.objects.count(), 2)
+
+
+@patch.dict(os.environ, {'WEBHOOK_WORKERS': '0'})
+class WebhookQueueTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+
+    def post_webhook(self, code, item_id='item_1'):
+        return self.client.post(
+            reverse('plaid-webhook'),
+            {'webhook_type': 'TRANSACTIONS', 'webhook_code': code, 'item_id': item_id},
+            format='json',
+        )
+
+    @patch('ledgerly_app.webhook_queue.sync_engine.sync_item')
+    @patch('ledgerly_app.webhook_queue.get_plaid_client')
+    @patch('ledgerly_app.webhook_queue.get_supabase_client')
+    def test_burst_for_one_item_coalesces_into_one_sync(self, mock_get_supabase_client, mock_get_plaid_client, mock_sync_item):
+        mock_get_supabase_client.return_value.table.return_value.select.return_value.eq.return_value.execute.return_value.data = [
+            {'user_id': 'user', 'access_token': 'token'}
+        ]
+        mock_sync_item.return_value = {'added': 0, 'modified': 0, 'removed': 0, 'pages': 1}
+
+        for code in ['SYNC_UPDATES_AVAILABLE', 'DEFAULT_UPDATE', 'SYNC_UPDATES_AVAILABLE']:
+            self.assertEqual(self.post_webhook(code).status_code, status.HTTP_200_OK)
+        self.post_webhook('SYNC_UPDATES_AVAILABLE', item_id='item_2')
+
+        self.assertEqual(WebhookJob.objects.count(), 2)
+        self.assertEqual(WebhookJob.objects.get(item_id='item_1').coalesced_count, 2)
+        self.assertEqual(webhook_queue.run_pending(), 2)
+        self.assertEqual(mock_sync_item.call_count, 2)
+
+    def test_concurrent_folds_keep_every_code(self):
+        webhook_queue.enqueue_item_sync('item_1', 'SYNC_UPDATES_AVAILABLE')
+        stale = WebhookJob.objects.get(item_id='item_1')
+        # Another request folds its code in after this one read the job.
+        webhook_queue.enqueue_item_sync('item_1', 'DEFAULT_UPDATE')
+
+        first = QuerySet.first
+        reads = iter([stale])
+        with patch.object(QuerySet, 'first', lambda qs: next(reads, None) or first(qs)):
+            webhook_queue.enqueue_item_sync('item_1', 'HISTORICAL_UPDATE')
+
+        job = WebhookJob.objects.get(item_id='item_1')
+        self.assertEqual(job.webhook_codes, ['SYNC_UPDATES_AVAILABLE', 'DEFAULT_UPDATE', 'HISTORICAL_UPDATE'])
+        self.assertEqual(job.coalesced_count, 2)
+
+    @patch('ledgerly_app.webhook_queue.get_supabase_client')
+    def test_failed_job_is_retried_then_marked_failed(self, mock_get_supabase_client):
+        mock_get_supabase_client.side_effect = RuntimeError('supabase down')
+        job, _ = webhook_queue.enqueue_item_sync('item_1', 'SYNC_UPDATES_AVAILABLE')
+
+        with patch.dict(os.environ, {'WEBHOOK_JOB_MAX_ATTEMPTS': '2'}):
+            self.assertEqual(webhook_queue.run_pending(), 1)
+            job.refresh_from_db()
+            self.assertEqual(job.status, WebhookJob.STATUS_PENDING)
+            self.assertEqual(job.attempts, 1)
+
+            WebhookJob.objects.filter(pk=job.pk).update(run_after=job.run_after - timedelta(hours=1))
+            self.assertEqual(webhook_queue.run_pending(), 1)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, WebhookJob.STATUS_FAILED)
+        self.assertIn('supabase down', job.last_error)
+
+
+@patch.dict(os.environ, {'WEBHOOK_WORKERS': '0'})
+class RecurringCacheTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+
+    @patch('ledgerly_app.views.get_plaid_client')
+    @patch('ledgerly_app.views.get_supabase_client')
+    def test_endpoints_share_cached_streams_until_webhook(self, mock_get_supabase_client, mock_get_plaid_client):
+        mock_get_supabase_client.return_value.table.return_value.select.return_value.eq.return_value.execute.return_value.data = [
+            {'access_token': 'token', 'item_id': 'item_1'}
+        ]
+        mock_plaid_client = mock_get_plaid_client.return_value
+        mock_plaid_client.transactions_recurring_get.return_value.to_dict.return_value = {
+            'inflow_streams': [],
+            'outflow_streams': [{
+                'stream_id': 's1', 'description': 'Netflix subscription', 'is_active': True,
+                'predicted_next_date': '2024-02-01',
+            }],
+        }
+        before = recurring_cache.stats()
+
+        subscriptions = self.client.get(reverse('get_subscription_payments'), {'user_id': 'user'})
+        upcoming = self.client.get(reverse('get_upcoming_payments'), {'user_id': 'user'})
+
+        self.assertEqual(subscriptions.status_code, status.HTTP_200_OK)
+        self.assertEqual(upcoming.json()[0]['stream_id'], 's1')
+        self.assertEqual(mock_plaid_client.transactions_recurring_get.call_count, 1)
+        after = recurring_cache.stats()
+        self.assertEqual(after['misses'] - before['misses'], 1)
+        self.assertEqual(after['hits'] - before['hits'], 1)
+
+        self.client.post(
+            reverse('plaid-webhook'),
+            {'webhook_type': 'TRANSACTIONS', 'webhook_code': 'RECURRING_TRANSACTIONS_UPDATE', 'item_id': 'item_1'},
+            format='json',
+        )
+        self.client.get(reverse('get_upcoming_payments'), {'user_id': 'user'})
+        self.assertEqual(mock_plaid_client.transactions_recurring_get.call_count, 2)
+
+
+class SingleFlightTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_concurrent_callers_share_one_call(self):
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def fetch():
+            calls.append(1)
+            release.wait(5)
+            cache.set('single_flight_test', 'value')
+            return 'value'
+
+        def caller():
+            results.append(single_flight.call('test:item_1', fetch, lambda: cache.get('single_flight_test')))
+
+        threads = [threading.Thread(target=caller) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.2)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['value'] * 5)
+
+    def test_lease_excludes_second_holder_until_released(self):
+        with single_flight.lease('transactions_sync:item_1', ttl=30, wait=0):
+            with self.assertRaises(single_flight.LeaseTimeout):
+                with single_flight.lease('transactions_sync:item_1', ttl=30, wait=0.1):
+                    pass
+        with single_flight.lease('transactions_sync:item_1', ttl=30, wait=0):
+            pass
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+
+    @patch('ledgerly_app.views.get_plaid_client')
+    @patch('ledgerly_app.views.get_supabase_client')
+    def test_unchanged_upcoming_payments_return_304_from_cache(self, mock_get_supabase_client, mock_get_plaid_client):
+        mock_get_supabase_client.return_value.table.return_value.select.return_value.eq.return_value.execute.return_value.data = [
+            {'access_token': 'token', 'item_id': 'item_1'}
+        ]
+        recurring_get = mock_get_plaid_client.return_value.transactions_recurring_get
+        recurring_get.return_value.to_dict.return_value = {
+            'inflow_streams': [],
+            'outflow_streams': [{'stream_id': 's1', 'is_active': True, 'predicted_next_date': '2024-02-01'}],
+        }
+
+        first = self.client.get(reverse('get_upcoming_payments'), {'user_id': 'user'})
+        etag = first['ETag']
+        self.assertTrue(etag.startswith('"'))
+
+        again = self.client.get(reverse('get_upcoming_payments'), {'user_id': 'user'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(again.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(again['ETag'], etag)
+        self.assertEqual(recurring_get.call_count, 1)
+
+        # A refill with the same streams keeps the ETag; new streams change it.
+        recurring_cache.invalidate('item_1')
+        self.assertEqual(self.client.get(reverse('get_upcoming_payments'), {'user_id': 'user'}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        recurring_cache.invalidate('item_1')
+        recurring_get.return_value.to_dict.return_value['outflow_streams'][0]['predicted_next_date'] = '2024-03-01'
+        changed = self.client.get(reverse('get_upcoming_payments'), {'user_id': 'user'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(changed['ETag'], etag)
+
+    @patch('ledgerly_app.views.transactions_store.get_user_transactions')
+    @patch('ledgerly_app.views.get_plaid_client')
+    @patch('ledgerly_app.views.get_supabase_client')
+    def test_transactions_etag_follows_sync_cursor(self, mock_get_supabase_client, mock_get_plaid_client, mock_get_user_transactions):
+        mock_get_supabase_client.return_value.table.return_value.select.return_value.eq.return_value.execute.return_value.data = [
+            {'access_token': 'token', 'item_id': 'item_1'}
+        ]
+        mock_get_plaid_client.return_value.transactions_recurring_get.return_value.to_dict.return_value = {
+            'inflow_streams': [], 'outflow_streams': [],
+        }
+        mock_get_user_transactions.return_value.values_list.return_value = []
+        state = PlaidItemSyncState.objects.create(item_id='item_1', user_id='user', cursor='cursor-1')
+
+        etag = self.client.get(reverse('get_transactions'), {'user_id': 'user'})['ETag']
+        mock_get_user_transactions.reset_mock()
+
+        response = self.client.get(reverse('get_transactions'), {'user_id': 'user'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        mock_get_user_transactions.assert_not_called()
+
+        state.cursor = 'cursor-2'
+        state.save()
+        response = self.client.get(reverse('get_transactions'), {'user_id': 'user'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_compression_prefers_brotli_and_skips_small_bodies(self):
+        factory = RequestFactory()
+        body = json.dumps([{'transaction_id': f'txn_{n}', 'amount': n} for n in range(200)]).encode()
+        middleware = compression.CompressionMiddleware(lambda request: None)
+
+        def respond(content, accept):
+            response = HttpResponse(content, content_type='application/json')
+            response['ETag'] = '"v1"'
+            return middleware.process_response(factory.get('/', HTTP_ACCEPT_ENCODING=accept), response)
+
+        br = respond(body, 'gzip, deflate, br')
+        self.assertEqual(br['Content-Encoding'], 'br')
+        self.assertEqual(br['ETag'], 'W/"v1"')
+        self.assertEqual(brotli.decompress(br.content), body)
+
+        gz = respond(body, 'gzip')
+        self.assertEqual(gz['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(gz.content), body)
+
+        self.assertFalse(respond(b'{"ok": true}', 'br').has_header('Content-Encoding'))
+
+        streamed = middleware.process_response(
+            factory.get('/', HTTP_ACCEPT_ENCODING='br'),
+            StreamingHttpResponse(iter([b'{"a": 1}\n', b'{"a": 2}\n'])),
+        )
+        self.assertEqual(brotli.decompress(b''.join(streamed.streaming_content)), b'{"a": 1}\n{"a": 2}\n')
+
+
+@patch.dict(os.environ, {'WEBHOOK_WORKERS': '0'})
+class ItemDirectoryTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+
+    @patch('ledgerly_app.views.get_supabase_client')
+    def test_status_served_from_directory_until_item_webhook(self, mock_get_supabase_client):
+        query = mock_get_supabase_client.return_value.table.return_value.select.return_value.eq.return_value.execute
+        query.return_value.data = [{'access_token': 'token', 'item_id': 'item_1', 'institution_id': 'ins_1'}]
+
+        for _ in range(3):
+            response = self.client.get(reverse('check_plaid_status'), {'user_id': 'user'})
+            self.assertEqual(response.json(), {'is_connected': True})
+        self.assertEqual(query.call_count, 1)
+        self.assertEqual(item_directory.get_item('item_1')['access_token'], 'token')
+
+        self.client.post(
+            reverse('plaid-webhook'),
+            {'webhook_type': 'ITEM', 'webhook_code': 'USER_PERMISSION_REVOKED', 'item_id': 'item_1'},
+            format='json',
+        )
+        query.return_value.data = []
+        response = self.client.get(reverse('check_plaid_status'), {'user_id': 'user'})
+        self.assertEqual(response.json(), {'is_connected': False})
+        self.assertEqual(query.call_count, 2)
+
+
+class BalanceCacheTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+
+    @patch('ledgerly_app.views.get_plaid_client')
+    @patch('ledgerly_app.views.get_supabase_client')
+    def test_max_age_serves_snapshot_and_reports_age(self, mock_get_supabase_client, mock_get_plaid_client):
+        mock_get_supabase_client.return_value.table.return_value.select.return_value.eq.return_value.execute.return_value.data = [
+            {'access_token': 'token', 'item_id': 'item_1', 'institution_id': 'ins_1'},
+        ]
+        plaid_client = mock_get_plaid_client.return_value
+        plaid_client.accounts_balance_get.return_value.to_dict.return_value = {'accounts': [{'account_id': 'acc', 'balances': {'current': 10}}]}
+        plaid_client.accounts_get.return_value.to_dict.return_value = {'accounts': [{'account_id': 'acc', 'balances': {'current': 9}}]}
+        url = reverse('get_accounts')
+
+        first = self.client.get(url, {'user_id': 'user', 'max_age': 300}).json()
+        with patch('ledgerly_app.balance_cache.time.time', return_value=time.time() + 120):
+            second = self.client.get(url, {'user_id': 'user', 'max_age': 300}).json()
+            expired = self.client.get(url, {'user_id': 'user', 'max_age': 60, 'realtime': 'false'}).json()
+
+        self.assertEqual(plaid_client.accounts_balance_get.call_count, 1)
+        self.assertEqual(first['items'][0]['source'], 'realtime')
+        self.assertEqual(second['accounts'][0]['balances']['current'], 10)
+        self.assertGreaterEqual(second['age_seconds'], 119)
+        self.assertEqual(plaid_client.accounts_get.call_count, 1)
+        self.assertEqual(expired['items'][0]['source'], 'cached')
+        self.assertEqual(expired['age_seconds'], 0)
+
+        # The accounts/get snapshot did not replace the real-time one.
+        realtime = self.client.get(url, {'user_id': 'user', 'max_age': 300}).json()
+        self.assertEqual(realtime['accounts'][0]['balances']['current'], 10)
+        self.assertEqual(plaid_client.accounts_balance_get.call_count, 1)
+
+        # A real-time request is not answered from an accounts/get snapshot.
+        balance_cache.invalidate('item_1')
+        self.client.get(url, {'user_id': 'user', 'max_age': 300, 'realtime': 'false'})
+        self.client.get(url, {'user_id': 'user', 'max_age': 300})
+        self.assertEqual(plaid_client.accounts_get.call_count, 2)
+        self.assertEqual(plaid_client.accounts_balance_get.call_count, 2)
+
+    @patch('ledgerly_app.views.get_plaid_client')
+    @patch('ledgerly_app.views.get_supabase_client')
+    def test_stale_balances_survive_webhook_invalidation(self, mock_get_supabase_client, mock_get_plaid_client):
+        mock_get_supabase_client.return_value.table.return_value.select.return_value.eq.return_value.execute.return_value.data = [
+            {'access_token': 'token', 'item_id': 'item_1', 'institution_id': 'ins_1'},
+        ]
+        plaid_client = mock_get_plaid_client.return_value
+        plaid_client.accounts_balance_get.return_value.to_dict.return_value = {'accounts': [{'account_id': 'acc', 'balances': {'current': 10}}]}
+        url = reverse('get_accounts')
+        self.client.get(url, {'user_id': 'user'})
+
+        with patch.dict(os.environ, {'WEBHOOK_WORKERS': '0'}):
+            self.client.post(
+                reverse('plaid-webhook'),
+                {'webhook_type': 'TRANSACTIONS', 'webhook_code': 'SYNC_UPDATES_AVAILABLE', 'item_id': 'item_1'},
+                format='json',
+            )
+        plaid_client.accounts_balance_get.side_effect = resilience.UpstreamUnavailable('plaid', 30)
+        response = self.client.get(url, {'user_id': 'user'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['accounts'][0]['balances']['current'], 10)
+        self.assertEqual(plaid_client.accounts_balance_get.call_count, 2)
+
+    @patch('ledgerly_app.views.get_plaid_client')
+    @patch('ledgerly_app.views.get_supabase_client')
+    def test_default_poll_revalidates_without_plaid(self, mock_get_supabase_client, mock_get_plaid_client):
+        mock_get_supabase_client.return_value.table.return_value.select.return_value.eq.return_value.execute.return_value.data = [
+            {'access_token': 'token', 'item_id': 'item_1', 'institution_id': 'ins_1'},
+        ]
+        plaid_client = mock_get_plaid_client.return_value
+        plaid_client.accounts_balance_get.return_value.to_dict.return_value = {'accounts': [{'account_id': 'acc', 'balances': {'current': 10}}]}
+        url = reverse('get_accounts')
+
+        first = self.client.get(url, {'user_id': 'user'})
+        revalidated = self.client.get(url, {'user_id': 'user'}, HTTP_IF_NONE_MATCH=first['ETag'])
+
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(plaid_client.accounts_balance_get.call_count, 1)
+
+
+class SubscriptionClassifierTests(TestCase):
+    def stream(self, stream_id, merchant=None, description='', primary='', detailed='', active=True):
+        return {
+            'stream_id': stream_id,
+            'merchant_name': merchant,
+            'description': description,
+            'personal_finance_category_primary': primary,
+            'personal_finance_category_detailed': detailed,
+            'is_active': active,
+        }
+
+    def test_rules_combine_keywords_categories_and_merchant_lists(self):
+        classifier = subscriptions.SubscriptionClassifier({
+            'keywords': ['SUBSCRIPTION', 'SUBSCRIBE'],
+            'categories': ['ENTERTAINMENT_TV_AND_MOVIES'],
+            'allow_merchants': ['Netflix'],
+            'deny_merchants': ['Gym Subscription Co'],
+        })
+        streams = [
+            self.stream('s1', description='Monthly subscription'),
+            self.stream('s2', merchant='netflix'),
+            self.stream('s3', merchant='Gym  Subscription Co'),
+            self.stream('s4', detailed='ENTERTAINMENT_TV_AND_MOVIES'),
+            self.stream('s5', description='Rent'),
+            self.stream('s6', description='subscribe now', active=False),
+        ]
+        self.assertEqual([s['stream_id'] for s in classifier.select(streams)], ['s1', 's2', 's4'])
+
+        # Verdicts are memoized by stream_id.
+        streams[4]['description'] = 'Subscription'
+        self.assertFalse(classifier.is_subscription(streams[4]))
+
+    def test_rules_file_is_reloaded_when_it_changes(self):
+        path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'rules.json')
+        with open(path, 'w') as f:
+            json.dump({'allow_merchants': ['Spotify']}, f)
+
+        with patch.dict(os.environ, {'SUBSCRIPTION_RULES_FILE': path}):
+            self.assertTrue(subscriptions.get_classifier().is_subscription({'merchant_name': 'SPOTIFY'}))
+            with open(path, 'w') as f:
+                json.dump({'deny_merchants': ['Spotify']}, f)
+            os.utime(path, ns=(0, time.time_ns() + 10**9))
+            self.assertFalse(subscriptions.get_classifier().is_subscription({'merchant_name': 'SPOTIFY'}))
+        subscriptions.reload_rules()
+
+    def test_missing_or_malformed_rules_file_falls_back_to_settings(self):
+        path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'rules.json')
+        stream = {'description': 'Monthly subscription'}
+
+        with patch.dict(os.environ, {'SUBSCRIPTION_RULES_FILE': path}):
+            self.assertTrue(subscriptions.get_classifier().is_subscription(stream))
+            with open(path, 'w') as f:
+                f.write('{not json')
+            self.assertTrue(subscriptions.get_classifier().is_subscription(stream))
+        subscriptions.reload_rules()
+
+
+class UpcomingIndexTests(TestCase):
+    def test_query_merges_items_within_date_range(self):
+        def stream(stream_id, day, active=True):
+            return {'stream_id': stream_id, 'predicted_next_date': day, 'is_active': active}
+
+        index_a = upcoming_index.build([stream('a3', '2024-03-20'), stream('a1', '2024-03-01'), stream('a2', '2024-03-10', active=False)])
+        index_b = upcoming_index.build([stream('b1', '2024-03-05'), stream('b2', '2024-03-20'), stream('b0', None)])
+        indexed = [({'item_id': 'item_a'}, index_a), ({'item_id': 'item_b'}, index_b)]
+
+        everything = upcoming_index.query(indexed)
+        self.assertEqual([s['stream_id'] for s in everything], ['a1', 'b1', 'a3', 'b2'])
+        self.assertEqual(everything[1]['item_id'], 'item_b')
+
+        window = upcoming_index.query(indexed, start=date(2024, 3, 2), end=date(2024, 3, 20), limit=2)
+        self.assertEqual([s['stream_id'] for s in window], ['b1', 'a3'])
+
+
+class SandboxIngestTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+
+    @patch('ledgerly_app.views.get_plaid_client')
+    @patch('ledgerly_app.views.get_supabase_client')
+    def test_bulk_csv_is_validated_then_sent_in_batches(self, mock_get_supabase_client, mock_get_plaid_client):
+        mock_get_supabase_client.return_value.table.return_value.select.return_value.eq.return_value.execute.return_value.data = [
+            {'access_token': 'token', 'item_id': 'item_1', 'institution_id': 'ins_1'},
+        ]
+        url = reverse('create_sandbox_transactions_bulk') + '?user_id=user'
+
+        bad = 'amount,description\n1.50,Coffee\nlots,Rent\n'
+        response = self.client.generic('POST', url, bad, content_type='text/csv')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([e['row'] for e in response.json()['errors']], [2])
+        mock_get_plaid_client.return_value.sandbox_transactions_create.assert_not_called()
+
+        rows = ''.join(f'{i}.25,Row {i},2024-01-02\n' for i in range(25))
+        response = self.client.generic('POST', url, 'amount,description,date_posted\n' + rows, content_type='text/csv')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), {'submitted': 25, 'total': 25, 'batches': 3, 'failed_batches': []})
+        calls = mock_get_plaid_client.return_value.sandbox_transactions_create.call_args_list
+        self.assertEqual(sorted(len(c.args[0].transactions) for c in calls), [5, 10, 10])
+        self.assertEqual(calls[0].args[0].access_token, 'token')
+
+
+class InstitutionCacheTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+
+    @patch('ledgerly_app.institutions.get_plaid_client')
+    @patch('ledgerly_app.views.get_supabase_client')
+    def test_known_institutions_skip_plaid(self, mock_get_supabase_client, mock_get_plaid_client):
+        mock_get_supabase_client.return_value.table.return_value.select.return_value.eq.return_value.execute.return_value.data = [
+            {'institution_id': 'ins_1'}, {'institution_id': 'ins_2'}, {'institution_id': 'ins_3'},
+        ]
+        InstitutionMetadata.objects.create(institution_id='ins_1', name='Cached Bank', fetched_at=timezone.now())
+
+        def institutions_get_by_id(request_plaid):
+            if request_plaid.institution_id == 'ins_3':
+                raise RuntimeError('not found')
+            institution = MagicMock(institution_id=request_plaid.institution_id)
+            institution.name = 'Fetched Bank'
+            return {'institution': institution}
+
+        mock_get_plaid_client.return_value.institutions_get_by_id.side_effect = institutions_get_by_id
+
+        response = self.client.get(reverse('get_connected_institutions'), {'user_id': 'user'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [i['institution_name'] for i in response.json()],
+            ['Cached Bank', 'Fetched Bank', 'Unknown Institution'],
+        )
+        self.assertEqual(mock_get_plaid_client.return_value.institutions_get_by_id.call_count, 2)
+        self.assertEqual(InstitutionMetadata.objects.get(institution_id='ins_2').name, 'Fetched Bank')
+
+
+class MultiItemTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+
+    @patch('ledgerly_app.views.get_plaid_client')
+    @patch('ledgerly_app.views.get_supabase_client')
+    def test_balances_merge_items_and_isolate_failures(self, mock_get_supabase_client, mock_get_plaid_client):
+        mock_get_supabase_client.return_value.table.return_value.select.return_value.eq.return_value.execute.return_value.data = [
+            {'access_token': 'token_a', 'item_id': 'item_a', 'institution_id': 'ins_a'},
+            {'access_token': 'token_b', 'item_id': 'item_b', 'institution_id': 'ins_b'},
+            {'access_token': 'token_c', 'item_id': 'item_c', 'institution_id': 'ins_c'},
+        ]
+
+        def accounts_balance_get(request_plaid):
+            if request_plaid.access_token == 'token_c':
+                raise RuntimeError('ITEM_LOGIN_REQUIRED')
+            result = MagicMock()
+            result.to_dict.return_value = {'accounts': [{'account_id': f'acc_{request_plaid.access_token}'}]}
+            return result
+
+        mock_get_plaid_client.return_value.accounts_balance_get.side_effect = accounts_balance_get
+
+        response = self.client.get(reverse('get_accounts'), {'user_id': 'user'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertEqual(
+            [(a['account_id'], a['item_id']) for a in data['accounts']],
+            [('acc_token_a', 'item_a'), ('acc_token_b', 'item_b')],
+        )
+        self.assertEqual(data['errors'], [{'item_id': 'item_c', 'institution_id': 'ins_c', 'error': 'ITEM_LOGIN_REQUIRED'}])
+
+    def test_fan_out_times_out_slow_items(self):
+        items = [{'item_id': 'fast'}, {'item_id': 'slow'}]
+
+        def call(item):
+            if item['item_id'] == 'slow':
+                time.sleep(0.5)
+            return item['item_id']
+
+        results, errors = multi_item.fan_out(items, call, timeout=0.1)
+
+        self.assertEqual([value for _, value in results], ['fast'])
+        self.assertEqual(errors[0]['item_id'], 'slow')
+
+
+class ResilienceTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        classify = lambda e: (resilience.TRANSIENT, None) if isinstance(e, ConnectionError) else (None, None)
+        self.policy = resilience.Policy(
+            'test', 'TEST', classify,
+            deadline=5.0, base_delay=0.0, max_delay=0.0, rate_limit_delay=0.0, cooldown=60.0,
+        )
+
+    def tearDown(self):
+        resilience._policies.pop('test', None)
+
+    def test_retries_only_idempotent_calls(self):
+        outcomes = [ConnectionError('reset'), ConnectionError('reset'), 'ok']
+
+        def flaky(timeout):
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        self.assertEqual(resilience.call(self.policy, flaky, idempotent=True), 'ok')
+
+        outcomes[:] = [ConnectionError('reset'), 'ok']
+        with self.assertRaises(ConnectionError):
+            resilience.call(self.policy, flaky, idempotent=False)
+
+    def test_breaker_opens_and_fails_fast(self):
+        calls = []
+
+        def down(timeout):
+            calls.append(timeout)
+            raise ConnectionError('refused')
+
+        with patch.dict(os.environ, {'TEST_BREAKER_THRESHOLD': '2', 'TEST_MAX_ATTEMPTS': '1'}):
+            for _ in range(2):
+                with self.assertRaises(ConnectionError):
+                    resilience.call(self.policy, down, idempotent=True)
+            with self.assertRaises(resilience.UpstreamUnavailable) as raised:
+                resilience.call(self.policy, down, idempotent=True)
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(resilience.retry_after(raised.exception), 60)
+
+    def test_plaid_rate_limit_is_not_a_breaker_failure(self):
+        rate_limited = plaid.ApiException(status=429)
+        rate_limited.body = json.dumps({'error_code': 'RATE_LIMIT_EXCEEDED'})
+
+        self.assertEqual(plaid_init.classify_plaid(rate_limited), (resilience.RATE_LIMITED, None))
+        self.assertEqual(plaid_init.classify_plaid(plaid.ApiException(status=400)), (None, None))
+        self.assertTrue(resilience.serve_stale(rate_limited))
+
+    @patch('ledgerly_app.views.get_plaid_client')
+    @patch('ledgerly_app.views.get_supabase_client')
+    def test_stale_streams_served_while_plaid_is_down(self, mock_get_supabase_client, mock_get_plaid_client):
+        mock_get_supabase_client.return_value.table.return_value.select.return_value.eq.return_value.execute.return_value.data = [
+            {'access_token': 'token', 'item_id': 'item_1'}
+        ]
+        mock_plaid_client = mock_get_plaid_client.return_value
+        mock_plaid_client.transactions_recurring_get.return_value.to_dict.return_value = {
+            'inflow_streams': [],
+            'outflow_streams': [{'stream_id': 's1', 'description': 'Gym', 'is_active': True, 'predicted_next_date': '2024-02-01'}],
+        }
+        self.client.get(reverse('get_upcoming_payments'), {'user_id': 'user'})
+        recurring_cache.invalidate('item_1')
+        mock_plaid_client.transactions_recurring_get.side_effect = resilience.UpstreamUnavailable('plaid', 30)
+
+        response = self.client.get(reverse('get_upcoming_payments'), {'user_id': 'user'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()[0]['stream_id'], 's1')
+
+    @patch('ledgerly_app.views.get_supabase_client')
+    def test_supabase_outage_without_cache_is_503(self, mock_get_supabase_client):
+        mock_get_supabase_client.return_value.table.return_value.select.return_value.eq.return_value.execute.side_effect = (
+            resilience.UpstreamUnavailable('supabase', 12)
+        )
+
+        response = self.client.get(reverse('get_subscription_payments'), {'user_id': 'user'})
+
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '12')
+
+
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+
+    @patch('ledgerly_app.views.get_plaid_client')
+    @patch('ledgerly_app.views.get_supabase_client')
+    def test_server_timing_covers_fanned_out_calls(self, mock_get_supabase_client, mock_get_plaid_client):
+        mock_get_supabase_client.return_value.table.return_value.select.return_value.eq.return_value.execute.return_value.data = [
+            {'access_token': 'token_a', 'item_id': 'item_a', 'institution_id': 'ins_a'},
+            {'access_token': 'token_b', 'item_id': 'item_b', 'institution_id': 'ins_b'},
+        ]
+
+        def accounts_balance_get(request_plaid):
+            with instrumentation.timed('plaid', '/accounts/balance/get'):
+                result = MagicMock()
+                result.to_dict.return_value = {'accounts': []}
+                return result
+
+        mock_get_plaid_client.return_value.accounts_balance_get.side_effect = accounts_balance_get
+
+        response = self.client.get(reverse('get_accounts'), {'user_id': 'user'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('plaid;dur=', response['Server-Timing'])
+        self.assertIn('desc="2 calls"', response['Server-Timing'])
+        self.assertIn('render;dur=', response['Server-Timing'])
+
+        metrics = self.client.get(reverse('metrics'))
+        body = metrics.content.decode()
+        self.assertIn('ledgerly_request_duration_seconds_count{endpoint="get_accounts",method="GET",status="200"}', body)
+        self.assertIn('ledgerly_upstream_duration_seconds_bucket{kind="plaid",name="/accounts/balance/get",endpoint="get_accounts"', body)
+
+    @patch.dict(os.environ, {'METRICS_TOKEN': 'scrape-secret'})
+    def test_metrics_token_is_required_when_set(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+
+
+class StartupTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.schema_dir = tempfile.TemporaryDirectory()
+        self.schema_file = os.path.join(self.schema_dir.name, 'openapi.json')
+        openapi.reset()
+
+    def tearDown(self):
+        openapi.reset()
+        self.schema_dir.cleanup()
+
+    def test_worker_boot_does_not_import_plaid_api_supabase_or_numpy(self):
+        code = (
+            "import sys, django; django.setup(); import ledgerly.urls; "
+            "print([m for m in ('plaid.api.plaid_api', 'supabase', 'numpy') if m in sys.modules])"
+        )
+        result = subprocess.run(
+            [sys.executable, '-c', code],
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'ledgerly.settings'},
+            capture_output=True, text=True, check=True,
+        )
+        self.assertEqual(result.stdout.strip().splitlines()[-1], '[]')
+
+    def test_schema_is_served_from_the_prebuilt_file(self):
+        with override_settings(OPENAPI_SCHEMA_FILE=self.schema_file):
+            with open(self.schema_file, 'w') as f:
+                json.dump({'openapi': '3.0.3', 'info': {'title': 'Prebuilt', 'version': '1'}, 'paths': {}}, f)
+
+            with self.assertRaises(CommandError):
+                call_command('build_openapi_schema', check=True, stdout=io.StringIO())
+
+            response = self.client.get('/api/schema/', {'format': 'json'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['info']['title'], 'Prebuilt')
+            self.assertIn(b'title: Prebuilt', self.client.get('/api/schema/').content)
+
+            call_command('build_openapi_schema', stdout=io.StringIO())
+            call_command('build_openapi_schema', check=True, stdout=io.StringIO())
+            response = self.client.get('/api/schema/', {'format': 'json'})
+            self.assertIn('/api/health/', response.json()['paths'])
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def mock_async_supabase(self, mock_get_async_supabase_client, data):
+        supabase = MagicMock()
+        supabase.table.return_value.select.return_value.eq.return_value.execute = AsyncMock(return_value=MagicMock(data=data))
+        mock_get_async_supabase_client.return_value = supabase
+
+    @patch('ledgerly_app.async_views.get_async_plaid_client')
+    @patch('ledgerly_app.async_views.get_async_supabase_client')
+    async def test_async_balance_gathers_items(self, mock_get_async_supabase_client, mock_get_async_plaid_client):
+        self.mock_async_supabase(mock_get_async_supabase_client, [
+            {'access_token': 'token_a', 'item_id': 'item_a', 'institution_id': 'ins_a'},
+            {'access_token': 'token_b', 'item_id': 'item_b', 'institution_id': 'ins_b'},
+        ])
+
+        async def accounts_balance_get(access_token):
+            return {'accounts': [{'account_id': f'acc_{access_token}'}]}
+
+        mock_get_async_plaid_client.return_value.accounts_balance_get = accounts_balance_get
+
+        response = await AsyncClient().get(reverse('async_get_accounts'), {'user_id': 'user'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(a['account_id'], a['item_id']) for a in response.json()['accounts']],
+            [('acc_token_a', 'item_a'), ('acc_token_b', 'item_b')],
+        )
+
+    @patch.dict(os.environ, {'SUPABASE_JWT_SECRET': 'test-secret-with-at-least-32-bytes', 'SUPABASE_AUTH_MODE': 'local'})
+    @patch('ledgerly_app.async_views.get_async_plaid_client')
+    @patch('ledgerly_app.async_views.get_async_supabase_client')
+    async def test_async_upcoming_authenticates_locally(self, mock_get_async_supabase_client, mock_get_async_plaid_client):
+        self.mock_async_supabase(mock_get_async_supabase_client, [{'access_token': 'token', 'item_id': 'item', 'institution_id': None}])
+        mock_get_async_plaid_client.return_value.transactions_recurring_get = AsyncMock(return_value={
+            'inflow_streams': [],
+            'outflow_streams': [
+                {'stream_id': 'later', 'is_active': True, 'predicted_next_date': '2024-03-01'},
+                {'stream_id': 'sooner', 'is_active': True, 'predicted_next_date': '2024-02-01'},
+            ],
+        })
+        token = jwt.encode(
+            {'sub': 'user-uuid', 'aud': 'authenticated', 'exp': int(time.time()) + 3600},
+            'test-secret-with-at-least-32-bytes', algorithm='HS256',
+        )
+
+        response = await AsyncClient().get(reverse('async_get_upcoming_payments'), headers={'Authorization': f'Bearer {token}'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([s['stream_id'] for s in response.json()], ['sooner', 'later'])
+        mock_get_async_supabase_client.return_value.table.return_value.select.return_value.eq.assert_called_with('user_id', 'user-uuid')
+
+    @patch('ledgerly_app.supabase_init.aclose_supabase_clients', new_callable=AsyncMock)
+    @patch('ledgerly_app.plaid_init.aclose_plaid_client', new_callable=AsyncMock)
+    async def test_lifespan_shutdown_closes_async_clients(self, mock_aclose_plaid, mock_aclose_supabase):
+        from ledgerly.asgi import application
+        messages = iter([{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}])
+        sent = []
+
+        async def receive():
+            return next(messages)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        await application({'type': 'lifespan'}, receive, send)
+
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+        mock_aclose_plaid.assert_awaited_once()
+        mock_aclose_supabase.assert_awaited_once()
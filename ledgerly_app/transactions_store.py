@@ -0,0 +1,201 @@
+import base64
+from datetime import date
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import PlaidAccount, PlaidItemSyncState, PlaidTransaction
+from . import rollups
+
+BULK_BATCH_SIZE = 500
+
+TRANSACTION_UPDATE_FIELDS = [
+    'user_id', 'item_id', 'account_id', 'date', 'authorized_date', 'name',
+    'merchant_name', 'amount', 'iso_currency_code', 'pending', 'category_primary',
+    'category_detailed', 'payment_channel', 'data', 'updated_at',
+]
+
+ACCOUNT_UPDATE_FIELDS = [
+    'item_id', 'user_id', 'name', 'official_name', 'mask', 'type', 'subtype',
+    'current_balance', 'available_balance', 'iso_currency_code', 'updated_at',
+]
+
+
+def to_plain_dict(value):
+    """Plaid models expose to_dict(); tests and raw payloads are already dicts."""
+    if hasattr(value, 'to_dict'):
+        return value.to_dict()
+    return dict(value)
+
+
+def _as_date(value):
+    if value is None or isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value))
+
+
+def _as_decimal(value):
+    if value is None:
+        return None
+    return Decimal(str(value)).quantize(Decimal('0.01'))
+
+
+def _as_str(value):
+    return None if value is None else str(value)
+
+
+def build_transaction(user_id, item_id, txn):
+    category = txn.get('personal_finance_category') or {}
+    return PlaidTransaction(
+        transaction_id=txn['transaction_id'],
+        user_id=user_id,
+        item_id=item_id,
+        account_id=txn.get('account_id') or '',
+        date=_as_date(txn.get('date')),
+        authorized_date=_as_date(txn.get('authorized_date')),
+        name=txn.get('name') or '',
+        merchant_name=txn.get('merchant_name'),
+        amount=_as_decimal(txn.get('amount') or 0),
+        iso_currency_code=txn.get('iso_currency_code'),
+        pending=bool(txn.get('pending')),
+        category_primary=category.get('primary'),
+        category_detailed=category.get('detailed'),
+        payment_channel=_as_str(txn.get('payment_channel')),
+        data=txn,
+    )
+
+
+def build_account(user_id, item_id, account):
+    balances = account.get('balances') or {}
+    return PlaidAccount(
+        account_id=account['account_id'],
+        item_id=item_id,
+        user_id=user_id,
+        name=account.get('name') or '',
+        official_name=account.get('official_name'),
+        mask=account.get('mask'),
+        type=_as_str(account.get('type')) or '',
+        subtype=_as_str(account.get('subtype')),
+        current_balance=_as_decimal(balances.get('current')),
+        available_balance=_as_decimal(balances.get('available')),
+        iso_currency_code=balances.get('iso_currency_code'),
+    )
+
+
+def apply_sync_delta(user_id, item_id, added=(), modified=(), removed=(), accounts=()):
+    """Apply one transactions/sync page to the local store.
+
+    ``added`` and ``modified`` are upserted together by transaction_id, and
+    ``removed`` rows are deleted in one statement. The rollups move by the
+    difference between the stored rows and the page's. Returns per-kind counts.
+    """
+    rows = [build_transaction(user_id, item_id, to_plain_dict(t)) for t in list(added) + list(modified)]
+    removed_ids = [to_plain_dict(t)['transaction_id'] for t in removed]
+    account_rows = [build_account(user_id, item_id, to_plain_dict(a)) for a in accounts]
+    touched_ids = [row.transaction_id for row in rows] + removed_ids
+
+    with transaction.atomic():
+        # Stored versions of every row this page replaces or removes, for the rollups.
+        before = list(
+            PlaidTransaction.objects.filter(transaction_id__in=touched_ids).only(*rollups.TRANSACTION_FIELDS)
+        ) if touched_ids else []
+        if account_rows:
+            PlaidAccount.objects.bulk_create(
+                account_rows,
+                batch_size=BULK_BATCH_SIZE,
+                update_conflicts=True,
+                unique_fields=['account_id'],
+                update_fields=ACCOUNT_UPDATE_FIELDS,
+            )
+        if rows:
+            PlaidTransaction.objects.bulk_create(
+                rows,
+                batch_size=BULK_BATCH_SIZE,
+                update_conflicts=True,
+                unique_fields=['transaction_id'],
+                update_fields=TRANSACTION_UPDATE_FIELDS,
+            )
+        if removed_ids:
+            PlaidTransaction.objects.filter(transaction_id__in=removed_ids).delete()
+        rollups.apply_delta(before, rows)
+
+    return {'added': len(added), 'modified': len(modified), 'removed': len(removed_ids)}
+
+
+def save_cursor(user_id, item_id, cursor):
+    PlaidItemSyncState.objects.update_or_create(
+        item_id=item_id,
+        defaults={'user_id': user_id, 'cursor': cursor or '', 'last_synced_at': timezone.now()},
+    )
+
+
+def get_cursor(item_id):
+    state = PlaidItemSyncState.objects.filter(item_id=item_id).only('cursor').first()
+    return state.cursor if state and state.cursor else None
+
+
+def get_user_cursors(user_id):
+    """Sync cursor per item for every item of the user's that has synced."""
+    return dict(PlaidItemSyncState.objects.filter(user_id=user_id).values_list('item_id', 'cursor'))
+
+
+def get_user_transactions(user_id, item_ids=None):
+    """Stored transactions for a user, newest first (served from txn_user_date_idx)."""
+    queryset = PlaidTransaction.objects.filter(user_id=user_id)
+    if item_ids is not None:
+        queryset = queryset.filter(item_id__in=item_ids)
+    return queryset.order_by('-date', '-id')
+
+
+def get_user_accounts(user_id):
+    return PlaidAccount.objects.filter(user_id=user_id).order_by('name')
+
+
+HISTORY_DEFAULT_LIMIT = 100
+HISTORY_MAX_LIMIT = 500
+
+
+def encode_history_cursor(row):
+    """Opaque keyset cursor pointing just past ``row`` in (-date, -id) order."""
+    raw = f'{row.date.isoformat()}|{row.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_history_cursor(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        day, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return date.fromisoformat(day), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+
+
+def history_queryset(user_id, start_date=None, end_date=None, account_ids=None, after=None):
+    """Filtered history in (-date, -id) order, starting after the keyset cursor ``after``.
+
+    Keyset rather than OFFSET paging: every page is an index range scan on
+    txn_user_date_idx no matter how deep the client has paged.
+    """
+    queryset = PlaidTransaction.objects.filter(user_id=user_id)
+    if start_date:
+        queryset = queryset.filter(date__gte=start_date)
+    if end_date:
+        queryset = queryset.filter(date__lte=end_date)
+    if account_ids:
+        queryset = queryset.filter(account_id__in=account_ids)
+    if after:
+        after_date, after_pk = decode_history_cursor(after)
+        queryset = queryset.filter(Q(date__lt=after_date) | Q(date=after_date, pk__lt=after_pk))
+    return queryset.order_by('-date', '-id')
+
+
+def history_page(user_id, limit=HISTORY_DEFAULT_LIMIT, **filters):
+    """One page of history plus the cursor for the next page (None at the end)."""
+    limit = max(1, min(int(limit), HISTORY_MAX_LIMIT))
+    rows = list(history_queryset(user_id, **filters).only('id', 'date', 'data')[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_history_cursor(rows[-1]) if has_more else None
+    return [r.data for r in rows], next_cursor
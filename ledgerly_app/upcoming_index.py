@@ -0,0 +1,75 @@
+"""Per-item index of upcoming payments, ordered by predicted_next_date.
+
+recurring_cache builds an item's index whenever it refills that item's
+streams, so a RECURRING_TRANSACTIONS_UPDATE webhook rebuilds only the item
+it names. Queries bisect each item's index to the requested date range and
+k-way merge the slices, so no request sorts the full stream list.
+"""
+import heapq
+from bisect import bisect_left, bisect_right
+from datetime import date
+from itertools import islice
+
+from . import multi_item
+
+
+def parse_predicted_date(value):
+    if not value:
+        return None
+    if isinstance(value, date):
+        return value
+    if hasattr(value, "date"):
+        return value.date()
+    return date.fromisoformat(str(value))
+
+
+def build(outflow_streams):
+    """Index for one item: active outflow streams with a predicted date, soonest first.
+
+    ``dates`` holds ISO dates (which sort like the dates themselves) parallel
+    to ``streams``, so ranges can be found with bisect.
+    """
+    entries = []
+    for stream in outflow_streams:
+        if not stream.get('is_active'):
+            continue
+        predicted = parse_predicted_date(stream.get('predicted_next_date'))
+        if predicted is not None:
+            entries.append((predicted.isoformat(), stream))
+    entries.sort(key=lambda entry: entry[0])
+    return {
+        'dates': [d for d, _ in entries],
+        'streams': [s for _, s in entries],
+    }
+
+
+def for_streams(streams):
+    """The index stored with a recurring-cache entry, building it for older entries."""
+    index = streams.get('upcoming')
+    if index is None:
+        index = build(streams['outflow_streams'])
+    return index
+
+
+def _item_slice(item, index, start, end):
+    dates = index['dates']
+    lo = bisect_left(dates, start) if start else 0
+    hi = bisect_right(dates, end) if end else len(dates)
+    tag = multi_item.item_tag(item)
+    for i in range(lo, hi):
+        yield dates[i], {**index['streams'][i], **tag}
+
+
+def query(indexed_items, start=None, end=None, limit=None):
+    """Upcoming streams across items with ``start <= predicted_next_date <= end``.
+
+    ``indexed_items`` is a list of ``(item, index)``; rows come back tagged by
+    item, soonest first (ties keep item order), at most ``limit`` of them.
+    """
+    start = start.isoformat() if start else None
+    end = end.isoformat() if end else None
+    merged = heapq.merge(
+        *(_item_slice(item, index, start, end) for item, index in indexed_items),
+        key=lambda entry: entry[0],
+    )
+    return [stream for _, stream in islice(merged, limit)]
@@ -1,19 +1,31 @@
 
 from django.urls import path
-from . import views
+from . import async_views, instrumentation, views
 
 urlpatterns = [
+    path('health/', views.health_check, name='health_check'),
+    path('metrics/', instrumentation.metrics_view, name='metrics'),
     path('test-auth/', views.test_auth, name='test_auth'),
     path('create-link-token/', views.create_link_token, name='create_link_token'),
     path('exchange-public-token/', views.exchange_public_token, name='exchange_public_token'),
     path('check-plaid-status/', views.check_plaid_status, name='check_plaid_status'),
     path('get-account-balance/', views.get_account_balance, name='get_accounts'),
     path('get-transactions/', views.get_transactions, name='get_transactions'),
+    path('transactions/history/', views.get_transaction_history, name='get_transaction_history'),
+    path('analytics/spending/', views.get_spending_analytics, name='get_spending_analytics'),
     path('plaid-webhook/', views.handle_plaid_webhook, name='plaid-webhook'),
     path('refresh-transactions/', views.refresh_transactions, name='refresh_transactions'),
     path('connected-institutions/', views.get_connected_institutions, name='get_connected_institutions'),
     path('credit-score/', views.get_credit_score, name='get_credit_score'),
     path('create-transaction/', views.create_sandbox_transaction, name='create_sandbox_transaction'),
+    path('create-transactions/bulk/', views.create_sandbox_transactions_bulk, name='create_sandbox_transactions_bulk'),
     path('subscriptions/', views.get_subscription_payments, name='get_subscription_payments'),
     path('upcoming-payments/', views.get_upcoming_payments, name='get_upcoming_payments'),
+    path('forecast/', views.get_cash_flow_forecast, name='get_cash_flow_forecast'),
+    # Async variants for ASGI deployments (ledgerly.asgi)
+    path('async/get-account-balance/', async_views.get_account_balance, name='async_get_accounts'),
+    path('async/get-transactions/', async_views.get_transactions, name='async_get_transactions'),
+    path('async/refresh-transactions/', async_views.refresh_transactions, name='async_refresh_transactions'),
+    path('async/subscriptions/', async_views.get_subscription_payments, name='async_get_subscription_payments'),
+    path('async/upcoming-payments/', async_views.get_upcoming_payments, name='async_get_upcoming_payments'),
 ]
@@ -1,24 +1,22 @@
-
 import hashlib
+import json
 import os
 from datetime import date
-from datetime import date
+from typing import TYPE_CHECKING
 
-from plaid.model.credit_account_subtype import CreditAccountSubtype
-from plaid.model.credit_account_subtypes import CreditAccountSubtypes
-from plaid.model.credit_filter import CreditFilter
-from plaid.model.depository_account_subtype import DepositoryAccountSubtype
-from plaid.model.depository_account_subtypes import DepositoryAccountSubtypes
-from plaid.model.depository_filter import DepositoryFilter
-from plaid.model.link_token_account_filters import LinkTokenAccountFilters
-from plaid.model.link_token_transactions import LinkTokenTransactions
-from rest_framework.decorators import api_view, permission_classes
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework import status
-from supabase import create_client, Client
+from rest_framework.settings import api_settings
 from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiTypes
 from .plaid_init import get_plaid_client
+from .supabase_init import get_supabase_client, check_supabase_health
+from .renderers import NDJSONRenderer
+from . import analytics, balance_cache, conditional, forecast, institutions, item_directory, multi_item, recurring_cache, resilience, sandbox_ingest, single_flight, subscriptions, sync_engine, transactions_store, upcoming_index, webhook_queue
 # Import schema to register the authentication extension
 from . import schema
 from .serializers import (
@@ -28,21 +26,12 @@ from .serializers import (
     CreditScoreRequestSerializer,
     SandboxTransactionCreateSerializer,
 )
-from plaid.model.link_token_create_request import LinkTokenCreateRequest
-from plaid.model.link_token_create_request_user import LinkTokenCreateRequestUser
-from plaid.model.item_public_token_exchange_request import ItemPublicTokenExchangeRequest
-from plaid.model.products import Products
-from plaid.model.country_code import CountryCode
-from plaid.model.accounts_balance_get_request import AccountsBalanceGetRequest
-from plaid.model.transactions_sync_request import TransactionsSyncRequest
-from plaid.model.transactions_recurring_get_request import TransactionsRecurringGetRequest
-from plaid.model.transactions_recurring_get_request import TransactionsRecurringGetRequest
-from plaid.model.transactions_refresh_request import TransactionsRefreshRequest
-from plaid.model.institutions_get_by_id_request import InstitutionsGetByIdRequest
-from plaid.model.user_create_request import UserCreateRequest
-from plaid.model.cra_check_report_lend_score_get_request import CraCheckReportLendScoreGetRequest
-from plaid.model.custom_sandbox_transaction import CustomSandboxTransaction
-from plaid.model.sandbox_transactions_create_request import SandboxTransactionsCreateRequest
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+# Plaid request models are imported inside the views that build them, so
+# they load on first use instead of on every worker boot.
 
 @extend_schema(
     description="Test authentication endpoint. Returns user details from Supabase token.",
@@ -58,6 +47,71 @@ def test_auth(request):
     })
 
 
+def _fetch_recurring_streams(items):
+    """Cached recurring streams per item, fetched in parallel: ``(results, errors)``."""
+    client = get_plaid_client()
+    return multi_item.fan_out(
+        items,
+        lambda item: recurring_cache.get_recurring_streams(item['item_id'], item['access_token'], client=client),
+    )
+
+
+def _merge_streams(results):
+    """Inflow and outflow streams of every item in ``results``, tagged by item."""
+    inflow_streams, outflow_streams = [], []
+    for item, streams in results:
+        inflow_streams.extend(multi_item.tag_rows(item, streams['inflow_streams']))
+        outflow_streams.extend(multi_item.tag_rows(item, streams['outflow_streams']))
+    return inflow_streams, outflow_streams
+
+
+def _partial_failure_headers(errors):
+    # List endpoints return bare arrays, so failed items are reported in a header.
+    if not errors:
+        return None
+    return {'X-Failed-Items': ','.join(e['item_id'] or '' for e in errors)}
+
+
+def _error_response(e):
+    # A failure of the request itself is a 400. While Plaid or Supabase is
+    # down or rate limiting us it is a 503, with Retry-After from resilience.
+    retry_after = resilience.retry_after(e)
+    if retry_after is None:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(
+        {'error': str(e)},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={'Retry-After': str(retry_after)},
+    )
+
+
+@extend_schema(
+    description="Health check for upstream connections.",
+    responses={200: {"type": "object", "properties": {
+        "supabase": {"type": "boolean"},
+        "recurring_cache": {"type": "object", "description": "Recurring-stream cache hit/miss counters for this worker"},
+        "circuits": {"type": "object", "description": "Circuit breaker state per upstream for this worker"},
+    }}}
+)
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def health_check(request):
+    try:
+        supabase_ok = check_supabase_health()
+    except Exception as e:
+        return Response({'supabase': False, 'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    return Response(
+        {
+            'supabase': supabase_ok,
+            'recurring_cache': recurring_cache.stats(),
+            'single_flight': single_flight.stats(),
+            'circuits': resilience.stats(),
+        },
+        status=status.HTTP_200_OK if supabase_ok else status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
+
+
 @extend_schema(
     description="Get Plaid CRA LendScore (credit score) for a user.",
     request=CreditScoreRequestSerializer,
@@ -108,45 +162,37 @@ def get_subscription_payments(request):
         )
 
     try:
-        url: str = os.environ.get("SUPABASE_URL")
-        key: str = os.environ.get("SUPABASE_KEY")
-        supabase: Client = create_client(url, key)
+        supabase: Client = get_supabase_client()
 
-        response = supabase.table("user_plaid_items").select("access_token").eq("user_id", user_id).execute()
-        if not response.data or len(response.data) == 0:
+        items = item_directory.get_user_items(user_id, supabase)
+        if not items:
             return Response({'error': 'No Plaid access token found for user'}, status=status.HTTP_404_NOT_FOUND)
 
-        access_token = response.data[0]['access_token']
-        client = get_plaid_client()
-        request_plaid = TransactionsRecurringGetRequest(access_token=access_token)
-        response_plaid = client.transactions_recurring_get(request_plaid)
-
-        outflow_streams = response_plaid.to_dict().get('outflow_streams', [])
-
-        def is_subscription(stream: dict) -> bool:
-            primary = (stream.get('personal_finance_category_primary') or '').upper()
-            detailed = (stream.get('personal_finance_category_detailed') or '').upper()
-            description = (stream.get('description') or '').upper()
-            merchant = (stream.get('merchant_name') or '').upper()
-            return (
-                'SUBSCRIPTION' in primary
-                or 'SUBSCRIPTION' in detailed
-                or 'SUBSCRIPTION' in description
-                or 'SUBSCRIBE' in description
-                or 'SUBSCRIPTION' in merchant
-            )
+        results, errors = _fetch_recurring_streams(items)
+        if errors and not results:
+            return Response({'error': 'All Plaid items failed', 'errors': errors}, status=status.HTTP_502_BAD_GATEWAY)
 
-        subscriptions = [s for s in outflow_streams if s.get('is_active') and is_subscription(s)]
+        classifier = subscriptions.get_classifier()
+        etag = None if errors else conditional.recurring_etag('subscriptions', user_id, results, classifier.version)
+        not_modified = conditional.not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
 
-        return Response(subscriptions)
+        _, outflow_streams = _merge_streams(results)
+        subscription_streams = classifier.select(outflow_streams)
+
+        return conditional.tag(Response(subscription_streams, headers=_partial_failure_headers(errors)), etag)
     except Exception as e:
-        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return _error_response(e)
 
 
 @extend_schema(
-    description="Get upcoming payments for a user.",
+    description="Get upcoming payments for a user, soonest first, optionally limited to a predicted-date range.",
     parameters=[
         OpenApiParameter("user_id", OpenApiTypes.STR, location=OpenApiParameter.QUERY, description="User ID (optional, for testing)"),
+        OpenApiParameter("from", OpenApiTypes.DATE, location=OpenApiParameter.QUERY, description="Earliest predicted date (inclusive)"),
+        OpenApiParameter("to", OpenApiTypes.DATE, location=OpenApiParameter.QUERY, description="Latest predicted date (inclusive)"),
+        OpenApiParameter("limit", OpenApiTypes.INT, location=OpenApiParameter.QUERY, description="Maximum number of payments"),
     ],
     responses={200: {"type": "array", "description": "Upcoming recurring payments"}},
 )
@@ -160,40 +206,105 @@ def get_upcoming_payments(request):
         )
 
     try:
-        url: str = os.environ.get("SUPABASE_URL")
-        key: str = os.environ.get("SUPABASE_KEY")
-        supabase: Client = create_client(url, key)
+        supabase: Client = get_supabase_client()
 
-        response = supabase.table("user_plaid_items").select("access_token").eq("user_id", user_id).execute()
-        if not response.data or len(response.data) == 0:
+        items = item_directory.get_user_items(user_id, supabase)
+        if not items:
             return Response({'error': 'No Plaid access token found for user'}, status=status.HTTP_404_NOT_FOUND)
 
-        access_token = response.data[0]['access_token']
-        client = get_plaid_client()
-        request_plaid = TransactionsRecurringGetRequest(access_token=access_token)
-        response_plaid = client.transactions_recurring_get(request_plaid)
+        start = date.fromisoformat(request.query_params['from']) if request.query_params.get('from') else None
+        end = date.fromisoformat(request.query_params['to']) if request.query_params.get('to') else None
+        limit = int(request.query_params['limit']) if request.query_params.get('limit') else None
+
+        results, errors = _fetch_recurring_streams(items)
+        if errors and not results:
+            return Response({'error': 'All Plaid items failed', 'errors': errors}, status=status.HTTP_502_BAD_GATEWAY)
 
-        outflow_streams = response_plaid.to_dict().get('outflow_streams', [])
+        etag = None if errors else conditional.recurring_etag('upcoming', user_id, results, start, end, limit)
+        not_modified = conditional.not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
 
-        upcoming = [
-            s for s in outflow_streams
-            if s.get('is_active') and s.get('predicted_next_date')
-        ]
+        upcoming = upcoming_index.query(
+            [(item, upcoming_index.for_streams(streams)) for item, streams in results],
+            start, end, limit,
+        )
+
+        return conditional.tag(Response(upcoming, headers=_partial_failure_headers(errors)), etag)
+    except Exception as e:
+        return _error_response(e)
 
-        def parse_predicted_date(value):
-            if not value:
-                return date.max
-            if isinstance(value, date):
-                return value
-            if hasattr(value, "date"):
-                return value.date()
-            return date.fromisoformat(str(value))
 
-        upcoming.sort(key=lambda s: parse_predicted_date(s.get('predicted_next_date')))
+def _list_param(value):
+    # A comma-separated query parameter, or a JSON list in a POST body.
+    if not value:
+        return []
+    if isinstance(value, str):
+        return [part.strip() for part in value.split(',') if part.strip()]
+    return list(value)
 
-        return Response(upcoming)
+
+@extend_schema(
+    description=(
+        "Cash-flow forecast: each depository account's projected end-of-day balance for the next `days` days, "
+        "from its latest balance and the user's active recurring inflow and outflow streams, with the first "
+        "projected overdraft date per account and combined. POST runs a scenario: the same parameters in a JSON "
+        "body, plus `add`, a list of one-off payments `{date, amount, account_id?, description?}` where a "
+        "positive amount is money out (account_id defaults to the first account)."
+    ),
+    parameters=[
+        OpenApiParameter("user_id", OpenApiTypes.STR, location=OpenApiParameter.QUERY, description="User ID (optional, for testing)"),
+        OpenApiParameter("days", OpenApiTypes.INT, location=OpenApiParameter.QUERY, description=f"Days to project, today first (default {forecast.DEFAULT_DAYS}, max {forecast.MAX_DAYS})"),
+        OpenApiParameter("skip", OpenApiTypes.STR, location=OpenApiParameter.QUERY, description="Comma-separated stream IDs to leave out, e.g. a cancelled subscription"),
+        OpenApiParameter("threshold", OpenApiTypes.NUMBER, location=OpenApiParameter.QUERY, description="Balance below which a day counts as an overdraft (default 0)"),
+        OpenApiParameter("max_age", OpenApiTypes.INT, location=OpenApiParameter.QUERY, description="Oldest acceptable starting balance in seconds (default FORECAST_BALANCE_MAX_AGE, 3600)"),
+    ],
+    responses={200: {"type": "object", "description": "dates, per-account and combined balance series, and the projected payments"}},
+)
+@api_view(['GET', 'POST'])
+def get_cash_flow_forecast(request):
+    params = request.query_params if request.method == 'GET' else request.data
+    user_id = request.user.username if request.user.is_authenticated else (params.get('user_id') or request.query_params.get('user_id'))
+    if not user_id:
+        return Response(
+            {'error': 'User ID is required. Please authenticate or provide "user_id" in query params.'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    try:
+        supabase: Client = get_supabase_client()
+
+        items = item_directory.get_user_items(user_id, supabase)
+        if not items:
+            return Response({'error': 'No Plaid access token found for user'}, status=status.HTTP_404_NOT_FOUND)
+
+        days = int(params.get('days') or forecast.DEFAULT_DAYS)
+        skip = _list_param(params.get('skip'))
+        add = (params.get('add') or []) if request.method == 'POST' else []
+        threshold = float(params.get('threshold') or 0)
+        # Starting balances need not be real-time: accounts/get is free and the cache absorbs repeat scenarios.
+        max_age = int(params.get('max_age') or os.getenv('FORECAST_BALANCE_MAX_AGE', 3600))
+
+        client = get_plaid_client()
+        results, errors = multi_item.fan_out(items, lambda item: (
+            balance_cache.get_balances(item['item_id'], item['access_token'], max_age, realtime=False, client=client),
+            recurring_cache.get_recurring_streams(item['item_id'], item['access_token'], client=client),
+        ))
+        if errors and not results:
+            return Response({'error': 'All Plaid items failed', 'errors': errors}, status=status.HTTP_502_BAD_GATEWAY)
+
+        today = timezone.localdate()
+        etag = None
+        if request.method == 'GET' and not errors:
+            etag = conditional.forecast_etag(user_id, results, today, days, sorted(skip), threshold)
+        not_modified = conditional.not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+
+        report = forecast.build(results, today, days, skip=skip, add=add, threshold=threshold)
+        return conditional.tag(Response({**report, 'errors': errors}), etag)
     except Exception as e:
-        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return _error_response(e)
 
 
 @extend_schema(
@@ -223,17 +334,18 @@ def create_sandbox_transaction(request):
         )
 
     try:
-        url: str = os.environ.get("SUPABASE_URL")
-        key: str = os.environ.get("SUPABASE_KEY")
-        supabase: Client = create_client(url, key)
+        supabase: Client = get_supabase_client()
 
-        response = supabase.table("user_plaid_items").select("access_token").eq("user_id", user_id).execute()
-        if not response.data or len(response.data) == 0:
+        items = item_directory.get_user_items(user_id, supabase)
+        if not items:
             return Response({'error': 'No Plaid access token found for user'}, status=status.HTTP_404_NOT_FOUND)
 
-        access_token = response.data[0]['access_token']
+        access_token = items[0]['access_token']
         client = get_plaid_client()
 
+        from plaid.model.custom_sandbox_transaction import CustomSandboxTransaction
+        from plaid.model.sandbox_transactions_create_request import SandboxTransactionsCreateRequest
+
         tx = CustomSandboxTransaction(
             date_transacted=date.fromisoformat(date_transacted) if date_transacted else date.today(),
             date_posted=date.fromisoformat(date_posted) if date_posted else date.today(),
@@ -249,7 +361,56 @@ def create_sandbox_transaction(request):
         create_response = client.sandbox_transactions_create(create_request)
         return Response(create_response.to_dict())
     except Exception as e:
-        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return _error_response(e)
+
+@extend_schema(
+    description=(
+        "Add many sandbox transactions to a user's Plaid item. Send CSV (Content-Type: text/csv, with a header row) "
+        "or NDJSON (application/x-ndjson) rows with the fields of the single-transaction endpoint. All rows are "
+        "validated before anything is sent; they then go to Plaid in batches of 10, several at a time."
+    ),
+    parameters=[
+        OpenApiParameter("user_id", OpenApiTypes.STR, location=OpenApiParameter.QUERY, description="User ID (optional, for testing)"),
+        OpenApiParameter("item_id", OpenApiTypes.STR, location=OpenApiParameter.QUERY, description="Item to add to (defaults to the user's first item)"),
+    ],
+    request={"text/csv": {"type": "string"}, "application/x-ndjson": {"type": "string"}},
+    responses={200: {"type": "object", "description": "submitted, total, batches and failed_batches"}},
+)
+@api_view(['POST'])
+def create_sandbox_transactions_bulk(request):
+    user_id = request.user.username if request.user.is_authenticated else request.query_params.get('user_id')
+    if not user_id:
+        return Response(
+            {'error': 'User ID is required. Please authenticate or provide "user_id" in query params.'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    try:
+        fmt = 'csv' if request.content_type.startswith('text/csv') else 'ndjson'
+        rows = sandbox_ingest.parse_rows(request.body.decode('utf-8'), fmt)
+        if not rows:
+            return Response({'error': 'No rows in request body.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        validated, errors = sandbox_ingest.validate_rows(rows)
+        if errors:
+            return Response({'error': 'Invalid rows; nothing was sent.', 'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        supabase: Client = get_supabase_client()
+        items = item_directory.get_user_items(user_id, supabase)
+        item_id = request.query_params.get('item_id')
+        if item_id:
+            items = [item for item in items if item['item_id'] == item_id]
+        if not items:
+            return Response({'error': 'No Plaid access token found for user'}, status=status.HTTP_404_NOT_FOUND)
+
+        summary = sandbox_ingest.ingest(
+            items[0]['access_token'],
+            sandbox_ingest.build_transactions(validated),
+            client=get_plaid_client(),
+        )
+        return Response(summary)
+    except Exception as e:
+        return _error_response(e)
 
 @extend_schema(
     description="Create a Plaid Link Token.",
@@ -274,6 +435,19 @@ def create_link_token(request):
         if not user_id:
              return Response({'error': 'User ID is required. Please authenticate or provide "user_id" in body.'}, status=status.HTTP_400_BAD_REQUEST)
 
+        from plaid.model.country_code import CountryCode
+        from plaid.model.credit_account_subtype import CreditAccountSubtype
+        from plaid.model.credit_account_subtypes import CreditAccountSubtypes
+        from plaid.model.credit_filter import CreditFilter
+        from plaid.model.depository_account_subtype import DepositoryAccountSubtype
+        from plaid.model.depository_account_subtypes import DepositoryAccountSubtypes
+        from plaid.model.depository_filter import DepositoryFilter
+        from plaid.model.link_token_account_filters import LinkTokenAccountFilters
+        from plaid.model.link_token_create_request import LinkTokenCreateRequest
+        from plaid.model.link_token_create_request_user import LinkTokenCreateRequestUser
+        from plaid.model.link_token_transactions import LinkTokenTransactions
+        from plaid.model.products import Products
+
         request_plaid = LinkTokenCreateRequest(
             products=[Products('transactions')],
             transactions=LinkTokenTransactions(
@@ -304,7 +478,7 @@ def create_link_token(request):
         print(response)
         return Response(response.to_dict())
     except Exception as e:
-        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return _error_response(e)
 
 @extend_schema(
     description="Exchange Plaid Public Token for Access Token and store in Supabase.",
@@ -323,9 +497,7 @@ def exchange_public_token(request):
 
     try:
         # Check if user already has an item with this institution
-        url: str = os.environ.get("SUPABASE_URL")
-        key: str = os.environ.get("SUPABASE_KEY")
-        supabase: Client = create_client(url, key)
+        supabase: Client = get_supabase_client()
 
         # Get user_id from authenticated user OR request body (for testing)
         user_id = None
@@ -338,11 +510,13 @@ def exchange_public_token(request):
              return Response({'error': 'User ID is required. Please authenticate or provide "user_id" in body.'}, status=status.HTTP_400_BAD_REQUEST)
 
         # check duplicate institution
-        existing = supabase.table("user_plaid_items").select("*").eq("user_id", user_id).eq("institution_id", institution_id).execute()
-        if existing.data and len(existing.data) > 0:
+        existing = item_directory.get_user_items(user_id, supabase)
+        if any(item.get('institution_id') == institution_id for item in existing):
              return Response({'message': 'Institution already linked'}, status=status.HTTP_200_OK)
 
         client = get_plaid_client()
+        from plaid.model.item_public_token_exchange_request import ItemPublicTokenExchangeRequest
+
         exchange_request = ItemPublicTokenExchangeRequest(
             public_token=public_token
         )
@@ -359,13 +533,11 @@ def exchange_public_token(request):
         
         # Insert into user_plaid_items table
         supabase.table("user_plaid_items").insert(data).execute()
+        item_directory.invalidate_user(user_id)
 
         return Response({'message': 'Public token exchanged and saved successfully'})
     except Exception as e:
-        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
-
-
-from plaid.model.sandbox_public_token_create_request import SandboxPublicTokenCreateRequest
+        return _error_response(e)
 
 
 # @api_view(['POST'])
@@ -374,6 +546,8 @@ from plaid.model.sandbox_public_token_create_request import SandboxPublicTokenCr
 #     Simulates the frontend 'onSuccess' by generating a public_token
 #     directly in the Sandbox environment.
 #     """
+#     from plaid.model.sandbox_public_token_create_request import SandboxPublicTokenCreateRequest
+#
 #     try:
 #         client = get_plaid_client()
 #
@@ -410,25 +584,25 @@ def check_plaid_status(request):
          return Response({'error': 'User ID is required. Please authenticate or provide "user_id" in query params.'}, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        url: str = os.environ.get("SUPABASE_URL")
-        key: str = os.environ.get("SUPABASE_KEY")
-        supabase: Client = create_client(url, key)
+        supabase: Client = get_supabase_client()
         
-        response = supabase.table("user_plaid_items").select("*", count="exact").eq("user_id", user_id).execute()
-        
-        is_connected = False
-        if response.count and response.count > 0:
-            is_connected = True
-            
+        is_connected = bool(item_directory.get_user_items(user_id, supabase))
+
         return Response({'is_connected': is_connected})
 
     except Exception as e:
-        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return _error_response(e)
 
 @extend_schema(
-    description="Get accounts from Plaid.",
+    description=(
+        "Get account balances for every linked item, queried in parallel. Items that fail are listed in `errors`. "
+        "Balances up to `max_age` seconds old are served from the balance cache; each item reports `as_of` and "
+        "`age_seconds`, and `age_seconds` at the top level is that of the oldest item."
+    ),
     parameters=[
-        OpenApiParameter("user_id", OpenApiTypes.STR, location=OpenApiParameter.QUERY, description="User ID (optional, for testing)")
+        OpenApiParameter("user_id", OpenApiTypes.STR, location=OpenApiParameter.QUERY, description="User ID (optional, for testing)"),
+        OpenApiParameter("max_age", OpenApiTypes.INT, location=OpenApiParameter.QUERY, description="Oldest acceptable balance in seconds (default BALANCE_DEFAULT_MAX_AGE, 60; 0 always refreshes)"),
+        OpenApiParameter("realtime", OpenApiTypes.BOOL, location=OpenApiParameter.QUERY, description="Refresh with a real-time bank pull (default true); false reads the balances Plaid already has"),
     ],
     responses={200: {"type": "object", "description": "Plaid accounts response"}}
 )
@@ -445,34 +619,52 @@ def get_account_balance(request):
          return Response({'error': 'User ID is required. Please authenticate or provide "user_id" in query params.'}, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        url: str = os.environ.get("SUPABASE_URL")
-        key: str = os.environ.get("SUPABASE_KEY")
-        supabase: Client = create_client(url, key)
+        supabase: Client = get_supabase_client()
 
-        # Get access token from Supabase
-        response = supabase.table("user_plaid_items").select("access_token").eq("user_id", user_id).execute()
+        # Every linked item, from the cached item directory
+        items = item_directory.get_user_items(user_id, supabase)
 
-        if not response.data or len(response.data) == 0:
+        if not items:
             return Response({'error': 'No Plaid access token found for user'}, status=status.HTTP_404_NOT_FOUND)
 
-        access_token = response.data[0]['access_token']
+        max_age = int(request.query_params.get('max_age') or balance_cache.default_max_age())
+        realtime = request.query_params.get('realtime', 'true').lower() not in ('false', '0', 'no')
 
         client = get_plaid_client()
-        request_plaid = AccountsBalanceGetRequest(access_token=access_token)
-        response_plaid = client.accounts_balance_get(request_plaid)
-
-        return Response(response_plaid.to_dict())
+        results, errors = multi_item.fan_out(
+            items,
+            lambda item: balance_cache.get_balances(item['item_id'], item['access_token'], max_age, realtime, client=client),
+        )
+        if errors and not results:
+            return Response({'error': 'All Plaid items failed', 'errors': errors}, status=status.HTTP_502_BAD_GATEWAY)
+
+        etag = None if errors else conditional.balance_etag(user_id, results)
+        not_modified = conditional.not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+
+        accounts = []
+        item_rows = []
+        for item, snapshot in results:
+            accounts.extend(multi_item.tag_rows(item, snapshot['accounts']))
+            item_rows.append({**multi_item.item_tag(item), **balance_cache.age_fields(snapshot)})
+
+        return conditional.tag(Response({
+            'accounts': accounts,
+            'items': item_rows,
+            'age_seconds': max(row['age_seconds'] for row in item_rows),
+            'errors': errors,
+        }), etag)
 
     except Exception as e:
-        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return _error_response(e)
 
 @extend_schema(
-    description="Get transactions from Plaid.",
+    description="Get transactions for a user from the local store kept up to date by transactions/sync.",
     parameters=[
         OpenApiParameter("user_id", OpenApiTypes.STR, location=OpenApiParameter.QUERY, description="User ID (optional, for testing)"),
-        OpenApiParameter("cursor", OpenApiTypes.STR, location=OpenApiParameter.QUERY, description="Cursor for pagination (optional)")
     ],
-    responses={200: {"type": "object", "description": "Plaid transactions response"}}
+    responses={200: {"type": "object", "description": "Stored transactions, accounts and recurring streams"}}
 )
 @api_view(['GET'])
 def get_transactions(request):
@@ -487,55 +679,174 @@ def get_transactions(request):
          return Response({'error': 'User ID is required. Please authenticate or provide "user_id" in query params.'}, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        url: str = os.environ.get("SUPABASE_URL")
-        key: str = os.environ.get("SUPABASE_KEY")
-        supabase: Client = create_client(url, key)
+        supabase: Client = get_supabase_client()
 
-        # Get access token from Supabase
-        # Get access token and cursor from Supabase
-        response = supabase.table("user_plaid_items").select("access_token, cursor").eq("user_id", user_id).execute()
+        # Every linked item, from the cached item directory
+        items = item_directory.get_user_items(user_id, supabase)
 
-        if not response.data or len(response.data) == 0:
+        if not items:
             return Response({'error': 'No Plaid access token found for user'}, status=status.HTTP_404_NOT_FOUND)
 
-        access_token = response.data[0]['access_token']
-        stored_cursor = response.data[0].get('cursor')
+        # Items are normally kept current by the webhook; pull once for any
+        # item that has never been synced so the first read isn't empty.
+        cursors, sync_errors = sync_engine.bootstrap(user_id, items, client=get_plaid_client())
+
+        # Recurring streams are shared with the subscription and upcoming-payment endpoints
+        recurring_results, errors = _fetch_recurring_streams(items)
+
+        # The stored rows only change when a sync moves an item's cursor, so
+        # an unchanged poll is answered before reading them.
+        etag = None if sync_errors or errors else conditional.transactions_etag(user_id, cursors, recurring_results)
+        not_modified = conditional.not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+
+        inflow_streams, outflow_streams = _merge_streams(recurring_results)
+        result = {
+            'accounts': [
+                {
+                    'account_id': a.account_id,
+                    'item_id': a.item_id,
+                    'name': a.name,
+                    'mask': a.mask,
+                    'type': a.type,
+                    'subtype': a.subtype,
+                }
+                for a in transactions_store.get_user_accounts(user_id)
+            ],
+            'added': list(transactions_store.get_user_transactions(user_id).values_list('data', flat=True)),
+            'modified': [],
+            'removed': [],
+            'next_cursor': cursors[items[0]['item_id']],
+            'next_cursors': cursors,
+            'has_more': False,
+            'inflow_streams': inflow_streams,
+            'outflow_streams': outflow_streams,
+            'errors': sync_errors + errors,
+        }
 
-        # Use provided cursor or fallback to stored cursor
-        cursor = request.query_params.get('cursor')
-        if not cursor:
-            cursor = stored_cursor
+        return conditional.tag(Response(result), etag)
 
-        client = get_plaid_client()
-        request_plaid = TransactionsSyncRequest(
-            access_token=access_token,
-            cursor=cursor if cursor else None,
-            count=500 # Adjust count as needed
-        )
-        response_plaid = client.transactions_sync(request_plaid)
+    except Exception as e:
+        return _error_response(e)
 
-        # Update cursor in DB if it changed
-        next_cursor = response_plaid['next_cursor']
-        if next_cursor != stored_cursor:
-             supabase.table("user_plaid_items").update({"cursor": next_cursor}).eq("user_id", user_id).execute()
+HISTORY_STREAM_CHUNK_SIZE = 500
 
-        # Fetch recurring transactions
-        request_recurring = TransactionsRecurringGetRequest(
-            access_token=access_token
-        )
-        response_recurring = client.transactions_recurring_get(request_recurring)
 
-        result = response_plaid.to_dict()
-        result['inflow_streams'] = response_recurring.to_dict().get('inflow_streams', [])
-        result['outflow_streams'] = response_recurring.to_dict().get('outflow_streams', [])
+def _stream_ndjson(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+@extend_schema(
+    description=(
+        "Page through a user's stored transaction history, newest first. Pass the returned "
+        "next_cursor back as `cursor` for the following page. With ?format=ndjson the whole "
+        "filtered range is streamed as one JSON transaction per line instead."
+    ),
+    parameters=[
+        OpenApiParameter("user_id", OpenApiTypes.STR, location=OpenApiParameter.QUERY, description="User ID (optional, for testing)"),
+        OpenApiParameter("cursor", OpenApiTypes.STR, location=OpenApiParameter.QUERY, description="next_cursor from the previous page"),
+        OpenApiParameter("limit", OpenApiTypes.INT, location=OpenApiParameter.QUERY, description=f"Page size (default {transactions_store.HISTORY_DEFAULT_LIMIT}, max {transactions_store.HISTORY_MAX_LIMIT})"),
+        OpenApiParameter("start_date", OpenApiTypes.DATE, location=OpenApiParameter.QUERY, description="Earliest transaction date (inclusive)"),
+        OpenApiParameter("end_date", OpenApiTypes.DATE, location=OpenApiParameter.QUERY, description="Latest transaction date (inclusive)"),
+        OpenApiParameter("account_id", OpenApiTypes.STR, location=OpenApiParameter.QUERY, description="Comma-separated account IDs"),
+    ],
+    responses={200: {"type": "object", "description": "transactions, next_cursor and has_more"}}
+)
+@api_view(['GET'])
+@renderer_classes([*api_settings.DEFAULT_RENDERER_CLASSES, NDJSONRenderer])
+def get_transaction_history(request):
+    user_id = None
+    if request.user.is_authenticated:
+        user_id = request.user.username
+    else:
+        user_id = request.query_params.get('user_id')
+
+    if not user_id:
+         return Response({'error': 'User ID is required. Please authenticate or provide "user_id" in query params.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        account_ids = request.query_params.get('account_id')
+        filters = {
+            'start_date': date.fromisoformat(request.query_params['start_date']) if request.query_params.get('start_date') else None,
+            'end_date': date.fromisoformat(request.query_params['end_date']) if request.query_params.get('end_date') else None,
+            'account_ids': [a for a in account_ids.split(',') if a] if account_ids else None,
+            'after': request.query_params.get('cursor'),
+        }
 
-        return Response(result)
+        if request.accepted_renderer.format == NDJSONRenderer.format:
+            # Rows are encoded as the database cursor yields them, so memory
+            # stays flat however long the history is.
+            rows = transactions_store.history_queryset(user_id, **filters).values_list('data', flat=True)
+            return StreamingHttpResponse(
+                _stream_ndjson(rows.iterator(chunk_size=HISTORY_STREAM_CHUNK_SIZE)),
+                content_type=NDJSONRenderer.media_type,
+            )
+
+        limit = request.query_params.get('limit') or transactions_store.HISTORY_DEFAULT_LIMIT
+        transactions, next_cursor = transactions_store.history_page(user_id, limit=limit, **filters)
+        return Response({
+            'transactions': transactions,
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None,
+        })
 
     except Exception as e:
-        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return _error_response(e)
+
+
+@extend_schema(
+    description=(
+        "Spending analytics over the user's synced transactions: totals, counts and "
+        "period-over-period deltas, grouped by personal finance category, merchant, account or flow "
+        "(inflow, such as income, against outflow). "
+        "Amounts keep Plaid's sign (positive is money out). Defaults to the last "
+        f"{analytics.DEFAULT_MONTHS} calendar months by month and category."
+    ),
+    parameters=[
+        OpenApiParameter("user_id", OpenApiTypes.STR, location=OpenApiParameter.QUERY, description="User ID (optional, for testing)"),
+        OpenApiParameter("group_by", OpenApiTypes.STR, location=OpenApiParameter.QUERY, enum=list(analytics.GROUP_BY), description="Dimension to group by (default category)"),
+        OpenApiParameter("period", OpenApiTypes.STR, location=OpenApiParameter.QUERY, enum=list(analytics.PERIODS), description="Period length (default month); weeks start on Monday"),
+        OpenApiParameter("start_date", OpenApiTypes.DATE, location=OpenApiParameter.QUERY, description="Earliest transaction date (inclusive)"),
+        OpenApiParameter("end_date", OpenApiTypes.DATE, location=OpenApiParameter.QUERY, description="Latest transaction date (inclusive, default today)"),
+        OpenApiParameter("limit", OpenApiTypes.INT, location=OpenApiParameter.QUERY, description=f"Groups to list, largest total first (default {analytics.DEFAULT_LIMIT}, max {analytics.MAX_LIMIT})"),
+    ],
+    responses={200: {"type": "object", "description": "periods, an overall series and one series per group"}}
+)
+@api_view(['GET'])
+def get_spending_analytics(request):
+    user_id = request.user.username if request.user.is_authenticated else request.query_params.get('user_id')
+    if not user_id:
+        return Response(
+            {'error': 'User ID is required. Please authenticate or provide "user_id" in query params.'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    try:
+        params = request.query_params
+        default_start, today = analytics.default_range(timezone.localdate())
+        end_date = date.fromisoformat(params['end_date']) if params.get('end_date') else today
+        start_date = date.fromisoformat(params['start_date']) if params.get('start_date') else default_start
+        group_by = params.get('group_by') or 'category'
+        period = params.get('period') or 'month'
+        limit = params.get('limit') or analytics.DEFAULT_LIMIT
+
+        # Reads only the local store, which changes only when a sync moves a cursor.
+        cursors = transactions_store.get_user_cursors(user_id)
+        etag = conditional.make_etag('spending', user_id, sorted(cursors.items()), group_by, period, start_date, end_date, limit)
+        not_modified = conditional.not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+
+        report = analytics.spending(user_id, start_date, end_date, group_by=group_by, period=period, limit=limit)
+        return conditional.tag(Response(report), etag)
+    except Exception as e:
+        return _error_response(e)
+
 
 @extend_schema(
-    description="Handle Plaid Webhooks.",
+    description="Handle Plaid Webhooks. Transaction updates are queued and synced in the background.",
     request={"type": "object"},
     responses={200: {"type": "object", "properties": {"status": {"type": "string"}}}}
 )
@@ -550,46 +861,28 @@ def handle_plaid_webhook(request):
 
         print(f"Received webhook: type={webhook_type}, code={webhook_code}, item_id={item_id}")
 
-        if webhook_type == 'TRANSACTIONS':
-            # codes: SYNC_UPDATES_AVAILABLE, INITIAL_UPDATE, HISTORICAL_UPDATE, DEFAULT_UPDATE
-            if webhook_code in ['SYNC_UPDATES_AVAILABLE', 'INITIAL_UPDATE', 'HISTORICAL_UPDATE', 'DEFAULT_UPDATE']:
-                # Trigger transaction sync
-                url = os.environ.get("SUPABASE_URL")
-                key = os.environ.get("SUPABASE_KEY")
-                supabase = create_client(url, key)
-
-                # Get access token and cursor from Supabase
-                response = supabase.table("user_plaid_items").select("access_token, cursor").eq("item_id", item_id).execute()
-
-                if response.data and len(response.data) > 0:
-                    access_token = response.data[0]['access_token']
-                    cursor = response.data[0].get('cursor')
-
-                    client = get_plaid_client()
-
-                    request_plaid = TransactionsSyncRequest(
-                        access_token=access_token,
-                        cursor=cursor,
-                        count=500
-                    )
-                    response_plaid = client.transactions_sync(request_plaid)
+        if webhook_type == 'ITEM' and item_id:
+            # Revoked, errored or removed items change what the user has linked.
+            item_directory.invalidate_item(item_id)
 
-                    # Update cursor in DB
-                    next_cursor = response_plaid['next_cursor']
-                    supabase.table("user_plaid_items").update({"cursor": next_cursor}).eq("item_id", item_id).execute()
+        if webhook_type == 'TRANSACTIONS' and item_id:
+            # Covers RECURRING_TRANSACTIONS_UPDATE as well as new-transaction codes.
+            recurring_cache.invalidate(item_id)
+            balance_cache.invalidate(item_id)
 
-                    # Verification: just print for now
-                    print(f"Synced {len(response_plaid['added'])} transactions, {len(response_plaid['modified'])} modified, {len(response_plaid['removed'])} removed.")
-                else:
-                    print(f"No access token found for item_id {item_id}")
+        if webhook_type == 'TRANSACTIONS' and webhook_code in webhook_queue.SYNC_WEBHOOK_CODES:
+            # Hand the sync to the job queue so the webhook returns right away.
+            # Bursts for the same item collapse into one pending job.
+            job, created = webhook_queue.enqueue_item_sync(item_id, webhook_code)
+            return Response({'status': 'queued', 'job_id': job.pk, 'coalesced': not created}, status=status.HTTP_200_OK)
 
         return Response({'status': 'received'}, status=status.HTTP_200_OK)
     except Exception as e:
         print(f"Error handling webhook: {e}")
-        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return _error_response(e)
 
 @extend_schema(
-    description="Manually trigger a refresh of transactions.",
+    description="Manually trigger a refresh of transactions for every linked item.",
     parameters=[
         OpenApiParameter("user_id", OpenApiTypes.STR, location=OpenApiParameter.QUERY, description="User ID (optional, for testing)")
     ],
@@ -608,26 +901,31 @@ def refresh_transactions(request):
          return Response({'error': 'User ID is required. Please authenticate or provide "user_id" in body.'}, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        url: str = os.environ.get("SUPABASE_URL")
-        key: str = os.environ.get("SUPABASE_KEY")
-        supabase: Client = create_client(url, key)
+        supabase: Client = get_supabase_client()
 
-        # Get access token from Supabase
-        response = supabase.table("user_plaid_items").select("access_token").eq("user_id", user_id).execute()
+        # Every linked item, from the cached item directory
+        items = item_directory.get_user_items(user_id, supabase)
 
-        if not response.data or len(response.data) == 0:
+        if not items:
             return Response({'error': 'No Plaid access token found for user'}, status=status.HTTP_404_NOT_FOUND)
 
-        access_token = response.data[0]['access_token']
-
         client = get_plaid_client()
-        request_plaid = TransactionsRefreshRequest(access_token=access_token)
-        response_plaid = client.transactions_refresh(request_plaid)
+        from plaid.model.transactions_refresh_request import TransactionsRefreshRequest
 
-        return Response(response_plaid.to_dict())
+        results, errors = multi_item.fan_out(
+            items,
+            lambda item: client.transactions_refresh(TransactionsRefreshRequest(access_token=item['access_token'])).to_dict(),
+        )
+        if errors and not results:
+            return Response({'error': 'All Plaid items failed', 'errors': errors}, status=status.HTTP_502_BAD_GATEWAY)
+
+        return Response({
+            'items': [{**multi_item.item_tag(item), **refresh} for item, refresh in results],
+            'errors': errors,
+        })
 
     except Exception as e:
-        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return _error_response(e)
 
 @extend_schema(
     description="Get connected institutions for the user.",
@@ -653,44 +951,32 @@ def get_connected_institutions(request):
          return Response({'error': 'User ID is required. Please authenticate or provide "user_id" in query params.'}, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        url: str = os.environ.get("SUPABASE_URL")
-        key: str = os.environ.get("SUPABASE_KEY")
-        supabase: Client = create_client(url, key)
+        supabase: Client = get_supabase_client()
         
-        # Get all items for user
-        response = supabase.table("user_plaid_items").select("institution_id").eq("user_id", user_id).execute()
+        # Get all items for user (cached item directory)
+        items = item_directory.get_user_items(user_id, supabase)
         
+        institution_ids = [item.get('institution_id') for item in items if item.get('institution_id')]
+        # Known institutions come from the local cache; the rest are fetched concurrently
+        names, errors = institutions.get_institutions(institution_ids)
+
         connected_institutions = []
-        client = get_plaid_client()
+        for institution_id in institution_ids:
+            if institution_id in names:
+                connected_institutions.append({
+                    "institution_name": names[institution_id],
+                    "institution_id": institution_id,
+                    "is_connected": True
+                })
+            else:
+                connected_institutions.append({
+                    "institution_name": "Unknown Institution",
+                    "institution_id": institution_id,
+                    "is_connected": True,
+                    "error": errors.get(institution_id)
+                })
 
-        if response.data:
-            for item in response.data:
-                institution_id = item.get('institution_id')
-                if institution_id:
-                    try:
-                        request_plaid = InstitutionsGetByIdRequest(
-                            institution_id=institution_id,
-                            country_codes=[CountryCode('US')]
-                        )
-                        response_plaid = client.institutions_get_by_id(request_plaid)
-                        institution = response_plaid['institution']
-                        
-                        connected_institutions.append({
-                            "institution_name": institution.name,
-                            "institution_id": institution.institution_id,
-                            "is_connected": True
-                        })
-                    except Exception as e:
-                        print(f"Error fetching institution details for {institution_id}: {e}")
-                        # Optionally handle error, maybe still return ID
-                        connected_institutions.append({
-                            "institution_name": "Unknown Institution",
-                            "institution_id": institution_id,
-                            "is_connected": True,
-                            "error": str(e)
-                        })
-        
         return Response(connected_institutions)
 
     except Exception as e:
-        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return _error_response(e)
@@ -0,0 +1,229 @@
+import os
+import random
+import threading
+from datetime import timedelta
+
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import WebhookJob
+from .plaid_init import get_plaid_client
+from .supabase_init import get_supabase_client
+from . import item_directory, sync_engine
+
+SYNC_WEBHOOK_CODES = ['SYNC_UPDATES_AVAILABLE', 'INITIAL_UPDATE', 'HISTORICAL_UPDATE', 'DEFAULT_UPDATE']
+# Rounds of read-then-fold before enqueue_item_sync gives up under contention.
+ENQUEUE_ATTEMPTS = 20
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def max_attempts():
+    return _env_int('WEBHOOK_JOB_MAX_ATTEMPTS', 5)
+
+
+def lease_seconds():
+    # A running job older than this is assumed to belong to a dead worker.
+    return _env_int('WEBHOOK_JOB_LEASE_SECONDS', 300)
+
+
+def retry_delay(attempts):
+    """Exponential backoff with equal jitter, capped at 15 minutes."""
+    base = _env_int('WEBHOOK_JOB_RETRY_BASE_SECONDS', 30)
+    ceiling = min(base * 2 ** (attempts - 1), 900)
+    return timedelta(seconds=ceiling / 2 + random.uniform(0, ceiling / 2))
+
+
+def enqueue_item_sync(item_id, webhook_code, kind=WebhookJob.KIND_TRANSACTIONS_SYNC):
+    """Queue a sync for an item, folding it into the pending job if there is one.
+
+    Returns (job, created).
+    """
+    for _ in range(ENQUEUE_ATTEMPTS):
+        job = WebhookJob.objects.filter(item_id=item_id, kind=kind, status=WebhookJob.STATUS_PENDING).first()
+        if job is not None:
+            # Only fold into the job while it is still pending and unchanged
+            # since it was read: coalesced_count goes up with every fold, so a
+            # concurrent fold makes this one miss and go round again rather
+            # than overwrite its code. If a worker claimed the job, the next
+            # round queues a fresh one.
+            folded = WebhookJob.objects.filter(
+                pk=job.pk, status=WebhookJob.STATUS_PENDING, coalesced_count=job.coalesced_count,
+            ).update(
+                webhook_codes=job.webhook_codes + [webhook_code],
+                coalesced_count=job.coalesced_count + 1,
+                updated_at=timezone.now(),
+            )
+            if folded:
+                return job, False
+            continue
+
+        try:
+            with transaction.atomic():
+                job = WebhookJob.objects.create(
+                    item_id=item_id,
+                    kind=kind,
+                    webhook_codes=[webhook_code],
+                    run_after=timezone.now(),
+                )
+        except IntegrityError:
+            # Another request created the pending job first; fold into it.
+            continue
+        worker_pool.notify()
+        return job, True
+    raise RuntimeError(f'Could not enqueue {kind} job for item {item_id}')
+
+
+def claim_next_job():
+    """Atomically move the next runnable job to running and return it.
+
+    Jobs whose item already has a live running job are skipped, so one item
+    never syncs on two workers at once. Expired leases are reclaimed.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=lease_seconds())
+    busy_items = WebhookJob.objects.filter(
+        status=WebhookJob.STATUS_RUNNING, locked_at__gte=stale,
+    ).values('item_id')
+    candidates = WebhookJob.objects.filter(
+        Q(status=WebhookJob.STATUS_PENDING, run_after__lte=now)
+        | Q(status=WebhookJob.STATUS_RUNNING, locked_at__lt=stale)
+    ).exclude(item_id__in=busy_items).order_by('run_after', 'id')
+
+    for job in candidates[:10]:
+        claimed = WebhookJob.objects.filter(pk=job.pk, status=job.status, updated_at=job.updated_at).update(
+            status=WebhookJob.STATUS_RUNNING,
+            locked_at=now,
+            attempts=job.attempts + 1,
+            updated_at=now,
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+    return None
+
+
+def run_job(job):
+    if job.kind != WebhookJob.KIND_TRANSACTIONS_SYNC:
+        raise ValueError(f'Unknown job kind {job.kind}')
+
+    item = item_directory.get_item(job.item_id, get_supabase_client())
+    if item is None:
+        print(f"No access token found for item_id {job.item_id}")
+        return {'skipped': 'unknown item'}
+
+    user_id = item['user_id']
+    access_token = item['access_token']
+    counts = sync_engine.sync_item(user_id, job.item_id, access_token, client=get_plaid_client())
+    print(f"Synced {counts['added']} transactions, {counts['modified']} modified, {counts['removed']} removed in {counts['pages']} page(s).")
+    return counts
+
+
+def _finish(job, **fields):
+    fields['updated_at'] = timezone.now()
+    fields['locked_at'] = None
+    WebhookJob.objects.filter(pk=job.pk).update(**fields)
+
+
+def process_job(job):
+    """Run a claimed job and record success, a scheduled retry, or failure."""
+    try:
+        result = run_job(job)
+    except Exception as e:
+        print(f"Webhook job {job.pk} for item {job.item_id} failed (attempt {job.attempts}): {e}")
+        if job.attempts >= max_attempts():
+            _finish(job, status=WebhookJob.STATUS_FAILED, last_error=str(e))
+            return False
+        try:
+            with transaction.atomic():
+                _finish(
+                    job,
+                    status=WebhookJob.STATUS_PENDING,
+                    run_after=timezone.now() + retry_delay(job.attempts),
+                    last_error=str(e),
+                )
+        except IntegrityError:
+            # A newer webhook already queued a pending sync for this item.
+            _finish(job, status=WebhookJob.STATUS_DONE, last_error=str(e), result={'superseded': True})
+        return False
+
+    _finish(job, status=WebhookJob.STATUS_DONE, last_error='', result=result)
+    return True
+
+
+def run_pending(limit=None):
+    """Process runnable jobs on the calling thread. Returns the number processed."""
+    processed = 0
+    while limit is None or processed < limit:
+        job = claim_next_job()
+        if job is None:
+            break
+        process_job(job)
+        processed += 1
+    return processed
+
+
+class WebhookWorkerPool:
+    """Daemon threads inside the web process that drain the job table.
+
+    Started lazily by the first enqueue; WEBHOOK_WORKERS=0 disables them so
+    jobs are only processed by the process_webhook_jobs command.
+    """
+
+    def __init__(self):
+        self._threads = []
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def notify(self):
+        self.start()
+        self._wakeup.set()
+
+    def start(self, workers=None):
+        workers = _env_int('WEBHOOK_WORKERS', 2) if workers is None else workers
+        if workers <= 0:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._threads:
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._threads = [
+                threading.Thread(target=self._loop, name=f'webhook-worker-{i}', daemon=True)
+                for i in range(workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        self._wakeup.set()
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join(timeout)
+
+    def _loop(self):
+        poll_interval = _env_int('WEBHOOK_POLL_SECONDS', 5)
+        while not self._stopping.is_set():
+            close_old_connections()
+            try:
+                job = claim_next_job()
+                if job is not None:
+                    process_job(job)
+                    continue
+            except Exception as e:
+                print(f"Webhook worker error: {e}")
+            finally:
+                close_old_connections()
+            self._wakeup.wait(poll_interval)
+            self._wakeup.clear()
+
+
+worker_pool = WebhookWorkerPool()
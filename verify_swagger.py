@@ -2,6 +2,7 @@
 import os
 import django
 from django.conf import settings
+from django.core.management import CommandError, call_command
 from django.urls import reverse
 
 # Configure Django settings
@@ -37,5 +38,12 @@ def check_swagger():
     except Exception as e:
         print(f"FAIL: Schema generation failed: {e}")
 
+    # The served schema comes from the file built at deploy time
+    try:
+        call_command('build_openapi_schema', check=True)
+        print("PASS: Prebuilt schema file is up to date")
+    except CommandError as e:
+        print(f"FAIL: {e}")
+
 if __name__ == "__main__":
     check_swagger()